@@ -0,0 +1,120 @@
+import csv
+import logging
+import os
+import threading
+import time
+
+
+class DirectoryIndex:
+    """
+    Persistent per-folder summary of the previous scans, used to skip subtrees that cannot contain long paths.
+
+    For every listed folder the index keeps the longest folder path holding a file and the longest filename
+    anywhere in its subtree. A subtree whose values from the previous scan stay `margin` characters below both
+    thresholds is pruned without being listed. Entries older than `revalidate_seconds` are never used for pruning,
+    so every subtree is listed again, and its entry refreshed, at least that often.
+
+    Folders whose listing stalled are saved as quarantined, and the folders above them as incomplete, so none of them
+    is pruned. The next scan lists the quarantined folders last, see `was_quarantined`.
+    """
+
+    COMPLETE, INCOMPLETE, QUARANTINED = 0, 1, 2
+
+    def __init__(self, revalidate_seconds, margin=0):
+        self.revalidate_seconds = revalidate_seconds
+        self.margin = margin
+        self.pruned = 0
+        self._previous = {}
+        self._listed = {}
+        self._pruned_dirs = set()
+        self._quarantined = set()
+        self._lock = threading.Lock()
+
+    def load(self, file_path):
+        """ Loads the index saved by the previous scan. A missing or unreadable file leaves the index empty. """
+        try:
+            with open(file_path, 'r', encoding='utf-8', newline='') as f:
+                for row in csv.reader(f):
+                    # Indexes saved before quarantine support have no status column
+                    dir_path, max_dir_length, max_filename_length, validated = row[:4]
+                    status = int(row[4]) if len(row) > 4 else self.COMPLETE
+                    self._previous[dir_path] = (int(max_dir_length), int(max_filename_length), float(validated), status)
+        except (OSError, ValueError) as e:
+            logging.info(f"No directory index loaded from {file_path}: {e}")
+        logging.info(f"Directory index loaded with {len(self._previous)} entries")
+
+    def can_prune(self, dir_path, dir_length_threshold, filename_length_threshold):
+        """ Checks if a folder's subtree stayed below both thresholds in a recent enough scan, and records it as pruned. """
+        entry = self._previous.get(dir_path)
+        if entry is None:
+            return False
+        max_dir_length, max_filename_length, validated, status = entry
+        if status != self.COMPLETE or time.time() - validated > self.revalidate_seconds:
+            return False
+        if max_dir_length + self.margin >= dir_length_threshold or max_filename_length + self.margin >= filename_length_threshold:
+            return False
+        with self._lock:
+            self._pruned_dirs.add(dir_path)
+            self.pruned += 1
+        return True
+
+    def record(self, dir_path, has_files, max_filename_length, dir_length=None):
+        """ Records the files found directly in a listed folder. `dir_length` defaults to the number of characters of its path. """
+        if dir_length is None:
+            dir_length = len(dir_path)
+        with self._lock:
+            self._listed[dir_path] = (dir_length if has_files else 0, max_filename_length)
+
+    def quarantine(self, dir_path):
+        """ Records a folder whose listing stalled and was given up on. """
+        with self._lock:
+            self._quarantined.add(dir_path)
+
+    def was_quarantined(self, dir_path):
+        """ Checks if a folder was given up on in the previous scan. """
+        entry = self._previous.get(dir_path)
+        return entry is not None and entry[3] == self.QUARANTINED
+
+    def save(self, file_path):
+        """
+        Folds the values of the listed folders into their parents and writes the index, replacing it atomically.
+
+        Pruned subtrees keep the entries of the previous scan, including their validation time.
+        """
+        now = time.time()
+        entries = {dir_path: (max_dir_length, max_filename_length, now, self.COMPLETE) for dir_path, (max_dir_length, max_filename_length) in self._listed.items()}
+        for dir_path in self._pruned_dirs:
+            entries[dir_path] = self._previous[dir_path]
+        for dir_path in self._quarantined:
+            if dir_path not in self._listed:
+                entries[dir_path] = (0, 0, now, self.QUARANTINED)
+
+        # Deepest folders first, so each subtree is complete before it is folded into its parent
+        for dir_path in sorted(entries, key=lambda path: path.count(os.sep), reverse=True):
+            parent_dir_path = dir_path.rsplit(os.sep, 1)[0]
+            if parent_dir_path in entries and parent_dir_path != dir_path:
+                max_dir_length, max_filename_length, _, status = entries[dir_path]
+                parent_max_dir_length, parent_max_filename_length, parent_validated, parent_status = entries[parent_dir_path]
+                parent_status = max(parent_status, self.INCOMPLETE if status != self.COMPLETE else self.COMPLETE)
+                entries[parent_dir_path] = (max(parent_max_dir_length, max_dir_length), max(parent_max_filename_length, max_filename_length), parent_validated, parent_status)
+
+        for dir_path, entry in self._previous.items():
+            if dir_path not in entries and self._is_in_pruned_subtree(dir_path):
+                entries[dir_path] = entry
+
+        temp_file_path = f"{file_path}.tmp"
+        with open(temp_file_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            for dir_path, (max_dir_length, max_filename_length, validated, status) in entries.items():
+                writer.writerow([dir_path, max_dir_length, max_filename_length, validated, status])
+        os.replace(temp_file_path, file_path)
+        logging.info(f"Directory index saved with {len(entries)} entries | Listed: {len(self._listed)} | Pruned: {self.pruned} | Quarantined: {len(self._quarantined - set(self._listed))}")
+
+    def _is_in_pruned_subtree(self, dir_path):
+        while True:
+            parent_dir_path = dir_path.rsplit(os.sep, 1)[0]
+            if parent_dir_path == dir_path or not parent_dir_path:
+                return False
+            if parent_dir_path in self._pruned_dirs:
+                return True
+            dir_path = parent_dir_path
@@ -0,0 +1,82 @@
+import heapq
+import itertools
+import os
+import tempfile
+
+# Most sorted runs merged at once. More runs are merged in several passes, so the number of open files stays bounded.
+MAX_MERGE_FAN_IN = 64
+
+
+def write_run(lines, run_dir):
+    """ Writes sorted lines to a new run file in `run_dir` and returns its path. """
+    fd, run_path = tempfile.mkstemp(dir=run_dir, suffix='.run')
+    with open(fd, 'w', encoding='utf-8', errors='surrogateescape', newline='\n') as f:
+        f.writelines(f"{line}\n" for line in lines)
+    return run_path
+
+
+def read_run(run_path):
+    with open(run_path, 'r', encoding='utf-8', errors='surrogateescape', newline='\n') as f:
+        for line in f:
+            yield line[:-1]
+
+
+def merge_runs(run_paths, run_dir):
+    """ Returns an iterator over the lines of the sorted run files, merged in order. Merged runs are removed. """
+    while len(run_paths) > MAX_MERGE_FAN_IN:
+        merged_paths = []
+        for start in range(0, len(run_paths), MAX_MERGE_FAN_IN):
+            group = run_paths[start:start + MAX_MERGE_FAN_IN]
+            merged_paths.append(write_run(heapq.merge(*[read_run(run_path) for run_path in group]), run_dir))
+            for run_path in group:
+                os.remove(run_path)
+        run_paths = merged_paths
+    return heapq.merge(*[read_run(run_path) for run_path in run_paths])
+
+
+def external_sort(lines, run_dir, chunk_size=100000):
+    """
+    Yields the lines sorted, each line once, holding at most `chunk_size` lines in memory.
+
+    Lines are sorted in chunks of `chunk_size`, each written to a run file in `run_dir`, and the runs are merged
+    with a k-way merge. Input that fits in one chunk is sorted in memory. Lines must not contain line breaks.
+    The caller removes `run_dir` once the sorted lines have been read.
+    """
+    lines = iter(lines)
+    chunk = sorted(itertools.islice(lines, chunk_size))
+    if len(chunk) < chunk_size:
+        sorted_lines = iter(chunk)
+    else:
+        run_paths = []
+        while chunk:
+            run_paths.append(write_run(chunk, run_dir))
+            chunk = sorted(itertools.islice(lines, chunk_size))
+        sorted_lines = merge_runs(run_paths, run_dir)
+
+    previous = None
+    for line in sorted_lines:
+        if line != previous:
+            yield line
+            previous = line
+
+
+def merge_join(old_lines, new_lines):
+    """
+    Joins two sorted iterables without duplicates in one pass.
+
+    Yields ('removed', line) for lines only in `old_lines`, ('added', line) for lines only in `new_lines`
+    and ('unchanged', line) for lines in both.
+    """
+    missing = object()
+    old_lines, new_lines = iter(old_lines), iter(new_lines)
+    old, new = next(old_lines, missing), next(new_lines, missing)
+    while old is not missing or new is not missing:
+        if new is missing or (old is not missing and old < new):
+            yield 'removed', old
+            old = next(old_lines, missing)
+        elif old is missing or new < old:
+            yield 'added', new
+            new = next(new_lines, missing)
+        else:
+            yield 'unchanged', old
+            old, new = next(old_lines, missing), next(new_lines, missing)
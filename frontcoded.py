@@ -0,0 +1,205 @@
+import bisect
+import gzip
+import json
+import lzma
+import os
+import struct
+
+# File layout: MAGIC, codec name byte, then chunks, each a CHUNK_HEADER (compressed size, record count) followed by
+# the compressed front-coded records. A closed file ends with an index chunk (record count INDEX_MARKER) and a TRAILER
+# holding the index chunk's offset, so readers can seek to any chunk without decompressing the ones before it.
+MAGIC = b'LPFC1'
+CODECS = {b'g': 'gzip', b'x': 'lzma'}
+CHUNK_HEADER = struct.Struct('<II')
+TRAILER = struct.Struct('<Q8s')
+TRAILER_MAGIC = b'LPFCIDX1'
+INDEX_MARKER = 0xFFFFFFFF
+FRONT_CODED_SUFFIX = '.fcz'
+
+
+def compress(data, codec):
+    return gzip.compress(data, compresslevel=6, mtime=0) if codec == 'gzip' else lzma.compress(data, preset=6)
+
+
+def decompress(data, codec):
+    return gzip.decompress(data) if codec == 'gzip' else lzma.decompress(data)
+
+
+def write_varint(buffer, value):
+    while value >= 0x80:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def encode_chunk(lines):
+    """ Front-codes lines: each one is stored as the length of the prefix it shares with the previous line and the rest. """
+    buffer = bytearray()
+    previous = b''
+    for line in lines:
+        data = line.encode('utf-8', 'surrogateescape')
+        shared = os.path.commonprefix([previous, data]) if previous else b''
+        write_varint(buffer, len(shared))
+        write_varint(buffer, len(data) - len(shared))
+        buffer += data[len(shared):]
+        previous = data
+    return bytes(buffer)
+
+
+def decode_chunk(data, count):
+    lines = []
+    previous = b''
+    offset = 0
+    for _ in range(count):
+        shared, offset = read_varint(data, offset)
+        suffix_length, offset = read_varint(data, offset)
+        previous = previous[:shared] + data[offset:offset + suffix_length]
+        offset += suffix_length
+        lines.append(previous.decode('utf-8', 'surrogateescape'))
+    return lines
+
+
+class FrontCodedWriter:
+    """
+    Writes scan output lines front-coded in compressed chunks of `chunk_size` lines.
+
+    Scan outputs list the paths of a folder one after another, so most of each path is shared with the previous line.
+    Chunks start over with a full line, so each one can be decoded on its own. A chunk is written once it is full,
+    and `close` writes the last chunk and the index.
+    """
+
+    def __init__(self, file_path, codec='gzip', chunk_size=4096):
+        if codec not in CODECS.values():
+            raise ValueError(f"Unknown codec '{codec}'. Expected one of {sorted(CODECS.values())}.")
+        self.codec = codec
+        self.chunk_size = chunk_size
+        self._pending = []
+        self._index = []
+        self._file = open(file_path, 'wb')
+        self._file.write(MAGIC + next(key for key, value in CODECS.items() if value == codec))
+
+    def write(self, line):
+        self._pending.append(line)
+        if len(self._pending) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        data = compress(encode_chunk(self._pending), self.codec)
+        self._index.append([self._file.tell(), len(self._pending), self._pending[0]])
+        self._file.write(CHUNK_HEADER.pack(len(data), len(self._pending)) + data)
+        self._file.flush()
+        self._pending = []
+
+    def close(self):
+        self._flush()
+        index_offset = self._file.tell()
+        data = compress(json.dumps(self._index).encode('utf-8'), self.codec)
+        self._file.write(CHUNK_HEADER.pack(len(data), INDEX_MARKER) + data)
+        self._file.write(TRAILER.pack(index_offset, TRAILER_MAGIC))
+        self._file.close()
+
+
+class FrontCodedReader:
+    """
+    Reads a file written by `FrontCodedWriter` one chunk at a time.
+
+    With the index, `lines(start)` seeks straight to the chunk holding line `start`, and `find(line)` locates a line
+    by binary search over the first line of each chunk (the lines of a merged scan output are sorted).
+    A file whose writer did not get to close it has no index and is read up to its last complete chunk.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as f:
+            header = f.read(len(MAGIC) + 1)
+            if header[:len(MAGIC)] != MAGIC or header[len(MAGIC):] not in CODECS:
+                raise ValueError(f"Not a front-coded scan output: {file_path}")
+            self.codec = CODECS[header[len(MAGIC):]]
+            self.index = self._read_index(f)
+
+    def _read_index(self, f):
+        f.seek(0, os.SEEK_END)
+        if f.tell() < len(MAGIC) + 1 + TRAILER.size:
+            return None
+        f.seek(-TRAILER.size, os.SEEK_END)
+        index_offset, trailer_magic = TRAILER.unpack(f.read(TRAILER.size))
+        if trailer_magic != TRAILER_MAGIC:
+            return None
+        f.seek(index_offset)
+        size, _ = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+        return json.loads(decompress(f.read(size), self.codec))
+
+    def __len__(self):
+        if self.index is not None:
+            return sum(count for _, count, _ in self.index)
+        return sum(1 for _ in self.lines())
+
+    def _chunks(self, offset):
+        """ Yields the lines of each chunk from `offset` on, stopping at the index or at a truncated chunk. """
+        with open(self.file_path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(CHUNK_HEADER.size)
+                if len(header) < CHUNK_HEADER.size:
+                    return
+                size, count = CHUNK_HEADER.unpack(header)
+                if count == INDEX_MARKER:
+                    return
+                data = f.read(size)
+                if len(data) < size:
+                    return
+                yield decode_chunk(decompress(data, self.codec), count)
+
+    def lines(self, start=0):
+        """ Yields the lines from line number `start` on. """
+        offset = len(MAGIC) + 1
+        skip = start
+        if self.index is not None and start:
+            for chunk_offset, count, _ in self.index:
+                if skip < count:
+                    offset = chunk_offset
+                    break
+                skip -= count
+            else:
+                return
+        for chunk in self._chunks(offset):
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                continue
+            yield from chunk[skip:]
+            skip = 0
+
+    def find(self, line):
+        """ Returns the line number of `line` in a sorted file, or -1. Only the one chunk that may hold it is decompressed. """
+        if self.index is None:
+            return next((number for number, current in enumerate(self.lines()) if current == line), -1)
+        chunk_number = bisect.bisect_right([first for _, _, first in self.index], line) - 1
+        if chunk_number < 0:
+            return -1
+        offset, _, _ = self.index[chunk_number]
+        start = sum(count for _, count, _ in self.index[:chunk_number])
+        chunk = next(self._chunks(offset), [])
+        return start + chunk.index(line) if line in chunk else -1
+
+
+def read_lines(file_path):
+    """ Yields the lines of a scan output file, front-coded or plain text, without line endings. """
+    if file_path.endswith(FRONT_CODED_SUFFIX):
+        yield from FrontCodedReader(file_path).lines()
+        return
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield line.rstrip('\r\n')
@@ -0,0 +1,128 @@
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket capping the number of operations per second across all threads.
+
+    The bucket holds at most one second of tokens, so a burst after an idle period stays within the cap.
+    """
+
+    def __init__(self, ops_per_second):
+        self.ops_per_second = ops_per_second
+        self._tokens = float(ops_per_second)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.ops_per_second, self._tokens + (now - self._updated) * self.ops_per_second)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.ops_per_second
+            time.sleep(wait)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the number of operations in flight, adjusting the limit by AIMD on their observed latency.
+
+    Every `adjust_every` operations, the p99 latency of the last `window_size` operations is compared with the target.
+    Within the target, the limit grows by one (additive increase); over it, the limit is halved (multiplicative decrease).
+    The limit therefore settles around the highest concurrency the server handles without slowing down for everyone.
+    """
+
+    def __init__(self, max_concurrency, p99_target, min_concurrency=1, window_size=200, adjust_every=50):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.p99_target = p99_target
+        self.adjust_every = adjust_every
+        self.limit = self.min_concurrency
+        self.last_p99 = 0.0
+        self.stats = {'operations': 0, 'increases': 0, 'decreases': 0, 'wait_time': 0.0}
+        self._in_flight = 0
+        self._latencies = collections.deque(maxlen=window_size)
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            if self._in_flight >= self.limit:
+                start = time.perf_counter()
+                while self._in_flight >= self.limit:
+                    self._condition.wait()
+                self.stats['wait_time'] += time.perf_counter() - start
+            self._in_flight += 1
+
+    def release(self, latency):
+        with self._condition:
+            self._in_flight -= 1
+            self._latencies.append(latency)
+            self.stats['operations'] += 1
+            if self.stats['operations'] % self.adjust_every == 0:
+                self._adjust()
+            self._condition.notify_all()
+
+    def _adjust(self):
+        latencies = sorted(self._latencies)
+        self.last_p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        if self.last_p99 > self.p99_target:
+            if self.limit > self.min_concurrency:
+                self.limit = max(self.min_concurrency, self.limit // 2)
+                self.stats['decreases'] += 1
+                # Latencies measured at the old limit would trigger another cut right away
+                self._latencies.clear()
+        elif self.limit < self.max_concurrency:
+            self.limit += 1
+            self.stats['increases'] += 1
+
+
+class IOThrottle:
+    """
+    Throttles file server metadata operations (folder listings, renames) with an optional ops per second cap
+    and an optional adaptive concurrency limit. Either part is off when its setting is 0.
+    """
+
+    def __init__(self, max_ops_per_second=0, p99_target_ms=0, max_concurrency=16):
+        self.rate_limiter = RateLimiter(max_ops_per_second) if max_ops_per_second else None
+        self.concurrency_limiter = AdaptiveConcurrencyLimiter(max_concurrency, p99_target_ms / 1000) if p99_target_ms else None
+
+    @classmethod
+    def from_config(cls, config_values):
+        """ Returns a throttle for the `io_*` config values, or None if throttling is off. """
+        max_ops_per_second = config_values.get('io_max_ops_per_second') or 0
+        p99_target_ms = config_values.get('io_p99_target_ms') or 0
+        if not max_ops_per_second and not p99_target_ms:
+            return None
+        return cls(max_ops_per_second, p99_target_ms, config_values.get('io_max_concurrency') or 16)
+
+    @contextlib.contextmanager
+    def operation(self):
+        """ Waits for a slot, then times the operation run in the `with` block. """
+        if self.concurrency_limiter is not None:
+            self.concurrency_limiter.acquire()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.concurrency_limiter is not None:
+                self.concurrency_limiter.release(time.perf_counter() - start)
+
+    def log_stats(self, label):
+        limiter = self.concurrency_limiter
+        if limiter is None:
+            return
+        summary = (f"{label} | I/O concurrency limit: {limiter.limit} | Last p99: {limiter.last_p99 * 1000:.1f}ms | "
+                   f"Operations: {limiter.stats['operations']} | Increases: {limiter.stats['increases']} | "
+                   f"Decreases: {limiter.stats['decreases']} | Throttled wait: {limiter.stats['wait_time']:.2f}s")
+        logging.info(summary)
+        print(summary)
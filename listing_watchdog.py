@@ -0,0 +1,61 @@
+import queue
+import threading
+
+
+class ListingTimeout(Exception):
+    """ Raised when a call guarded by a `Watchdog` does not return within its timeout. """
+
+
+class _Call:
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class Watchdog:
+    """
+    Runs blocking calls, such as folder listings on a network share, on helper threads and gives up on them after `timeout` seconds.
+
+    A call on a dead DFS link or an offline volume can block in the kernel for good, and a thread cannot be interrupted.
+    The helper thread of a call that timed out is therefore abandoned, and a new helper is started for the next call.
+    Helpers are daemon threads, so abandoned ones do not keep the process alive.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.timeouts = 0
+        self._calls = queue.SimpleQueue()
+        self._idle = 0
+        self._lock = threading.Lock()
+
+    def call(self, function, *args):
+        """ Returns `function(*args)`, re-raises its exception, or raises ListingTimeout once the timeout has passed. """
+        call = _Call(function, args)
+        with self._lock:
+            if self._idle:
+                self._idle -= 1
+            else:
+                threading.Thread(target=self._work, daemon=True).start()
+        self._calls.put(call)
+
+        if not call.done.wait(self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise ListingTimeout(f"No response within {self.timeout}s")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _work(self):
+        while True:
+            call = self._calls.get()
+            try:
+                call.result = call.function(*call.args)
+            except Exception as e:
+                call.error = e
+            with self._lock:
+                self._idle += 1
+            call.done.set()
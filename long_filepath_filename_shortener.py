@@ -6,8 +6,31 @@ import logging
 import csv
 import configparser
 import re
-
-from utilities import check_long_path_support, write_to_csv, write_to_file
+import base64
+import hashlib
+import threading
+import zlib
+import collections
+import stat
+import time
+import heapq
+import contextlib
+import errno
+import contextvars
+import io
+import tempfile
+
+from utilities import check_long_path_support, write_to_csv, write_to_file, to_long_path, rename_path, path_exists, lstat_path, is_link_entry, hash_files, measure_length, LENGTH_UNITS, DirFdCache, LRUCache, InodeSet, SUPPORTS_DIR_FD
+from work_scheduler import WorkStealingScheduler, log_scheduler_stats
+from scan_filter import ScanFilter
+from directory_index import DirectoryIndex
+from watcher import create_watcher
+from io_throttle import IOThrottle
+from listing_watchdog import Watchdog, ListingTimeout
+from frontcoded import FrontCodedWriter, FRONT_CODED_SUFFIX, read_lines
+from token_sketch import CountMinSketch, HeavyHitters
+from external_sort import external_sort, merge_join
+from name_strategies import DictionaryStrategy, PhraseStrategy, VowelStripStrategy, TruncateHashStrategy, StrategyPipeline, get_extension
 from datetime import datetime
 
 def get_int_config_value(config, key, default):
@@ -21,6 +44,61 @@ def get_int_config_value(config, key, default):
         logging.error(f"Missing '{key}' value. Using default value of {default}.")
         return default
 
+def read_root_sections(config, config_values):
+    """
+    Reads the `[ROOT name]` sections, one per base directory to process in a single run.
+
+    A section only needs `base_dir`. The thresholds and `folder_conversion_stop_level` default to the global values.
+    """
+    roots = []
+    for section in config.sections():
+        if not section.startswith('ROOT '):
+            continue
+        root = {'name': section[len('ROOT '):].strip(), 'base_dir': config.get(section, 'base_dir')}
+        for key in ['filename_length_threshold', 'dir_length_threshold', 'folder_conversion_stop_level']:
+            try:
+                root[key] = int(config.get(section, key))
+            except (ValueError, configparser.NoOptionError):
+                logging.warning(f"Invalid '{key}' value for root '{root['name']}'. Using the global value.")
+                root[key] = config_values[key]
+        roots.append(root)
+    return roots
+
+
+class ConfigValues(dict):
+    """
+    The config values, with overrides that apply to the current context only (see `override`).
+
+    Runs over several roots override the base directory, output folder and thresholds of the root being processed.
+    The overrides live in a context variable, so threads processing different roots at the same time each see their own.
+    """
+
+    _overrides = contextvars.ContextVar('config_overrides', default={})
+
+    def get(self, key, default=None):
+        overrides = self._overrides.get()
+        if key in overrides:
+            return overrides[key]
+        return super().get(key, default)
+
+    def __getitem__(self, key):
+        overrides = self._overrides.get()
+        if key in overrides:
+            return overrides[key]
+        return super().__getitem__(key)
+
+    @contextlib.contextmanager
+    def override(self, values):
+        token = self._overrides.set({**self._overrides.get(), **values})
+        try:
+            yield self
+        finally:
+            self._overrides.reset(token)
+
+
+# Formats of the scan output part files: plain text, or front-coded paths in gzip or lzma compressed chunks
+SCAN_OUTPUT_FORMATS = ('text', 'gzip', 'lzma')
+
 # Global variables
 def read_config_values():
     """ Read the configuration values from the config.ini file. """
@@ -35,10 +113,47 @@ def read_config_values():
         'dir_scan_dir': config.get('DEFAULT', 'dir_scan_dir'),
         'filename_scan_dir': config.get('DEFAULT', 'filename_scan_dir'),
         'filename_length_threshold': get_int_config_value(config, 'filename_length_threshold', 200),
+        'length_unit': config.get('DEFAULT', 'length_unit', fallback='chars').strip().lower(),
         'dir_length_threshold': get_int_config_value(config, 'dir_length_threshold', 200),
         'scan_entry_threshold': get_int_config_value(config, 'scan_entry_threshold', 1000),
+        'scan_listing_timeout_seconds': get_int_config_value(config, 'scan_listing_timeout_seconds', 30),
+        'scan_retry_attempts': get_int_config_value(config, 'scan_retry_attempts', 3),
+        'scan_retry_backoff_seconds': get_int_config_value(config, 'scan_retry_backoff_seconds', 10),
+        'scan_quarantine_output': config.get('DEFAULT', 'scan_quarantine_output', fallback='scan_quarantine'),
+        'scan_metadata': config.get('DEFAULT', 'scan_metadata', fallback='False'),
+        'scan_output_format': config.get('DEFAULT', 'scan_output_format', fallback='text').strip().lower(),
+        'scan_output_chunk_size': get_int_config_value(config, 'scan_output_chunk_size', 4096),
+        'follow_links': config.get('DEFAULT', 'follow_links', fallback='False'),
+        'scan_alias_output': config.get('DEFAULT', 'scan_alias_output', fallback='scan_alias'),
+        'dictionary_sketch_width': get_int_config_value(config, 'dictionary_sketch_width', 262144),
+        'dictionary_sketch_depth': get_int_config_value(config, 'dictionary_sketch_depth', 4),
+        'dictionary_candidates': get_int_config_value(config, 'dictionary_candidates', 500),
+        'dictionary_min_token_length': get_int_config_value(config, 'dictionary_min_token_length', 6),
+        'proposed_dictionary_output': config.get('DEFAULT', 'proposed_dictionary_output', fallback='proposed_dictionary'),
+        'diff_sort_chunk_size': get_int_config_value(config, 'diff_sort_chunk_size', 100000),
+        'scan_diff_output': config.get('DEFAULT', 'scan_diff_output', fallback='scan_diff'),
         'number_of_retry': get_int_config_value(config, 'number_of_retry', 5),
+        'max_open_dir_fds': get_int_config_value(config, 'max_open_dir_fds', 64),
+        'scan_workers': get_int_config_value(config, 'scan_workers', 1),
+        'rename_workers': get_int_config_value(config, 'rename_workers', 1),
+        'io_max_ops_per_second': get_int_config_value(config, 'io_max_ops_per_second', 0),
+        'io_p99_target_ms': get_int_config_value(config, 'io_p99_target_ms', 0),
+        'io_max_concurrency': get_int_config_value(config, 'io_max_concurrency', 16),
+        'conversion_cache_size': get_int_config_value(config, 'conversion_cache_size', 100000),
+        'naming_mode': config.get('DEFAULT', 'naming_mode', fallback='counter').strip().lower(),
+        'hash_suffix_length': get_int_config_value(config, 'hash_suffix_length', 6),
+        'conversion_cache_file': config.get('DEFAULT', 'conversion_cache_file', fallback=''),
+        'verify_renames': config.get('DEFAULT', 'verify_renames', fallback='False'),
+        'verify_hash_algorithm': config.get('DEFAULT', 'verify_hash_algorithm', fallback='blake2b').strip().lower(),
+        'verify_sample_size': get_int_config_value(config, 'verify_sample_size', 0),
+        'verify_workers': get_int_config_value(config, 'verify_workers', 4),
+        'verify_cache_file': config.get('DEFAULT', 'verify_cache_file', fallback=''),
+        'hash_cache_size': get_int_config_value(config, 'hash_cache_size', 100000),
+        'verification_error': config.get('DEFAULT', 'verification_error', fallback='verification_error'),
         'dictionary_path': config.get('DEFAULT', 'dictionary_path'),        
+        'phrase_dictionary_path': config.get('DEFAULT', 'phrase_dictionary_path', fallback=''),
+        'shortening_strategies': config.get('DEFAULT', 'shortening_strategies', fallback=''),
+        'truncate_name_length': get_int_config_value(config, 'truncate_name_length', 0),
         'long_dir_path_scan_output': config.get('DEFAULT', 'long_dir_path_scan_output'),
         'long_filename_scan_output': config.get('DEFAULT', 'long_filename_scan_output'),
         'long_filename_modified_output': config.get('DEFAULT', 'long_filename_modified_output'),
@@ -51,15 +166,45 @@ def read_config_values():
         'regular_expression': config.get('REGULAR_EXPRESSION', 'regular_expression'),
         'dir_path_regex': config.get('REGULAR_EXPRESSION', 'dir_path_regex'),
         'filename_regex': config.get('REGULAR_EXPRESSION', 'filename_regex'),
-        'folder_conversion_stop_level': config.get('DEFAULT', 'folder_conversion_stop_level')
+        'folder_conversion_stop_level': get_int_config_value(config, 'folder_conversion_stop_level', 6),
+        'scan_exclude': config.get('DEFAULT', 'scan_exclude', fallback=''),
+        'scan_include': config.get('DEFAULT', 'scan_include', fallback=''),
+        'scan_min_depth': get_int_config_value(config, 'scan_min_depth', 0),
+        'scan_max_depth': get_int_config_value(config, 'scan_max_depth', 0),
+        'scan_pruning': config.get('DEFAULT', 'scan_pruning', fallback='False'),
+        'dir_index_file': config.get('DEFAULT', 'dir_index_file', fallback='dir_index.csv'),
+        'prune_revalidate_days': get_int_config_value(config, 'prune_revalidate_days', 7),
+        'prune_margin': get_int_config_value(config, 'prune_margin', 10),
+        'watch_debounce_seconds': get_int_config_value(config, 'watch_debounce_seconds', 2),
+        'watch_batch_size': get_int_config_value(config, 'watch_batch_size', 500),
+        'watch_poll_seconds': get_int_config_value(config, 'watch_poll_seconds', 30),
+        'watch_use_inotify': config.get('DEFAULT', 'watch_use_inotify', fallback='True')
     }
     
     config_values['dry_run'] = True if config_values['dry_run'].lower() in ['true', '1', 'yes'] else False
+    if config_values['length_unit'] not in LENGTH_UNITS:
+        logging.warning(f"Invalid 'length_unit' value. Expected one of {LENGTH_UNITS}. Using chars.")
+        config_values['length_unit'] = 'chars'
+    if config_values['scan_output_format'] not in SCAN_OUTPUT_FORMATS:
+        logging.warning(f"Invalid 'scan_output_format' value. Expected one of {SCAN_OUTPUT_FORMATS}. Using text.")
+        config_values['scan_output_format'] = 'text'
+    config_values['watch_use_inotify'] = True if config_values['watch_use_inotify'].lower() in ['true', '1', 'yes'] else False
+    config_values['follow_links'] = True if config_values['follow_links'].lower() in ['true', '1', 'yes'] else False
+    config_values['scan_metadata'] = True if config_values['scan_metadata'].lower() in ['true', '1', 'yes'] else False
+    config_values['scan_pruning'] = True if config_values['scan_pruning'].lower() in ['true', '1', 'yes'] else False
+    config_values['verify_renames'] = True if config_values['verify_renames'].lower() in ['true', '1', 'yes'] else False
     config_values['regular_expression'] = True if config_values['regular_expression'].lower() in ['true', '1', 'yes'] else False
+    config_values['roots'] = read_root_sections(config, config_values)
 
     return config_values
 
-CONFIG_VALUES = read_config_values()
+CONFIG_VALUES = ConfigValues(read_config_values())
+
+
+def get_length(text):
+    """ Returns the length of a name or path in the configured `length_unit` (code points, UTF-8 bytes or UTF-16 code units). """
+    return measure_length(text, CONFIG_VALUES.get('length_unit') or 'chars')
+
 
 def configure_logging(log_dir):
     """ Configure logging. """
@@ -103,6 +248,22 @@ def check_and_create_dirs(config_values):
 
 check_and_create_dirs(CONFIG_VALUES)
 
+# Open directory handles shared by the scanner and the rename functions. Only used where dir_fd-relative calls are supported.
+DIR_FD_CACHE = DirFdCache(CONFIG_VALUES.get('max_open_dir_fds')) if SUPPORTS_DIR_FD else None
+
+# Throttle shared by every folder listing and rename on the file server, see `IOThrottle`. None when throttling is off.
+IO_THROTTLE = IOThrottle.from_config(CONFIG_VALUES)
+
+
+def io_operation():
+    """ Context manager that runs a file server operation through IO_THROTTLE, if throttling is on. """
+    return IO_THROTTLE.operation() if IO_THROTTLE is not None else contextlib.nullcontext()
+
+
+def log_io_throttle_stats(label):
+    if IO_THROTTLE is not None:
+        IO_THROTTLE.log_stats(label)
+
 def load_dictionary(dictionary_path):
     """
     Loads a dictionary from a CSV file.
@@ -208,6 +369,206 @@ def convert_components(components, dictionary):
     return [dictionary.get(component, component) for component in components]
 
 
+# Dictionaries loaded during this run: dictionary path -> (dictionary, version)
+LOADED_DICTIONARIES = {}
+
+
+def get_dictionary(config_key='dictionary_path'):
+    """
+    Loads the abbreviation dictionary (or the phrase dictionary, with `config_key` 'phrase_dictionary_path') once per run.
+
+    Returns the dictionary and its version, a hash of the file content, so cached conversions made
+    with another version of the dictionary are not reused.
+    """
+    dictionary_path = os.path.join(CONFIG_VALUES.get('config_dir'), CONFIG_VALUES.get(config_key))
+    if dictionary_path not in LOADED_DICTIONARIES:
+        dictionary = load_dictionary(dictionary_path)
+        with open(dictionary_path, 'rb') as f:
+            version = hashlib.sha1(f.read()).hexdigest()[:16]
+        LOADED_DICTIONARIES[dictionary_path] = (dictionary, version)
+    return LOADED_DICTIONARIES[dictionary_path]
+
+
+SHORTENING_STRATEGIES = ['dictionary', 'phrase', 'vowel_strip', 'truncate_hash']
+
+# Strategy pipelines compiled during this run: configuration -> StrategyPipeline
+STRATEGY_PIPELINES = {}
+
+
+def get_strategy_names(if_use_regular_expression):
+    """
+    Returns the ordered strategy names of `shortening_strategies`.
+
+    Without that setting, `regular_expression` picks vowel_strip or dictionary alone, as before the strategies were configurable.
+    """
+    names = [name.strip().lower() for name in (CONFIG_VALUES.get('shortening_strategies') or '').split(',') if name.strip()]
+    if not names:
+        return ['vowel_strip'] if if_use_regular_expression else ['dictionary']
+
+    unknown_names = [name for name in names if name not in SHORTENING_STRATEGIES]
+    if unknown_names:
+        raise ValueError(f"Unknown shortening strategies: {unknown_names}. Expected any of {SHORTENING_STRATEGIES}")
+    return names
+
+
+def get_strategy_pipeline(if_use_regular_expression):
+    """
+    Returns the strategy pipeline for the current configuration, compiled once.
+
+    The pipeline version covers the strategy order, the regular expressions, the dictionary versions and the
+    truncation settings, so it also keys the conversion cache.
+    """
+    names = get_strategy_names(if_use_regular_expression)
+    version_parts = list(names)
+    if 'dictionary' in names:
+        version_parts.append(get_dictionary()[1])
+    if 'phrase' in names:
+        version_parts.append(get_dictionary('phrase_dictionary_path')[1])
+    if 'vowel_strip' in names:
+        version_parts += [CONFIG_VALUES.get('dir_path_regex'), CONFIG_VALUES.get('filename_regex') or CONFIG_VALUES.get('dir_path_regex')]
+    if 'truncate_hash' in names:
+        version_parts += [str(CONFIG_VALUES.get('truncate_name_length')), str(CONFIG_VALUES.get('hash_suffix_length') or 6), CONFIG_VALUES.get('length_unit') or 'chars']
+    version = hashlib.sha1('\0'.join(version_parts).encode('utf-8')).hexdigest()[:16]
+
+    if version not in STRATEGY_PIPELINES:
+        strategies = []
+        for name in names:
+            if name == 'dictionary':
+                strategies.append(DictionaryStrategy(get_dictionary()[0]))
+            elif name == 'phrase':
+                strategies.append(PhraseStrategy(get_dictionary('phrase_dictionary_path')[0]))
+            elif name == 'vowel_strip':
+                strategies.append(VowelStripStrategy(CONFIG_VALUES.get('dir_path_regex'), CONFIG_VALUES.get('filename_regex') or CONFIG_VALUES.get('dir_path_regex')))
+            else:
+                strategies.append(TruncateHashStrategy(CONFIG_VALUES.get('truncate_name_length'), CONFIG_VALUES.get('hash_suffix_length') or 6, CONFIG_VALUES.get('length_unit') or 'chars'))
+        STRATEGY_PIPELINES[version] = StrategyPipeline(strategies, version)
+    return STRATEGY_PIPELINES[version]
+
+
+def log_strategy_stats():
+    """ Logs the time spent and the bytes saved by each shortening strategy during this run. """
+    for pipeline in STRATEGY_PIPELINES.values():
+        for name, stats in pipeline.stats.items():
+            if stats['calls']:
+                logging.info(f"Shortening strategy: {name} | Names: {stats['calls']} | Time: {stats['time']:.3f}s | Bytes saved: {stats['bytes_saved']}")
+                print(f"Shortening strategy: {name} | Names: {stats['calls']} | Time: {stats['time']:.3f}s | Bytes saved: {stats['bytes_saved']}")
+
+
+# Shortened names memoized across paths, and across runs when `conversion_cache_file` is set
+CONVERSION_CACHE = LRUCache(CONFIG_VALUES.get('conversion_cache_size'))
+
+
+def convert_name(name, kind, if_use_regular_expression):
+    """
+    Returns the shortened form of a directory name (`kind` 'dir') or of a filename (`kind` 'file').
+
+    The name is broken down into components that go through the configured strategy pipeline, and are joined
+    with '-' again. A filename keeps its extension.
+
+    The same names come up over and over across a share, so results are memoized in CONVERSION_CACHE,
+    keyed on the name and the strategies and configuration used.
+    """
+    pipeline = get_strategy_pipeline(if_use_regular_expression)
+
+    key = (kind, pipeline.names, pipeline.version, name)
+    new_name = CONVERSION_CACHE.get(key)
+    if new_name is not None:
+        return new_name
+
+    if kind == 'file':
+        components = break_down_filename(name)
+        extension = get_extension(name)
+        if extension:
+            components = components[:-1]
+    else:
+        components = break_down_dir(name)
+        extension = ''
+
+    new_components = pipeline.apply(components, kind, name)
+    logging.info(f"Name components: {components} | New name components: {new_components}")
+
+    new_name = '-'.join(new_components) + extension
+
+    CONVERSION_CACHE.put(key, new_name)
+    return new_name
+
+
+def load_conversion_cache():
+    """ Loads the conversion cache saved by a previous run, if `conversion_cache_file` is configured. """
+    conversion_cache_file = CONFIG_VALUES.get('conversion_cache_file')
+    if conversion_cache_file:
+        CONVERSION_CACHE.load(os.path.join(CONFIG_VALUES.get('output_dir'), conversion_cache_file))
+        logging.info(f"Conversion cache loaded with {len(CONVERSION_CACHE)} entries")
+
+
+def save_conversion_cache():
+    """ Logs the conversion cache hit rate and saves the cache for the next run, if `conversion_cache_file` is configured. """
+    logging.info(f"Conversion cache | Hits: {CONVERSION_CACHE.hits} | Misses: {CONVERSION_CACHE.misses} | Hit rate: {CONVERSION_CACHE.hit_rate():.1%} | Entries: {len(CONVERSION_CACHE)}")
+    print(f"Conversion cache | Hits: {CONVERSION_CACHE.hits} | Misses: {CONVERSION_CACHE.misses} | Hit rate: {CONVERSION_CACHE.hit_rate():.1%}")
+
+    conversion_cache_file = CONFIG_VALUES.get('conversion_cache_file')
+    if conversion_cache_file:
+        try:
+            CONVERSION_CACHE.save(os.path.join(CONFIG_VALUES.get('output_dir'), conversion_cache_file))
+        except OSError as e:
+            logging.error(f"Failed to save the conversion cache: {e}")
+
+
+class FolderNames:
+    """
+    The names in the folders of a `-p filename` run, listed once per folder.
+
+    Naming conflicts are looked up in the listing instead of probing the disk for every candidate name, and each rename
+    (or simulated rename) updates it, so files renamed later in the same folder see the names planned before them.
+    A folder's listing is released once all of its files are processed.
+    """
+
+    def __init__(self):
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def _list(self, dir_path):
+        with self._lock:
+            names = self._names.get(dir_path)
+        if names is not None:
+            return names
+
+        try:
+            if DIR_FD_CACHE is not None:
+                with DIR_FD_CACHE.open(dir_path) as dir_fd, io_operation():
+                    listed_names = os.listdir(dir_fd)
+            else:
+                with io_operation():
+                    listed_names = os.listdir(dir_path)
+        except OSError as e:
+            logging.error(f"Failed to list folder: {dir_path} | {e}")
+            listed_names = []
+        names = {os.path.normcase(name) for name in listed_names}
+
+        with self._lock:
+            return self._names.setdefault(dir_path, names)
+
+    def exists(self, path):
+        dir_path, name = os.path.split(path)
+        return os.path.normcase(name) in self._list(dir_path)
+
+    def record(self, old_path, new_path):
+        """ Records that a file was renamed (or would be, in dry-run mode). """
+        old_names = self._list(os.path.dirname(old_path))
+        new_names = self._list(os.path.dirname(new_path))
+        with self._lock:
+            old_names.discard(os.path.normcase(os.path.basename(old_path)))
+            new_names.add(os.path.normcase(os.path.basename(new_path)))
+
+    def release(self, dir_path):
+        with self._lock:
+            self._names.pop(dir_path, None)
+
+
+# Folder listings of the current `-p filename` run. Set by `process_dir_or_filename`.
+FOLDER_NAMES = None
+
+
 def check_for_naming_conflict(file_path, new_name):
     """
     Checks for naming conflicts when renaming a file.
@@ -215,27 +576,78 @@ def check_for_naming_conflict(file_path, new_name):
     This function attempts to rename a file to `new_name` up to a specified number of times (default is 5). 
     If a file with the new name already exists, it appends a number to the end of the name and tries again. 
     If it still can't rename the file after the specified number of attempts, it logs an error and returns None.
+    During a `-p filename` run, the names are looked up in the folder listing of `FOLDER_NAMES`.
     """
     name, ext = os.path.splitext(new_name)
+    number_of_retry = CONFIG_VALUES.get('number_of_retry')
     
-    for i in range(CONFIG_VALUES.get('number_of_retry')):
+    for i in range(number_of_retry):
         new_file_path = os.path.join(os.path.dirname(file_path), new_name)
         logging.info(f"Checking for naming conflict: {new_name}")
         print(f"Checking for naming conflict: {new_name}")
         
-        if not os.path.exists(new_file_path):
+        if FOLDER_NAMES is not None:
+            exists = FOLDER_NAMES.exists(new_file_path)
+        else:
+            with io_operation():
+                exists = path_exists(new_file_path, DIR_FD_CACHE)
+        if not exists:
             logging.info(f"No naming conflict found for file: {file_path} | New name: {new_name}")
             print(f"No naming conflict found for file: {file_path} | New name: {new_name}")
             return new_file_path
         else:
-            new_name = f"{name.rsplit('_', 1)[0]}_{i+1}{ext}"
+            new_name = f"{name}_{i+1}{ext}"
             logging.info(f"Naming conflict found for file: {file_path} | New name: {new_name}. Trying again...")
             print(f"Naming conflict found for file: {file_path} | New name: {new_name}. Trying again...")
     
-    logging.error(f"Failed to rename file after 10 attempts: {file_path}")
+    logging.error(f"Failed to rename file after {number_of_retry} attempts: {file_path}")
     return None
 
 
+def is_hash_naming_mode():
+    """ Checks if new names get a path-derived hash suffix (`naming_mode = hash`) instead of probing for conflicts. """
+    return CONFIG_VALUES.get('naming_mode') == 'hash'
+
+
+def get_hash_suffix(original_path):
+    """
+    Returns a short, stable suffix derived from the full path of the file or folder being renamed.
+
+    The suffix is the base32 encoded BLAKE2 digest of the path, cut to `hash_suffix_length` characters (lower case,
+    so it is safe on case-insensitive file systems). Two siblings only collide if their paths hash alike, so no
+    conflict probing is needed, and the suffix of any new name in the rename log can be recomputed from the old path.
+    It is appended after a '~', which the name breakdown does not split on, so it can be told from the parts of a name.
+    """
+    hash_suffix_length = CONFIG_VALUES.get('hash_suffix_length') or 6
+    digest = hashlib.blake2b(original_path.encode('utf-8', 'surrogateescape'), digest_size=20).digest()
+    return base64.b32encode(digest).decode('ascii')[:hash_suffix_length].lower()
+
+
+def split_hash_suffix(name, kind):
+    """
+    Splits the hash suffix an earlier run appended off a filename or folder name: '~' and `hash_suffix_length`
+    base32 characters, as written by the hash naming mode and the truncate_hash strategy.
+
+    Returns the name without the suffix and the suffix with its '~', or the name and '' if it has none.
+    """
+    hash_suffix_length = CONFIG_VALUES.get('hash_suffix_length') or 6
+    stem, ext = os.path.splitext(name) if kind == 'file' else (name, '')
+    match = re.search(rf"~[a-z2-7]{{{hash_suffix_length}}}$", stem)
+    if not match:
+        return name, ''
+    return stem[:match.start()] + ext, match.group()
+
+
+def add_hash_suffix(new_name, original_path, kind, hash_suffix=''):
+    """
+    Appends the hash suffix of `original_path` to a new filename (before the extension) or folder name.
+
+    A name shortened again keeps the `hash_suffix` of its earlier run instead, so its length stays the same.
+    """
+    stem, ext = os.path.splitext(new_name) if kind == 'file' else (new_name, '')
+    return f"{stem}{hash_suffix or '~' + get_hash_suffix(original_path)}{ext}"
+
+
 def rename_filename(file_path, new_file_path):
     """
     Renames a file and logs the operation.
@@ -243,6 +655,7 @@ def rename_filename(file_path, new_file_path):
     This function attempts to rename a file from `file_path` to `new_file_path`. 
     If the operation is successful, it logs the new file path and writes the old and new file paths to a CSV file. 
     If the operation fails due to the file not being found or a permission error, it logs the error and writes the old file path and the error to a CSV file.
+    Returns True if the file was renamed.
     """
     
     long_filename_modified_output = CONFIG_VALUES.get('long_filename_modified_output')
@@ -254,18 +667,17 @@ def rename_filename(file_path, new_file_path):
     print(f"Attempting to rename filename from: {file_path} to {new_file_path}")
     
     try:
-        os.rename(file_path, new_file_path)
+        with io_operation():
+            rename_path(file_path, new_file_path, DIR_FD_CACHE)
         logging.info(f"Filename rename successed. Renamed filename from: {file_path} to {new_file_path}")
         print(f"Filename rename successed. Renamed filename from: {file_path} to {new_file_path}")
         
-        with open(f'{output_dir}/{long_filename_modified_output}_{date_str}.csv', 'a', encoding='utf-8', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([file_path, new_file_path])
+        write_to_csv(f'{output_dir}/{long_filename_modified_output}_{date_str}.csv', [file_path, new_file_path])
+        return True
     except (FileNotFoundError, PermissionError) as e:
         logging.error(f"Error renaming file: {e}")
-        with open(f'{output_dir}/{long_filename_modified_error}_{date_str}.csv', 'a', encoding='utf-8', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([file_path, str(e)])
+        write_to_csv(f'{output_dir}/{long_filename_modified_error}_{date_str}.csv', [file_path, str(e)])
+        return False
 
 
 def shorten_long_filename(file_path, if_use_regular_expression, filename_length_threshold, dry_run):
@@ -276,40 +688,44 @@ def shorten_long_filename(file_path, if_use_regular_expression, filename_length_
     and then joins the components back together to form a new filename. 
     If a naming conflict occurs, it tries to resolve the conflict by appending a number to the filename. 
     If the new filename is still too long after conversion, it logs an error and does not rename the file.
+    Returns the new file path if the file was renamed (or would be, in dry-run mode).
     """
     logging.info(f"Processing file: {file_path} | Dry Run: {dry_run} | Filename length threshold: {filename_length_threshold}")
     print(f"Processing file: {file_path} | Dry Run: {dry_run} | Filename length threshold: {filename_length_threshold}")
     
     filename = os.path.basename(file_path)
-    name, ext = os.path.splitext(filename)
-    
-    old_filename_components = break_down_filename(filename)
+    # The hash suffix of an earlier run is not converted again, so a shortened name stays as it is
+    base_name, hash_suffix = split_hash_suffix(filename, 'file') if is_hash_naming_mode() else (filename, '')
+    new_name = convert_name(base_name, 'file', if_use_regular_expression)
     
-    regex_conversion_limit = 3
+    logging.info(f"Filename: {filename} | New filename: {new_name}")
+    print(f"Filename: {filename} | New filename: {new_name}")
     
-    if if_use_regular_expression:
-        dir_path_regex = CONFIG_VALUES.get('dir_path_regex')
-        regex = re.compile(dir_path_regex)
-        new_filename_components = [regex.sub('', word) if len(word) > regex_conversion_limit else word for word in old_filename_components]
-    else: 
-        dictionary_path = os.path.join(CONFIG_VALUES.get('config_dir'), CONFIG_VALUES.get('dictionary_path'))
-        dictionary = load_dictionary(dictionary_path)
-        new_filename_components = convert_components(old_filename_components, dictionary)
-    
-    
-    logging.info(f"Filename components: {old_filename_components}")
-    print(f"Filename components: {old_filename_components}")
-    
-    logging.info(f"New filename components: {new_filename_components}")
-    print(f"New filename components: {new_filename_components}")
+    if new_name == base_name:
+        logging.info(f"No change for filename: {file_path}")
+        return None
     
-    new_name = '-'.join(new_filename_components[:-1]) + ext
+    if is_hash_naming_mode():
+        new_name = add_hash_suffix(new_name, file_path, 'file', hash_suffix)
     
-    if len(new_name) > filename_length_threshold:
-        logging.error(f"New filename is over threshold: {new_name} | New filename length: {len(new_name)} | Threshold: {filename_length_threshold}")
+    new_name_length = get_length(new_name)
+    if new_name_length > filename_length_threshold:
+        logging.error(f"New filename is over threshold: {new_name} | New filename length: {new_name_length} | Threshold: {filename_length_threshold}")
         # return None
     
-    new_file_path = check_for_naming_conflict(file_path, new_name)
+    if is_hash_naming_mode():
+        new_file_path = os.path.join(os.path.dirname(file_path), new_name)
+        # Hash suffixes make a collision unlikely, not impossible, and a rename onto an existing file would replace it
+        if FOLDER_NAMES is not None:
+            exists = FOLDER_NAMES.exists(new_file_path)
+        else:
+            with io_operation():
+                exists = path_exists(new_file_path, DIR_FD_CACHE)
+        if exists:
+            logging.error(f"New filename already exists: {new_file_path}")
+            new_file_path = None
+    else:
+        new_file_path = check_for_naming_conflict(file_path, new_name)
     if new_file_path is None:
         logging.error(f"Could not resolve naming conflict for file: {file_path}. Skipping...")
         return None
@@ -317,8 +733,15 @@ def shorten_long_filename(file_path, if_use_regular_expression, filename_length_
     if dry_run:
         long_filename_modified_output = CONFIG_VALUES.get('long_filename_modified_output')
         simulate_rename(file_path, new_file_path, long_filename_modified_output)        
+        renamed = True
     else:        
-        rename_filename(file_path, new_file_path)
+        renamed = rename_filename(file_path, new_file_path)
+
+    if not renamed:
+        return None
+    if FOLDER_NAMES is not None:
+        FOLDER_NAMES.record(file_path, new_file_path)
+    return new_file_path
 
 
 def simulate_rename(old_dir_path, new_dir_path, output_file_path):
@@ -342,10 +765,190 @@ def simulate_rename(old_dir_path, new_dir_path, output_file_path):
     write_to_csv(f'{output_dir}/{dry_run_dir}/dry_run_{output_file_path}_{date_str}.csv', [old_dir_path, new_dir_path])
 
 
+class _RenameNode:
+    """ A single path component in the rename overlay trie. """
+    __slots__ = ('original_name', 'current_name', 'by_original', 'by_current')
+
+    def __init__(self, name):
+        self.original_name = name
+        self.current_name = name
+        self.by_original = {}
+        self.by_current = {}
+
+
+class RenameOverlay:
+    """
+    Keeps an in-memory view of the directory renames performed (or simulated) during a run.
+
+    Paths read from the scan output describe the tree as it was at scan time. The overlay stores a trie of path components
+    that remembers the current name of every renamed directory, so a queued path can be resolved to where it lives now.
+    When `virtual` is True (dry run) nothing changes on disk, so the overlay also maps current paths back to the real ones
+    and answers directory listings and existence checks as if the renames had already happened.
+    Renames can be recorded concurrently, e.g. by the rollback's rename workers.
+    """
+
+    def __init__(self, virtual=False):
+        self.virtual = virtual
+        self.root = _RenameNode('')
+        self.operations = 0
+        self._lock = threading.Lock()
+
+    def _walk_current(self, components, create=False):
+        """
+        Walks the trie along current path components.
+
+        Returns the deepest node reached and the number of components consumed. With `create`, missing nodes are added
+        so the whole path is consumed.
+        """
+        node = self.root
+        for index, component in enumerate(components):
+            child = node.by_current.get(component)
+            if child is None:
+                if not create:
+                    return node, index
+                child = _RenameNode(component)
+                # Only register the original name if no renamed sibling used to carry it
+                if component not in node.by_original:
+                    node.by_original[component] = child
+                node.by_current[component] = child
+            node = child
+        return node, len(components)
+
+    def resolve(self, path):
+        """ Maps a path from the scan output to its current location. """
+        node = self.root
+        components = path.split(os.sep)
+        resolved = []
+        for index, component in enumerate(components):
+            child = node.by_original.get(component)
+            if child is None:
+                return os.sep.join(resolved + components[index:])
+            resolved.append(child.current_name)
+            node = child
+        return os.sep.join(resolved)
+
+    def to_disk(self, path):
+        """ Maps a current path to the path that exists on disk. Only differs from `path` in dry-run mode. """
+        if not self.virtual:
+            return path
+        components = path.split(os.sep)
+        node = self.root
+        disk_components = []
+        for index, component in enumerate(components):
+            child = node.by_current.get(component)
+            if child is None:
+                return os.sep.join(disk_components + components[index:])
+            disk_components.append(child.original_name)
+            node = child
+        return os.sep.join(disk_components)
+
+    def exists(self, path):
+        """ Checks if a current path exists, taking pending renames into account. """
+        if not self.virtual:
+            with io_operation():
+                return path_exists(path, DIR_FD_CACHE)
+        components = path.split(os.sep)
+        node, consumed = self._walk_current(components)
+        if consumed < len(components):
+            renamed_away = node.by_original.get(components[consumed])
+            if renamed_away is not None and renamed_away.current_name != components[consumed]:
+                return False
+        with io_operation():
+            return os.path.exists(self.to_disk(path))
+
+    def list_sub_dirs(self, dir_path):
+        """ Lists the sub-folders of a current directory path, as current paths. """
+        if not self.virtual:
+            if DIR_FD_CACHE is None:
+                with io_operation(), os.scandir(dir_path) as it:
+                    return [entry.path for entry in it if entry.is_dir()]
+            with DIR_FD_CACHE.open(dir_path) as dir_fd, io_operation(), os.scandir(dir_fd) as it:
+                return [os.path.join(dir_path, entry.name) for entry in it if entry.is_dir()]
+
+        with io_operation(), os.scandir(self.to_disk(dir_path)) as it:
+            names = [entry.name for entry in it if entry.is_dir()]
+
+        components = dir_path.split(os.sep)
+        node, consumed = self._walk_current(components)
+        if consumed < len(components):
+            return [os.path.join(dir_path, name) for name in names]
+
+        sub_dirs = []
+        for name in names:
+            child = node.by_original.get(name)
+            sub_dirs.append(os.path.join(dir_path, child.current_name if child is not None else name))
+        return sub_dirs
+
+    def record(self, old_dir_path, new_dir_path):
+        """ Records that a directory was renamed (or would be, in dry-run mode). """
+        old_components = old_dir_path.split(os.sep)
+        with self._lock:
+            parent, _ = self._walk_current(old_components[:-1], create=True)
+            node = parent.by_current.get(old_components[-1])
+            if node is None:
+                node = _RenameNode(old_components[-1])
+                if old_components[-1] not in parent.by_original:
+                    parent.by_original[old_components[-1]] = node
+            else:
+                del parent.by_current[node.current_name]
+            node.current_name = new_dir_path.split(os.sep)[-1]
+            parent.by_current[node.current_name] = node
+            self.operations += 1
+
+
+# Directory renames of the current `-p dir` run. Set by `process_dir_or_filename`.
+RENAME_OVERLAY = None
+
+
+def load_dir_rename_map(run_id):
+    """
+    Replays the directory rename log of a run into a rename overlay, so scan paths can be rewritten to their current location.
+
+    Each log row holds the directory path at the time of its rename, which is what `RenameOverlay.record` expects,
+    so renames of nested folders chain in log order. Returns None if the run renamed no directories.
+    """
+    output_dir = CONFIG_VALUES.get('output_dir')
+    dir_renames = load_rename_log(f"{output_dir}/{CONFIG_VALUES.get('long_dir_path_modified_output')}_{run_id}.csv")
+    if not dir_renames:
+        return None
+
+    rename_map = RenameOverlay()
+    for old_dir_path, new_dir_path in dir_renames:
+        rename_map.record(old_dir_path, new_dir_path)
+    # The replayed renames were counted by the run that performed them
+    rename_map.operations = 0
+    logging.info(f"Loaded {len(dir_renames)} directory renames to rewrite the queued paths")
+    return rename_map
+
+
+def simulate_rename_dir(old_dir_path, new_dir_path, overlay):
+    """
+    Simulates `rename_dir` against the rename overlay.
+
+    Naming conflicts are resolved the same way `rename_dir` does, by appending a number to the new name,
+    so the dry run reports the same operations the real run will perform.
+    """
+    long_dir_path_modified_output = CONFIG_VALUES.get('long_dir_path_modified_output')
+    number_of_retry = 0 if is_hash_naming_mode() else CONFIG_VALUES.get('number_of_retry')
+
+    candidates = [new_dir_path] + [f"{new_dir_path}_{i}" for i in range(1, number_of_retry + 1)]
+    for candidate in candidates:
+        if not overlay.exists(candidate):
+            simulate_rename(old_dir_path, candidate, long_dir_path_modified_output)
+            overlay.record(old_dir_path, candidate)
+            return candidate
+
+    logging.error(f"Dry Run: Failed to rename '{old_dir_path}' to '{new_dir_path}' after {number_of_retry} attempts")
+    return None
+
+
 def shorten_long_dir(file_path, if_use_regular_expression, dir_length_threshold, dry_run):
     """
     Shortens long directory paths by renaming sub-folders that exceed a specified length threshold.
 
+    The path is first resolved through the rename overlay, so renames made earlier in the run (or simulated, in a dry run)
+    are taken into account.
+
     Args:
         file_path (str): The path of the file for which the directory needs to be shortened.
         if_use_regular_expression (bool): Flag indicating whether to use regular expression for breaking down directory path.
@@ -355,14 +958,15 @@ def shorten_long_dir(file_path, if_use_regular_expression, dir_length_threshold,
     Returns:
         None
     """
-    
-    dir_path = os.path.dirname(file_path)
+    overlay = RENAME_OVERLAY if RENAME_OVERLAY is not None else RenameOverlay(virtual=dry_run)
+
+    dir_path = overlay.resolve(os.path.dirname(file_path))
     full_dir_components = dir_path.split(os.sep)
     #folder_conversion_stop_level = 6
     folder_conversion_stop_level = CONFIG_VALUES.get('folder_conversion_stop_level')
     
-    logging.info(f"Processing directory shorten process on: {dir_path} | dir_length: {len(dir_path)} | dir_length_threshold: {dir_length_threshold}")
-    print(f"Processing directory shorten process on: {dir_path} | dir_length: {len(dir_path)} | dir_length_threshold: {dir_length_threshold}")
+    logging.info(f"Processing directory shorten process on: {dir_path} | dir_length: {get_length(dir_path)} | dir_length_threshold: {dir_length_threshold}")
+    print(f"Processing directory shorten process on: {dir_path} | dir_length: {get_length(dir_path)} | dir_length_threshold: {dir_length_threshold}")
     
     print(f"Full directory components: {full_dir_components}")
     logging.info(f"Full directory components: {full_dir_components}")
@@ -373,50 +977,37 @@ def shorten_long_dir(file_path, if_use_regular_expression, dir_length_threshold,
         logging.info(f"Scanning directory: {current_dir}")
         print(f"Scanning directory: {current_dir}")
         
-        # Scan the parent directory for long sub-folders
-        with os.scandir(current_dir) as it:
-            for entry in it:
-                if entry.is_dir() and len(entry.path) > dir_length_threshold:
-                    sub_dir_path = entry.path
-                    sub_dir_path_components = sub_dir_path.split(os.sep)
-                    
-                    logging.info(f"Folder over threshold found: {sub_dir_path} | Length: {len(sub_dir_path)} | Threshold: {dir_length_threshold} | Attempting to shorten ...")
-                    
-                    # Process the long sub-folder
-                    sub_dir_components = [break_down_dir(component) for component in sub_dir_path.split(os.sep)]
-                    print(f"Directory components: {sub_dir_components}")
-                    
-                    if if_use_regular_expression:
-                        dir_path_regex = CONFIG_VALUES.get('dir_path_regex')
-                        print(f"Using regular expression to break down directory path: {sub_dir_path}")
-                        logging.info(f"Using regular expression to break down directory path: {sub_dir_path}")
-                        regex = re.compile(dir_path_regex)
-                        new_sub_dir_component = [regex.sub('', component) if len(component) > 3 else component for component in sub_dir_components[-1]]
-                    else:
-                        dictionary_path = os.path.join(CONFIG_VALUES.get('config_dir'), CONFIG_VALUES.get('dictionary_path'))
-                        print(f"Using default method to break down directory path: {dir_path}")
-                        logging.info(f"Using default method to break down directory path: {dir_path}")
-                        dictionary = load_dictionary(dictionary_path)
-                        new_sub_dir_component = [convert_components(component, dictionary) for component in sub_dir_components[-1]]
-                    
-                    print(f"Original Directory components: {sub_dir_components}")
-                    logging.info(f"Directory components: {sub_dir_components}")
-    
-                    print(f"New directory components: {new_sub_dir_component}")
-                    logging.info(f"New directory components: {new_sub_dir_component}")
-                    
-                    new_sub_dir_path = os.sep.join(sub_dir_path_components[:-1] + ['-'.join(new_sub_dir_component)])
-                    
-                    if  sub_dir_path == new_sub_dir_path:
-                        logging.info(f"No change for sub-folder: {sub_dir_path} | Moving one level up and continue the check ...")
-                        continue
-                    
-                    if dry_run:
-                        logging.info(f"Attempting to rename: {sub_dir_path} to {new_sub_dir_path}")
-                        long_dir_path_modified_output = CONFIG_VALUES.get('long_dir_path_modified_output')
-                        simulate_rename(sub_dir_path, new_sub_dir_path, long_dir_path_modified_output)
-                    else:
-                        rename_dir(sub_dir_path, new_sub_dir_path)
+        # Scan the parent directory for long sub-folders. The parent path is measured once, each sub-folder name once.
+        current_dir_length = get_length(current_dir)
+        for sub_dir_path in overlay.list_sub_dirs(current_dir):
+            parent_dir_path, sub_dir_name = sub_dir_path.rsplit(os.sep, 1)
+            sub_dir_length = current_dir_length + 1 + get_length(sub_dir_name)
+            if sub_dir_length > dir_length_threshold:
+                logging.info(f"Folder over threshold found: {sub_dir_path} | Length: {sub_dir_length} | Threshold: {dir_length_threshold} | Attempting to shorten ...")
+                
+                # Process the long sub-folder. The hash suffix of an earlier run is not converted again.
+                base_sub_dir_name, hash_suffix = split_hash_suffix(sub_dir_name, 'dir') if is_hash_naming_mode() else (sub_dir_name, '')
+                new_sub_dir_name = convert_name(base_sub_dir_name, 'dir', if_use_regular_expression)
+                
+                print(f"Folder name: {sub_dir_name} | New folder name: {new_sub_dir_name}")
+                logging.info(f"Folder name: {sub_dir_name} | New folder name: {new_sub_dir_name}")
+                
+                if  base_sub_dir_name == new_sub_dir_name:
+                    logging.info(f"No change for sub-folder: {sub_dir_path} | Moving one level up and continue the check ...")
+                    continue
+                
+                if is_hash_naming_mode():
+                    new_sub_dir_name = add_hash_suffix(new_sub_dir_name, sub_dir_path, 'dir', hash_suffix)
+                
+                new_sub_dir_path = parent_dir_path + os.sep + new_sub_dir_name
+                
+                if dry_run:
+                    logging.info(f"Attempting to rename: {sub_dir_path} to {new_sub_dir_path}")
+                    simulate_rename_dir(sub_dir_path, new_sub_dir_path, overlay)
+                else:
+                    renamed_dir_path = rename_dir(sub_dir_path, new_sub_dir_path)
+                    if renamed_dir_path is not None:
+                        overlay.record(sub_dir_path, renamed_dir_path)
 
 
 def rename_dir(old_dir_path, new_dir_path):
@@ -425,50 +1016,49 @@ def rename_dir(old_dir_path, new_dir_path):
 
     This function renames a directory from `old_dir_path` to `new_dir_path`. 
     If a directory with the new name already exists, it appends a number to the new name to avoid a naming conflict.
+    The target is checked before each attempt: on POSIX, a rename onto an empty folder silently replaces it, and one
+    onto a folder with contents fails with ENOTEMPTY rather than EEXIST. Conflicts are therefore resolved the same
+    way as in `simulate_rename_dir`, and a dry run reports the same operations.
     """
     
     long_dir_path_modified_output = CONFIG_VALUES.get('long_dir_path_modified_output')
     long_dir_path_modified_error = CONFIG_VALUES.get('long_dir_path_modified_error')
     output_dir = CONFIG_VALUES.get('output_dir')
     date_str = CONFIG_VALUES.get('date_str')
-    number_of_retry = CONFIG_VALUES.get('number_of_retry')
+    # Hash suffixed names are not expected to conflict, so there is nothing to retry
+    number_of_retry = 0 if is_hash_naming_mode() else CONFIG_VALUES.get('number_of_retry')
     
-    try:
-        os.rename(old_dir_path, new_dir_path)
-        logging.info(f"Renamed folder from '{old_dir_path}' to '{new_dir_path}'")
-        write_to_csv(f'{output_dir}/{long_dir_path_modified_output}_{date_str}.csv', [old_dir_path, new_dir_path])
-        return new_dir_path
-    except FileExistsError as e:
-        logging.warning(f"Directory already exists: {new_dir_path}")
-        
-        # A directory with the new name already exists, so append a number to the new name
-        for i in range(1, number_of_retry + 1):
-            try: 
-                new_dir_path_retry = f"{new_dir_path}_{i}"
-                os.rename(old_dir_path, new_dir_path_retry)
-                
-                logging.info(f"Renamed '{old_dir_path}' to '{new_dir_path_retry}'")
-                print(f"Renamed '{old_dir_path}' to '{new_dir_path}'")
-                write_to_csv(f'{output_dir}/{long_dir_path_modified_output}_{date_str}.csv', [old_dir_path, new_dir_path_retry])
-                return new_dir_path_retry
-            except FileExistsError:
-                continue
-                
-        logging.error(f"Failed to rename '{old_dir_path}' to '{new_dir_path}' after {number_of_retry} attempts")
-        write_to_csv(f'{output_dir}/{long_dir_path_modified_error}_{date_str}.csv', [new_dir_path, "Failed to rename after multiple attempts"])
-    except (OSError, PermissionError, Exception) as e:
-            logging.error(f"Failed to rename '{old_dir_path}' to '{new_dir_path}': {e}")
-            print(f"Failed to rename '{old_dir_path}' to '{new_dir_path}': {e}")
+    candidates = [new_dir_path] + [f"{new_dir_path}_{i}" for i in range(1, number_of_retry + 1)]
+    for candidate in candidates:
+        try:
+            with io_operation():
+                exists = path_exists(candidate, DIR_FD_CACHE)
+            if not exists:
+                with io_operation():
+                    rename_path(old_dir_path, candidate, DIR_FD_CACHE)
+                logging.info(f"Renamed folder from '{old_dir_path}' to '{candidate}'")
+                print(f"Renamed '{old_dir_path}' to '{candidate}'")
+                write_to_csv(f'{output_dir}/{long_dir_path_modified_output}_{date_str}.csv', [old_dir_path, candidate])
+                return candidate
+        except OSError as e:
+            # The target appeared after the check
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                logging.error(f"Failed to rename '{old_dir_path}' to '{candidate}': {e}")
+                print(f"Failed to rename '{old_dir_path}' to '{candidate}': {e}")
+                write_to_csv(f'{output_dir}/{long_dir_path_modified_error}_{date_str}.csv', [new_dir_path, str(e)])
+                return None
+        logging.warning(f"Directory already exists: {candidate}")
             
-            write_to_csv(f'{output_dir}/{long_dir_path_modified_error}_{date_str}.csv', [new_dir_path, str(e)])
-            return None
+    logging.error(f"Failed to rename '{old_dir_path}' to '{new_dir_path}' after {number_of_retry} attempts")
+    write_to_csv(f'{output_dir}/{long_dir_path_modified_error}_{date_str}.csv', [new_dir_path, "Failed to rename after multiple attempts"])
+    return None
 
 
 def handle_long_filename(file_path, long_filename_list_file):
     """ Checks if a filename exceeds a specified length and logs it if it does. """
     filename_length_threshold = CONFIG_VALUES.get('filename_length_threshold')
     
-    if len(os.path.basename(file_path)) >= filename_length_threshold:
+    if get_length(os.path.basename(file_path)) >= filename_length_threshold:
         logging.info(f"Found long filename: {os.path.basename(file_path)}")
         write_to_file(long_filename_list_file, file_path)
 
@@ -481,86 +1071,922 @@ def handle_long_dir_path(file_path, long_file_path_list_file):
     print(f"Dirname length: {len(os.path.dirname(file_path))}")
     
     dir_length_threshold = CONFIG_VALUES.get('dir_length_threshold')
+    dir_length = get_length(os.path.dirname(file_path))
     
-    if len(os.path.dirname(file_path)) >= dir_length_threshold:
-        logging.info(f"Found long directories path: {file_path} | Length: {len(os.path.dirname(file_path))} | Threshold: {dir_length_threshold}")
+    if dir_length >= dir_length_threshold:
+        logging.info(f"Found long directories path: {file_path} | Length: {dir_length} | Threshold: {dir_length_threshold}")
         write_to_file(long_file_path_list_file, file_path)
 
 
-def scan_long_paths_and_long_filename(base_dir, counters):
+# Serializes the part file counters and writes of concurrent scan workers
+SCAN_OUTPUT_LOCK = threading.Lock()
+
+
+def format_scan_record(file_path, file_stat):
+    """
+    Formats a scan output line with the metadata the rename phase uses to detect stale entries:
+    the path, then tab separated the entry type ('f' file, 'l' symlink), inode, size and mtime in nanoseconds.
+    """
+    entry_type = 'l' if stat.S_ISLNK(file_stat.st_mode) else 'f'
+    return f"{file_path}\t{entry_type}\t{file_stat.st_ino}\t{file_stat.st_size}\t{file_stat.st_mtime_ns}"
+
+
+def parse_scan_record(line):
+    """
+    Parses a scan output line into the path and a (type, inode, size, mtime_ns) tuple, or None for a bare path line.
+
+    The fields are split off from the right, so a tab in the path itself does not break the record.
+    """
+    line = line.rstrip('\r\n')
+    parts = line.rsplit('\t', 4)
+    if len(parts) == 5 and parts[1] in ('f', 'l') and all(part.isdigit() for part in parts[2:]):
+        return parts[0], (parts[1], int(parts[2]), int(parts[3]), int(parts[4]))
+    return line.strip(), None
+
+
+def format_queued_record(path, metadata):
+    """ Formats a record parsed by `parse_scan_record` back into a scan output line. """
+    return path if metadata is None else '\t'.join([path, *map(str, metadata)])
+
+
+def is_stale_scan_record(path, metadata):
+    """
+    Checks with a single lstat whether the entry at `path` is still the one the scan recorded.
+
+    Returns a reason if the path is gone or now holds another entry (different type or inode), else None.
+    A changed size or mtime only means the file was edited, which does not matter for renaming it, so it is logged.
+    Windows reports no inode during the scan (0), so only the type is compared there.
+    """
+    try:
+        with io_operation():
+            current_stat = lstat_path(path, DIR_FD_CACHE)
+    except FileNotFoundError:
+        return "Path no longer exists"
+    except OSError as e:
+        return f"Path cannot be checked: {e}"
+
+    entry_type, inode, size, mtime_ns = metadata
+    if ('l' if stat.S_ISLNK(current_stat.st_mode) else 'f') != entry_type or (inode and current_stat.st_ino != inode):
+        return "Path holds another entry than the scanned one"
+    if current_stat.st_size != size or current_stat.st_mtime_ns != mtime_ns:
+        logging.info(f"File changed since the scan: {path}")
+    return None
+
+
+# Open writers of the compressed part files of the current scan: part file path -> FrontCodedWriter
+SCAN_OUTPUT_WRITERS = {}
+
+
+def get_part_file_suffix():
+    return '.txt' if (CONFIG_VALUES.get('scan_output_format') or 'text') == 'text' else FRONT_CODED_SUFFIX
+
+
+def open_part_file_writer(part_file_path):
+    """ Opens a compressed part file writer with the configured codec and chunk size. """
+    return FrontCodedWriter(part_file_path, CONFIG_VALUES.get('scan_output_format'), CONFIG_VALUES.get('scan_output_chunk_size') or 4096)
+
+
+def close_scan_output_writers():
+    """ Writes the last chunk and the index of every compressed part file still open. """
+    with SCAN_OUTPUT_LOCK:
+        for writer in SCAN_OUTPUT_WRITERS.values():
+            writer.close()
+        SCAN_OUTPUT_WRITERS.clear()
+
+
+def write_scan_entry(scan_type, file_path, counters):
+    """
+    Appends a path (or a record formatted by `format_scan_record`) to the current part file of a scan output.
+
+    `scan_type` is 'filename' or 'dir'. A new part file is started every `scan_entry_threshold` entries.
+    With a compressed `scan_output_format`, the part file stays open and is written chunk by chunk (see `FrontCodedWriter`)
+    until the next part is started or `close_scan_output_writers` is called.
+    """
+    scan_entry_threshold = CONFIG_VALUES.get('scan_entry_threshold')
+    output_dir = CONFIG_VALUES.get('output_dir')
+    date_str = CONFIG_VALUES.get('date_str')
+    scan_dir = CONFIG_VALUES.get('filename_scan_dir' if scan_type == 'filename' else 'dir_scan_dir')
+    scan_output = CONFIG_VALUES.get('long_filename_scan_output' if scan_type == 'filename' else 'long_dir_path_scan_output')
+    shard_label = counters.get('shard_label', '')
+
+    part_file_prefix = f'{output_dir}/{scan_dir}/{scan_output}_{date_str}{shard_label}_part'
+    suffix = get_part_file_suffix()
+
+    with SCAN_OUTPUT_LOCK:
+        if counters[f'{scan_type}_counter'] >= scan_entry_threshold:
+            writer = SCAN_OUTPUT_WRITERS.pop(f'{part_file_prefix}{counters[f"{scan_type}_file_part"]}{suffix}', None)
+            if writer is not None:
+                writer.close()
+            counters[f'{scan_type}_file_part'] += 1
+            counters[f'{scan_type}_counter'] = 0
+        counters[f'{scan_type}_counter'] += 1
+        counters[f'{scan_type}_total'] = counters.get(f'{scan_type}_total', 0) + 1
+        part_file_path = f'{part_file_prefix}{counters[f"{scan_type}_file_part"]}{suffix}'
+        if suffix == FRONT_CODED_SUFFIX:
+            writer = SCAN_OUTPUT_WRITERS.get(part_file_path)
+            if writer is None:
+                writer = SCAN_OUTPUT_WRITERS[part_file_path] = open_part_file_writer(part_file_path)
+            writer.write(file_path)
+        else:
+            with open(part_file_path, 'a', encoding='utf-8') as scan_output_file:
+                write_to_file(scan_output_file, file_path)
+
+
+def record_scanned_file(file_path, dir_path, filename, counters, logged_dirs, filename_length=None, dir_length=None, get_stat=None):
+    """
+    Writes a scanned file to the scan output if its filename or its directory path is over threshold.
+
+    Long filenames go to the filename scan part files. For long directory paths, only the first file found
+    in each directory (tracked in `logged_dirs`) is written to the directory scan part files.
+    Lengths already measured by the caller can be passed in, so names are not measured twice.
+    With `get_stat`, a callable returning the file's lstat result, the file is written as a metadata record,
+    and the stat is only taken for files that are written.
+    """
+    filename_length_threshold = CONFIG_VALUES.get('filename_length_threshold')
+    dir_length_threshold = CONFIG_VALUES.get('dir_length_threshold')
+    filename_length = get_length(filename) if filename_length is None else filename_length
+    dir_length = get_length(dir_path) if dir_length is None else dir_length
+    is_long_filename = filename_length >= filename_length_threshold
+    is_long_dir_path = dir_length >= dir_length_threshold and dir_path not in logged_dirs
+
+    entry = file_path
+    if get_stat is not None and (is_long_filename or is_long_dir_path):
+        try:
+            entry = format_scan_record(file_path, get_stat())
+        except OSError as e:
+            logging.error(f"Failed to read metadata of: {file_path} | {e}")
+
+    if is_long_filename:
+        logging.info(f"Found long filename: {filename}")
+        write_scan_entry('filename', entry, counters)
+
+    if is_long_dir_path:
+        logged_dirs.add(dir_path)
+        logging.info(f"Found long directories path: {dir_path} | Length: {dir_length} | Threshold: {dir_length_threshold}")
+        write_scan_entry('dir', entry, counters)
+
+
+# Lengths of the sub-folders queued by the scan, measured while their parent is listed: path -> length
+SCAN_DIR_LENGTHS = {}
+
+# Folders whose listing stalled or failed with a transient error, retried at the end of the scan: path -> length
+SCAN_QUARANTINE = {}
+
+# Folders quarantined in the previous scan, listed once at the end of this one: path -> length
+SCAN_DEFERRED = {}
+
+# Guards the folder listings of the current scan with `scan_listing_timeout_seconds`. Set by `scan_long_paths_and_long_filename`.
+LISTING_WATCHDOG = None
+
+# (st_dev, st_ino) of the folders listed by the current scan, so each physical folder is listed once. Set by `scan_long_paths_and_long_filename`.
+SCAN_VISITED = None
+
+# Listing errors of unreachable network shares, which may clear up on a retry
+TRANSIENT_LISTING_ERRORS = {errno.ETIMEDOUT, errno.EIO, errno.EHOSTDOWN, errno.EHOSTUNREACH, errno.ENOTCONN, errno.ESTALE}
+
+
+def list_directory_entries(dir_path, fd_cache=None, visited=None, follow_links=True):
+    """
+    Lists a folder as (name, is_file, is_dir, DirEntry) tuples, relative to its cached handle when a cache is given.
+
+    Unless `follow_links`, symlinks and junctions to folders are not reported as folders, so they are not descended into.
+    With a `visited` set, returns the folder's (st_dev, st_ino) along with the entries, and None instead of the entries
+    if the folder was already listed under another path.
+    """
+    def read_entries(it):
+        return [(entry.name, entry.is_file(), entry.is_dir() and (follow_links or not is_link_entry(entry)), entry) for entry in it]
+
+    if fd_cache is not None:
+        with fd_cache.open(dir_path) as dir_fd:
+            dir_key = None
+            if visited is not None:
+                dir_stat = os.fstat(dir_fd)
+                dir_key = (dir_stat.st_dev, dir_stat.st_ino)
+                if dir_key in visited:
+                    return dir_key, None
+            with os.scandir(dir_fd) as it:
+                return dir_key, read_entries(it)
+
+    dir_key = None
+    if visited is not None:
+        dir_stat = os.stat(dir_path)
+        dir_key = (dir_stat.st_dev, dir_stat.st_ino)
+        if dir_key in visited:
+            return dir_key, None
+    with os.scandir(dir_path) as it:
+        return dir_key, read_entries(it)
+
+
+def report_alias_dir(dir_path, dir_key):
+    """ Records a folder path that leads to a folder already listed under another path (a link, junction or bind mount). """
+    output_dir = CONFIG_VALUES.get('output_dir')
+    scan_alias_output = CONFIG_VALUES.get('scan_alias_output')
+    date_str = CONFIG_VALUES.get('date_str')
+    logging.info(f"Skipping folder already scanned under another path: {dir_path} | Device: {dir_key[0]} | Inode: {dir_key[1]}")
+    write_to_csv(f'{output_dir}/{scan_alias_output}_{date_str}.csv', [os.fsdecode(dir_path), dir_key[0], dir_key[1]])
+
+
+def quarantine_dir(dir_path, dir_length, reason):
+    """ Sets a folder aside for the retries at the end of the scan, and records it in the quarantine output. """
+    SCAN_QUARANTINE[dir_path] = dir_length
+    output_dir = CONFIG_VALUES.get('output_dir')
+    scan_quarantine_output = CONFIG_VALUES.get('scan_quarantine_output')
+    date_str = CONFIG_VALUES.get('date_str')
+    logging.error(f"Quarantined folder: {dir_path} | {reason}")
+    write_to_csv(f'{output_dir}/{scan_quarantine_output}_{date_str}.csv', [os.fsdecode(dir_path), reason])
+
+
+def scan_directory(dir_path, counters, fd_cache=None, record_files=True, scan_filter=None, dir_index=None):
+    """
+    Lists a single directory, records its long entries and returns the paths of its sub-folders.
+
+    With a directory handle cache, the directory is opened relative to its nearest cached ancestor, so the kernel
+    only resolves one path component per call and the length of `dir_path` is never limited by PATH_MAX.
+    Without one, the full path is passed to the OS.
+
+    With a scan filter, excluded files are not recorded and excluded sub-folders are not returned, so they are never listed.
+    With a directory index, the folder's files are recorded in the index and sub-folders it can prune are not returned either.
+
+    Lengths are measured in the configured `length_unit`. Each entry name is measured once, and the length of a
+    sub-folder path is its parent's length plus its name's, kept in SCAN_DIR_LENGTHS until it is listed.
+
+    With `scan_metadata`, recorded files carry their type, inode, size and mtime. Without a handle cache (Windows),
+    they come from the stat cached in the DirEntry; otherwise a single lstat relative to the folder's handle is taken.
+
+    A listing that stalls past the watchdog timeout, or fails with a transient network error, puts the folder in
+    SCAN_QUARANTINE instead, see `retry_quarantined_dirs`.
+
+    Each physical folder is listed once: a folder whose (st_dev, st_ino) is already in SCAN_VISITED is reported
+    as an alias and not descended into. Folder links are only followed with `follow_links`.
+    """
+    logged_dirs = set()
+    sub_dir_paths = []
+    dir_length = SCAN_DIR_LENGTHS.pop(dir_path, None)
+    if dir_length is None:
+        dir_length = get_length(dir_path)
+
+    try:
+        follow_links = CONFIG_VALUES.get('follow_links')
+        with io_operation():
+            if LISTING_WATCHDOG is not None:
+                dir_key, entries = LISTING_WATCHDOG.call(list_directory_entries, dir_path, fd_cache, SCAN_VISITED, follow_links)
+            else:
+                dir_key, entries = list_directory_entries(dir_path, fd_cache, SCAN_VISITED, follow_links)
+    except ListingTimeout as e:
+        quarantine_dir(dir_path, dir_length, f"Listing stalled: {e}")
+        return sub_dir_paths
+    except OSError as e:
+        if e.errno in TRANSIENT_LISTING_ERRORS:
+            quarantine_dir(dir_path, dir_length, f"Listing failed: {e}")
+        else:
+            logging.error(f"Failed to scan directory: {dir_path} | {e}")
+        return sub_dir_paths
+
+    # The folder is only marked as visited once it was listed, so a quarantined folder is not taken for an alias on its retry.
+    # Two paths to one folder listed at the same time are both listed, and the second one is still reported.
+    if dir_key is not None and (entries is None or not SCAN_VISITED.add(*dir_key)):
+        report_alias_dir(dir_path, dir_key)
+        return sub_dir_paths
+
+    has_files = False
+    max_filename_length = 0
+    sub_dir_lengths = {}
+    scan_metadata = CONFIG_VALUES.get('scan_metadata')
+    for name, is_file, is_dir, entry in entries:
+        if is_file:
+            file_path = dir_path + os.sep + name
+            if scan_filter is None or scan_filter.allows_file(file_path, dir_path):
+                filename_length = get_length(name)
+                has_files = True
+                max_filename_length = max(max_filename_length, filename_length)
+                if record_files:
+                    get_stat = None
+                    if scan_metadata:
+                        get_stat = (lambda entry=entry: entry.stat(follow_symlinks=False)) if fd_cache is None else (lambda file_path=file_path: lstat_path(file_path, fd_cache))
+                    record_scanned_file(file_path, dir_path, name, counters, logged_dirs, filename_length, dir_length, get_stat)
+        elif is_dir:
+            sub_dir_path = dir_path + os.sep + name
+            if scan_filter is None or scan_filter.allows_dir(sub_dir_path):
+                sub_dir_paths.append(sub_dir_path)
+                sub_dir_lengths[sub_dir_path] = dir_length + 1 + get_length(name)
+
+    if dir_index is not None:
+        dir_index.record(dir_path, has_files, max_filename_length, dir_length)
+        dir_length_threshold = CONFIG_VALUES.get('dir_length_threshold')
+        filename_length_threshold = CONFIG_VALUES.get('filename_length_threshold')
+        sub_dir_paths = [sub_dir_path for sub_dir_path in sub_dir_paths if not dir_index.can_prune(sub_dir_path, dir_length_threshold, filename_length_threshold)]
+
+        # Folders that stalled in the previous scan are only listed once the rest of the tree is done
+        for sub_dir_path in sub_dir_paths:
+            if dir_index.was_quarantined(sub_dir_path):
+                logging.info(f"Deferring folder quarantined in the previous scan: {sub_dir_path}")
+                SCAN_DEFERRED[sub_dir_path] = sub_dir_lengths[sub_dir_path]
+        sub_dir_paths = [sub_dir_path for sub_dir_path in sub_dir_paths if sub_dir_path not in SCAN_DEFERRED]
+
+    for sub_dir_path in sub_dir_paths:
+        SCAN_DIR_LENGTHS[sub_dir_path] = sub_dir_lengths[sub_dir_path]
+    return sub_dir_paths
+
+
+def parse_shard(value):
+    """ Parses a '--shard i/N' argument into a (shard index, shard count) tuple, with 1 <= i <= N. """
+    try:
+        shard_index, shard_count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{value}'. Expected the form i/N, e.g. 1/4.")
+    if shard_count < 1 or not 1 <= shard_index <= shard_count:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{value}'. The shard index must be between 1 and {shard_count}.")
+    return shard_index, shard_count
+
+
+def is_in_shard(sub_dir_path, shard):
+    """
+    Checks if a top-level sub-folder of the base directory belongs to a shard.
+
+    The partition uses the CRC32 of the folder name, so every host computes the same assignment.
+    """
+    shard_index, shard_count = shard
+    name = os.path.basename(sub_dir_path)
+    return zlib.crc32(name.encode('utf-8', 'surrogateescape')) % shard_count == shard_index - 1
+
+
+def get_shard_label(shard):
+    """ Returns the part file name fragment that keeps the output of each shard apart. """
+    return f"_shard{shard[0]}of{shard[1]}" if shard is not None else ''
+
+
+def scan_tree(base_dir, counters, fd_cache=None, shard=None, scan_filter=None, dir_index=None):
+    """
+    Scans a directory tree depth first, on `scan_workers` threads when configured.
+
+    With a shard, only the top-level sub-folders assigned to it are descended into, and the files directly
+    under the base directory are only recorded by the first shard.
+    """
+    record_base_files = shard is None or shard[0] == 1
+    sub_dir_paths = scan_directory(base_dir, counters, fd_cache, record_base_files, scan_filter, dir_index)
+    if shard is not None:
+        for sub_dir_path in sub_dir_paths:
+            if not is_in_shard(sub_dir_path, shard):
+                SCAN_DIR_LENGTHS.pop(sub_dir_path, None)
+        sub_dir_paths = [sub_dir_path for sub_dir_path in sub_dir_paths if is_in_shard(sub_dir_path, shard)]
+
+    scan_subtrees(sub_dir_paths, counters, fd_cache, scan_filter, dir_index)
+
+
+def scan_subtrees(dir_paths, counters, fd_cache=None, scan_filter=None, dir_index=None, label="Scan"):
+    """ Scans the folders and everything beneath them, on `scan_workers` threads when configured. """
+    scan_workers = CONFIG_VALUES.get('scan_workers') or 1
+    if scan_workers > 1:
+        # Every sub-folder becomes a task, so skewed trees are spread over all workers
+        scheduler = WorkStealingScheduler(scan_workers, lambda dir_path: scan_directory(dir_path, counters, fd_cache, True, scan_filter, dir_index))
+        log_scheduler_stats(label, scheduler.run(dir_paths))
+        return
+
+    pending = list(reversed(dir_paths))
+    while pending:
+        dir_path = pending.pop()
+        pending.extend(reversed(scan_directory(dir_path, counters, fd_cache, True, scan_filter, dir_index)))
+
+
+def scan_long_paths_and_long_filename(base_dir, counters, shard=None):
     """
     Scans a directory for files with long paths or filenames.
 
-    This function recursively scans all files in a directory and its subdirectories. 
+    This function scans all files in a directory and its subdirectories. 
     If it finds a file with a path length >= `dir_length_threshold` or a filename length >= to `filename_length_threshold`, 
     it logs the file and writes its path to a specified file.
+
+    The long path strategy depends on the platform: on Windows the base directory gets the extended-length prefix,
+    on POSIX the tree is traversed relative to open directory file descriptors when the Python version allows it.
+
+    The exclude/include patterns and depth limits of the config are applied while walking, see `ScanFilter`.
+    With `scan_pruning`, subtrees the directory index of the previous scans shows to be short are skipped, see `DirectoryIndex`.
     """
     base_dir = os.path.abspath(base_dir)
     print(f"Scanning base directory: {base_dir}")
     
-    if base_dir.startswith('\\') is False:
-        long_base_dir = "\\\\?\\" + base_dir
+    long_base_dir = to_long_path(base_dir)
+    if not isinstance(long_base_dir, bytes):
         print(f"Modified base directory: {long_base_dir}")
-    else:
-        long_base_dir = base_dir
-        
-    filename_length_threshold = CONFIG_VALUES.get('filename_length_threshold')
-    dir_length_threshold = CONFIG_VALUES.get('dir_length_threshold')
-    scan_entry_threshold = CONFIG_VALUES.get('scan_entry_threshold')
+        base_dir = long_base_dir
+
+    fd_cache = DIR_FD_CACHE if isinstance(long_base_dir, bytes) else None
+    scan_filter, dir_index = open_scan(base_dir, shard)
+    start_scan_guards()
+    scan_tree(base_dir, counters, fd_cache, shard, scan_filter, dir_index)
+    close_scan(counters, fd_cache, scan_filter, dir_index, shard)
+    close_scan_output_writers()
+
+
+def open_scan(base_dir, shard=None):
+    """ Builds the scan filter of a base directory and loads its directory index. Either is None when not configured. """
+    scan_filter = ScanFilter.from_config(base_dir, CONFIG_VALUES)
+    if not scan_filter.is_active():
+        scan_filter = None
+
+    dir_index = None
+    if CONFIG_VALUES.get('scan_pruning'):
+        dir_index = DirectoryIndex(CONFIG_VALUES.get('prune_revalidate_days') * 24 * 3600, CONFIG_VALUES.get('prune_margin'))
+        dir_index.load(get_dir_index_path(shard))
+    return scan_filter, dir_index
+
+
+def start_scan_guards():
+    """ Starts the listing watchdog and the set of visited folders for a new scan. """
+    global LISTING_WATCHDOG, SCAN_VISITED
+    listing_timeout = CONFIG_VALUES.get('scan_listing_timeout_seconds')
+    LISTING_WATCHDOG = Watchdog(listing_timeout) if listing_timeout else None
+    SCAN_VISITED = InodeSet()
+
+
+def close_scan(counters, fd_cache=None, scan_filter=None, dir_index=None, shard=None):
+    """ Retries the quarantined folders and saves the directory index. Returns the number of folders given up on. """
+    given_up = retry_quarantined_dirs(counters, fd_cache, scan_filter, dir_index)
+
+    if dir_index is not None:
+        logging.info(f"Subtrees pruned with the directory index: {dir_index.pruned}")
+        print(f"Subtrees pruned with the directory index: {dir_index.pruned}")
+        try:
+            dir_index.save(get_dir_index_path(shard))
+        except OSError as e:
+            logging.error(f"Failed to save the directory index: {e}")
+    return given_up
+
+
+def retry_quarantined_dirs(counters, fd_cache=None, scan_filter=None, dir_index=None):
+    """
+    Scans the quarantined folders again once the rest of the tree is done, up to `scan_retry_attempts` times.
+
+    The folders deferred because the previous scan quarantined them are listed first, once and without waiting,
+    as they have not failed in this scan. Those that fail now join the quarantine.
+    Each retry round waits twice as long as the previous one, starting at `scan_retry_backoff_seconds`, to give a volume
+    time to come back. Folders that still fail are written to the quarantine output and the directory index.
+    Returns the number of folders given up on.
+    """
+    retry_attempts = CONFIG_VALUES.get('scan_retry_attempts') or 0
+    backoff_seconds = CONFIG_VALUES.get('scan_retry_backoff_seconds') or 0
+
+    if SCAN_DEFERRED:
+        logging.info(f"Scanning {len(SCAN_DEFERRED)} folders quarantined in the previous scan")
+        print(f"Scanning {len(SCAN_DEFERRED)} folders quarantined in the previous scan")
+        dir_paths = list(SCAN_DEFERRED)
+        for dir_path in dir_paths:
+            SCAN_DIR_LENGTHS[dir_path] = SCAN_DEFERRED.pop(dir_path)
+        scan_subtrees(dir_paths, counters, fd_cache, scan_filter, dir_index, label="Deferred folders")
+
+    for attempt in range(1, retry_attempts + 1):
+        if not SCAN_QUARANTINE:
+            return 0
+        delay = backoff_seconds * 2 ** (attempt - 1)
+        logging.info(f"Retrying {len(SCAN_QUARANTINE)} quarantined folders in {delay}s | Attempt {attempt} of {retry_attempts}")
+        print(f"Retrying {len(SCAN_QUARANTINE)} quarantined folders in {delay}s | Attempt {attempt} of {retry_attempts}")
+        time.sleep(delay)
+
+        dir_paths = list(SCAN_QUARANTINE)
+        for dir_path in dir_paths:
+            SCAN_DIR_LENGTHS[dir_path] = SCAN_QUARANTINE.pop(dir_path)
+        scan_subtrees(dir_paths, counters, fd_cache, scan_filter, dir_index, label=f"Quarantine retry {attempt}")
+
     output_dir = CONFIG_VALUES.get('output_dir')
-    filename_scan_dir = CONFIG_VALUES.get('filename_scan_dir')
-    long_filename_scan_output = CONFIG_VALUES.get('long_filename_scan_output')
-    dir_scan_dir = CONFIG_VALUES.get('dir_scan_dir')
-    long_dir_path_scan_output = CONFIG_VALUES.get('long_dir_path_scan_output')
+    scan_quarantine_output = CONFIG_VALUES.get('scan_quarantine_output')
     date_str = CONFIG_VALUES.get('date_str')
+    for dir_path in SCAN_QUARANTINE:
+        logging.error(f"Gave up on quarantined folder: {dir_path}")
+        write_to_csv(f'{output_dir}/{scan_quarantine_output}_{date_str}.csv', [os.fsdecode(dir_path), f"Gave up after {retry_attempts} retries"])
+        if dir_index is not None:
+            dir_index.quarantine(dir_path)
+    given_up = len(SCAN_QUARANTINE)
+    if given_up:
+        print(f"Folders that could not be scanned: {given_up} | See {scan_quarantine_output}_{date_str}.csv")
+    SCAN_QUARANTINE.clear()
+    return given_up
+
+
+def get_dir_index_path(shard=None):
+    """
+    Returns the path of the directory index in the output folder.
 
-    logged_dirs = set()
-    
-    for entry in os.scandir(long_base_dir):
-        if entry.is_file():
-            file_path = entry.path
-            
-            if len(os.path.basename(file_path)) >= filename_length_threshold:
-                if counters['filename_counter'] >= scan_entry_threshold:
-                    counters['filename_file_part'] += 1
-                    counters['filename_counter'] = 0
-                counters['filename_counter'] += 1
-                with open(f'{output_dir}/{filename_scan_dir}/{long_filename_scan_output}_{date_str}_part{counters["filename_file_part"]}.txt', 'a', encoding='utf-8') as long_filename_list_file:
-                    logging.info(f"Found long filename: {os.path.basename(file_path)}")
-                    write_to_file(long_filename_list_file, file_path)
-
-            dir_path = os.path.dirname(file_path)
-            if len(dir_path) >= dir_length_threshold and dir_path not in logged_dirs:
-                logged_dirs.add(dir_path)
-                if counters['dir_counter'] >= scan_entry_threshold:
-                    counters['dir_file_part'] += 1
-                    counters['dir_counter'] = 0
-                counters['dir_counter'] += 1
-                with open(f'{output_dir}/{dir_scan_dir}/{long_dir_path_scan_output}_{date_str}_part{counters["dir_file_part"]}.txt', 'a', encoding='utf-8') as long_file_path_list_file:
-                    logging.info(f"Found long directories path: {dir_path} | Length: {len(os.path.dirname(file_path))} | Threshold: {dir_length_threshold}")
-                    write_to_file(long_file_path_list_file, file_path)
-                
-        elif entry.is_dir():
-            scan_long_paths_and_long_filename(entry.path, counters)
+    Each shard keeps its own index, and so does each `length_unit` other than chars, since the lengths differ.
+    """
+    name, ext = os.path.splitext(CONFIG_VALUES.get('dir_index_file'))
+    length_unit = CONFIG_VALUES.get('length_unit') or 'chars'
+    unit_label = f"_{length_unit}" if length_unit != 'chars' else ''
+    return os.path.join(CONFIG_VALUES.get('output_dir'), f"{name}{get_shard_label(shard)}{unit_label}{ext}")
 
 
-def process_scan():
+def process_scan(shard=None):
     """
     Process the scan for long paths and long filenames.
 
     This function checks if long path support is enabled. If it is enabled, it logs a message to disable it.
     If long path support is disabled, it scans for long paths and long filenames using the BASE_DIR as the starting point.
+    With a shard, only its part of the base directory is scanned and the output goes to shard part files (see `merge_shard_scan_outputs`).
     """
     base_dir = CONFIG_VALUES.get('base_dir')
     
-    counters = {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1}
-    scan_long_paths_and_long_filename(base_dir, counters)
-    
+    counters = {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1, 'shard_label': get_shard_label(shard)}
+    if shard is not None:
+        logging.info(f"Scanning shard {shard[0]} of {shard[1]}")
+        print(f"Scanning shard {shard[0]} of {shard[1]}")
+    scan_long_paths_and_long_filename(base_dir, counters, shard)
+    close_dir_fd_cache()
+    log_io_throttle_stats("Scan")
+
+
+def get_root_overrides(root):
+    """ Returns the config overrides of a root: its base directory and thresholds, and its own folder for all outputs. """
+    return {
+        'base_dir': root['base_dir'],
+        'output_dir': os.path.join(CONFIG_VALUES.get('output_dir'), root['name']),
+        'filename_length_threshold': root['filename_length_threshold'],
+        'dir_length_threshold': root['dir_length_threshold'],
+        'folder_conversion_stop_level': root['folder_conversion_stop_level'],
+    }
+
+
+def process_scan_roots(roots):
+    """
+    Scans several base directories concurrently, each with its own thresholds and output folder (see `get_root_overrides`).
+
+    Every folder of every root is a task of one shared pool of `scan_workers` threads, so the large shares keep all
+    workers busy once the small ones are done. Each task runs under the config overrides of its root.
+    Folders reached through more than one root are listed once. The quarantined folders of each root are retried
+    once all roots are scanned, then a summary of all roots is printed and written to the scan summary CSV.
+    """
+    start_scan_guards()
+    root_scans = []
+    for root in roots:
+        overrides = get_root_overrides(root)
+        with CONFIG_VALUES.override(overrides):
+            check_and_create_dirs(CONFIG_VALUES)
+            base_dir = os.path.abspath(root['base_dir'])
+            long_base_dir = to_long_path(base_dir)
+            if not isinstance(long_base_dir, bytes):
+                base_dir = long_base_dir
+            scan_filter, dir_index = open_scan(base_dir)
+        root_scans.append({
+            'root': root, 'overrides': overrides, 'base_dir': base_dir, 'scan_filter': scan_filter, 'dir_index': dir_index,
+            'fd_cache': DIR_FD_CACHE if isinstance(long_base_dir, bytes) else None,
+            'counters': {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1},
+        })
+        logging.info(f"Scanning root '{root['name']}': {base_dir}")
+        print(f"Scanning root '{root['name']}': {base_dir}")
+
+    def scan_root_folder(task):
+        root_scan, dir_path = task
+        with CONFIG_VALUES.override(root_scan['overrides']):
+            sub_dir_paths = scan_directory(dir_path, root_scan['counters'], root_scan['fd_cache'], True, root_scan['scan_filter'], root_scan['dir_index'])
+        return [(root_scan, sub_dir_path) for sub_dir_path in sub_dir_paths]
+
+    stats = WorkStealingScheduler(CONFIG_VALUES.get('scan_workers') or 1, scan_root_folder).run([(root_scan, root_scan['base_dir']) for root_scan in root_scans])
+    log_scheduler_stats("Scan of all roots", stats)
+
+    # Quarantined and deferred folders are retried root by root, with only the root's own folders in the quarantine
+    quarantine, deferred = dict(SCAN_QUARANTINE), dict(SCAN_DEFERRED)
+    summary = []
+    for root_scan in root_scans:
+        base_dir = root_scan['base_dir']
+        for folders, all_folders in [(SCAN_QUARANTINE, quarantine), (SCAN_DEFERRED, deferred)]:
+            folders.clear()
+            folders.update({dir_path: length for dir_path, length in all_folders.items() if dir_path == base_dir or dir_path.startswith(base_dir + os.sep)})
+        with CONFIG_VALUES.override(root_scan['overrides']):
+            given_up = close_scan(root_scan['counters'], root_scan['fd_cache'], root_scan['scan_filter'], root_scan['dir_index'])
+        counters = root_scan['counters']
+        summary.append([root_scan['root']['name'], root_scan['root']['base_dir'], counters.get('filename_total', 0), counters.get('dir_total', 0), given_up])
+
+    close_scan_output_writers()
+    write_scan_summary(summary)
+
+
+def write_scan_summary(summary):
+    """ Prints the per-root scan results and a total, and writes them to the scan summary CSV of the run. """
+    header = ['root', 'base_dir', 'long_filenames', 'long_dir_paths', 'folders_not_scanned']
+    total = ['TOTAL', '', sum(row[2] for row in summary), sum(row[3] for row in summary), sum(row[4] for row in summary)]
+    summary_file_path = f"{CONFIG_VALUES.get('output_dir')}/scan_summary_{CONFIG_VALUES.get('date_str')}.csv"
+    with open(summary_file_path, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows([header] + summary + [total])
+
+    for name, base_dir, long_filenames, long_dir_paths, folders_not_scanned in summary + [total]:
+        logging.info(f"Scan summary | Root: {name} | Long filenames: {long_filenames} | Long directory paths: {long_dir_paths} | Folders not scanned: {folders_not_scanned}")
+        print(f"Scan summary | Root: {name} | Long filenames: {long_filenames} | Long directory paths: {long_dir_paths} | Folders not scanned: {folders_not_scanned}")
+
+
+def iter_first_per_key(lines, key):
+    """ Yields the first of each run of sorted lines that share a key. """
+    previous = None
+    for line in lines:
+        line_key = key(line)
+        if line_key != previous:
+            yield line
+            previous = line_key
+
+
+def iter_merged_scan_lines(shard_files, dedup_by_dir, run_dir, chunk_size):
+    """
+    Yields the lines of the shard part files sorted, once per path, sorted externally in chunks of `chunk_size` lines.
+
+    A scan record sorts right after its bare path, as the tab before its fields sorts before any printable character.
+    A path recorded by two runs of a shard is kept once, with either record. With `dedup_by_dir`, only the first
+    path of each directory is kept: the lines are sorted by directory first (the directory and the line are joined
+    with a NUL, which no path contains), then the kept lines are sorted again.
+    """
+    shard_lines = (line for shard_file in shard_files for line in read_lines(shard_file) if line.strip())
+    if not dedup_by_dir:
+        yield from iter_first_per_key(external_sort(shard_lines, run_dir, chunk_size), lambda line: parse_scan_record(line)[0])
+        return
+
+    keyed_lines = (f"{os.path.dirname(parse_scan_record(line)[0])}\0{line}" for line in shard_lines)
+    first_per_dir = iter_first_per_key(external_sort(keyed_lines, run_dir, chunk_size), lambda keyed_line: keyed_line.split('\0', 1)[0])
+    yield from external_sort((keyed_line.split('\0', 1)[1] for keyed_line in first_per_dir), run_dir, chunk_size)
+
+
+def merge_shard_scan_outputs():
+    """
+    Merges the shard scan outputs of the day into the regular part files read by `-p dir` and `-p filename`.
+
+    Paths are sorted and duplicates are dropped. For the directory scan output, each long directory is kept once
+    across all shards, so re-running a shard or merging overlapping shards does not queue a directory twice.
+    The shard outputs are sorted externally in chunks of `diff_sort_chunk_size` lines, like `-p diff` does,
+    and the part files are written as the merged lines come in. Existing merged part files of the day are replaced.
+    """
+    output_dir = CONFIG_VALUES.get('output_dir')
+    scan_entry_threshold = CONFIG_VALUES.get('scan_entry_threshold')
+    date_str = CONFIG_VALUES.get('date_str')
+    chunk_size = CONFIG_VALUES.get('diff_sort_chunk_size')
+    scan_outputs = [
+        (CONFIG_VALUES.get('dir_scan_dir'), CONFIG_VALUES.get('long_dir_path_scan_output'), True),
+        (CONFIG_VALUES.get('filename_scan_dir'), CONFIG_VALUES.get('long_filename_scan_output'), False),
+    ]
+
+    for scan_dir, scan_output, dedup_by_dir in scan_outputs:
+        shard_files = sorted(glob.glob(os.path.join(output_dir, scan_dir, f"{scan_output}_{date_str}_shard*_part*")))
+
+        for old_part_file in glob.glob(os.path.join(output_dir, scan_dir, f"{scan_output}_{date_str}_part*")):
+            logging.info(f"Replacing merged part file: {old_part_file}")
+            os.remove(old_part_file)
+
+        suffix = get_part_file_suffix()
+        merged_count = 0
+        part_file = None
+        with tempfile.TemporaryDirectory(dir=output_dir) as run_dir:
+            try:
+                for line in iter_merged_scan_lines(shard_files, dedup_by_dir, run_dir, chunk_size):
+                    if merged_count % scan_entry_threshold == 0:
+                        if part_file is not None:
+                            part_file.close()
+                        part_number = merged_count // scan_entry_threshold + 1
+                        part_file_path = os.path.join(output_dir, scan_dir, f"{scan_output}_{date_str}_part{part_number}{suffix}")
+                        if suffix == FRONT_CODED_SUFFIX:
+                            part_file = open_part_file_writer(part_file_path)
+                        else:
+                            part_file = open(part_file_path, 'w', encoding='utf-8')
+                    if suffix == FRONT_CODED_SUFFIX:
+                        part_file.write(line)
+                    else:
+                        write_to_file(part_file, line)
+                    merged_count += 1
+            finally:
+                if part_file is not None:
+                    part_file.close()
+
+        logging.info(f"Merged {len(shard_files)} shard part files into {merged_count} entries for: {scan_output}")
+        print(f"Merged {len(shard_files)} shard part files into {merged_count} entries for: {scan_output}")
+
+
+# Shortest abbreviation proposed by `-p build-dictionary`
+MIN_ABBREVIATION_LENGTH = 3
+
 
-def process_dir_or_filename(process_type):
+def propose_abbreviation(token, taken):
+    """
+    Proposes an abbreviation for a token: its shortest prefix of at least MIN_ABBREVIATION_LENGTH characters that
+    does not end in a vowel and is not in `taken` (lowercase), e.g. 'production' -> 'prod', 'document' -> 'doc'.
+    Returns None if every such prefix is taken, or the prefix would save less than two characters.
+    """
+    for length in range(MIN_ABBREVIATION_LENGTH, len(token) - 1):
+        prefix = token[:length]
+        if prefix[-1].lower() not in 'aeiou' and prefix.lower() not in taken:
+            return prefix
+    return None
+
+
+def get_scanned_base_dir(base_dir):
+    """ Returns the base directory as the scan output paths start with it: absolute, with the extended-length prefix on Windows. """
+    base_dir = os.path.abspath(base_dir)
+    long_base_dir = to_long_path(base_dir)
+    return base_dir if isinstance(long_base_dir, bytes) else long_base_dir
+
+
+def iter_scan_name_tokens(dir_records, filename_records, base_dir, run_dir, chunk_size=100000):
+    """
+    Yields the tokens of the names in the scan outputs: the folder names of the directory scan records, broken down
+    with `break_down_dir`, and the filenames of the filename scan records, broken down with `break_down_filename`
+    without their extension.
+
+    The scan workers write their records interleaved, so the folder paths below `base_dir` are first sorted externally
+    (see `external_sort`, with run files in `run_dir`). A folder's sub-folders then follow it, and each folder is
+    counted once: the folders a path shares with the previous one are skipped.
+    """
+    base_dirs = [get_scanned_base_dir(base_dir), os.path.abspath(base_dir)]
+
+    def relative_dir_paths():
+        for path, _ in dir_records:
+            dir_path = os.path.dirname(path)
+            for prefix in base_dirs:
+                if dir_path == prefix or dir_path.startswith(prefix.rstrip(os.sep) + os.sep):
+                    dir_path = dir_path[len(prefix):]
+                    break
+            # With a trailing separator, the paths below a folder sort together, before its siblings with longer names
+            yield dir_path.strip(os.sep) + os.sep
+
+    previous_folders = []
+    for dir_path in external_sort(relative_dir_paths(), run_dir, chunk_size):
+        folders = [folder for folder in dir_path.split(os.sep) if folder]
+        shared = 0
+        while shared < min(len(folders), len(previous_folders)) and folders[shared] == previous_folders[shared]:
+            shared += 1
+        for folder in folders[shared:]:
+            yield from break_down_dir(folder)
+        previous_folders = folders
+
+    for path, _ in filename_records:
+        name = os.path.basename(path)
+        components = break_down_filename(name)
+        if get_extension(name):
+            components = components[:-1]
+        yield from components
+
+
+def process_build_dictionary():
+    """
+    Proposes abbreviation dictionary entries from the scan outputs of the run.
+
+    Token frequencies are counted in a count-min sketch of fixed size, so millions of names fit in a few megabytes,
+    and only the `dictionary_candidates` tokens with the most estimated characters saved are tracked at any time.
+    Tokens already in the dictionary, shorter than `dictionary_min_token_length` or not purely alphabetic are left out.
+    The proposals are written to `proposed_dictionary_output` in the output folder, highest savings first, in the
+    dictionary format followed by the estimated count and characters saved, for review before they are merged into it.
+    """
+    output_dir = CONFIG_VALUES.get('output_dir')
+    date_str = CONFIG_VALUES.get('date_str')
+    min_token_length = CONFIG_VALUES.get('dictionary_min_token_length')
+    try:
+        dictionary, _ = get_dictionary()
+    except (FileNotFoundError, ValueError):
+        dictionary = {}
+
+    part_files = {}
+    for process_type, scan_dir, scan_output in [('dir', 'dir_scan_dir', 'long_dir_path_scan_output'),
+                                                ('filename', 'filename_scan_dir', 'long_filename_scan_output')]:
+        file_pattern = f"{CONFIG_VALUES.get(scan_output)}_{date_str}_part*"
+        part_files[process_type] = sorted(glob.glob(os.path.join(output_dir, CONFIG_VALUES.get(scan_dir), file_pattern)))
+
+    sketch = CountMinSketch(CONFIG_VALUES.get('dictionary_sketch_width'), CONFIG_VALUES.get('dictionary_sketch_depth'))
+    candidates = HeavyHitters(CONFIG_VALUES.get('dictionary_candidates'))
+    with tempfile.TemporaryDirectory(dir=output_dir) as run_dir:
+        tokens = iter_scan_name_tokens(read_queued_records(part_files['dir']), read_queued_records(part_files['filename']),
+                                       CONFIG_VALUES.get('base_dir'), run_dir, CONFIG_VALUES.get('diff_sort_chunk_size'))
+        for token in tokens:
+            if len(token) < min_token_length or not token.isalpha() or token in dictionary:
+                continue
+            count = sketch.add(token)
+            candidates.update(token, count * (get_length(token) - MIN_ABBREVIATION_LENGTH))
+
+    # The most valuable tokens pick their abbreviations first, so they get the shortest ones
+    taken = {abbreviation.lower() for abbreviation in dictionary.values()}
+    proposals = []
+    for token, _ in candidates.top():
+        abbreviation = propose_abbreviation(token, taken)
+        if abbreviation is None:
+            continue
+        taken.add(abbreviation.lower())
+        count = sketch.estimate(token)
+        proposals.append((token, abbreviation, count, count * (get_length(token) - get_length(abbreviation))))
+    proposals.sort(key=lambda proposal: proposal[3], reverse=True)
+
+    proposed_file_path = os.path.join(output_dir, f"{CONFIG_VALUES.get('proposed_dictionary_output')}_{date_str}.csv")
+    with open(proposed_file_path, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows(proposals)
+
+    logging.info(f"Proposed dictionary | Tokens counted: {sketch.total} | Proposals: {len(proposals)} | Output: {proposed_file_path}")
+    print(f"Proposed dictionary | Tokens counted: {sketch.total} | Proposals: {len(proposals)} | Output: {proposed_file_path}")
+    return proposals
+
+
+DIFF_STATUSES = ['added', 'removed', 'unchanged']
+
+
+def find_previous_scan_run(date_str):
+    """ Returns the latest run before `date_str` with scan part files in the output folder, or None. """
+    runs = set()
+    for scan_dir, scan_output in [('dir_scan_dir', 'long_dir_path_scan_output'), ('filename_scan_dir', 'long_filename_scan_output')]:
+        scan_output = CONFIG_VALUES.get(scan_output)
+        for part_file in glob.glob(os.path.join(CONFIG_VALUES.get('output_dir'), CONFIG_VALUES.get(scan_dir), f"{scan_output}_*_part*")):
+            match = re.match(rf"{re.escape(scan_output)}_(\d+)_part", os.path.basename(part_file))
+            if match and match.group(1) < date_str:
+                runs.add(match.group(1))
+    return max(runs, default=None)
+
+
+def process_diff(base_run=None):
+    """
+    Compares the scan of the run with the scan of `base_run` (by default the latest earlier scan in the output folder).
+
+    Long directory paths and long filename paths are listed in `scan_diff_output` files in the output folder, one per
+    scan type and status: added (new since the base run), removed (resolved) and unchanged (persisting).
+    Both scans are sorted externally, in chunks of `diff_sort_chunk_size` paths merged on disk, and compared with a
+    merge join, so memory stays bounded however large the scans are. Returns the counts per scan type and status.
+    """
+    output_dir = CONFIG_VALUES.get('output_dir')
+    date_str = CONFIG_VALUES.get('date_str')
+    scan_diff_output = CONFIG_VALUES.get('scan_diff_output')
+    chunk_size = CONFIG_VALUES.get('diff_sort_chunk_size')
+
+    base_run = base_run or find_previous_scan_run(date_str)
+    if base_run is None:
+        logging.error(f"No scan before {date_str} found in {output_dir} to compare with.")
+        print(f"No scan before {date_str} found in {output_dir} to compare with.")
+        return None
+
+    summary = {}
+    for process_type, scan_dir, scan_output in [('dir', 'dir_scan_dir', 'long_dir_path_scan_output'),
+                                                ('filename', 'filename_scan_dir', 'long_filename_scan_output')]:
+        def scan_paths(run):
+            file_pattern = f"{CONFIG_VALUES.get(scan_output)}_{run}_part*"
+            part_files = sorted(glob.glob(os.path.join(output_dir, CONFIG_VALUES.get(scan_dir), file_pattern)))
+            # The directory scan output lists one file per long directory, which may be another file in the other scan
+            for path in read_queued_paths(part_files):
+                yield os.path.dirname(path) if process_type == 'dir' else path
+
+        counts = dict.fromkeys(DIFF_STATUSES, 0)
+        with tempfile.TemporaryDirectory(dir=output_dir) as run_dir, contextlib.ExitStack() as stack:
+            diff_files = {status: stack.enter_context(open(os.path.join(output_dir, f"{scan_diff_output}_{process_type}_{date_str}_{status}.txt"), 'w', encoding='utf-8'))
+                          for status in DIFF_STATUSES}
+            old_paths = external_sort(scan_paths(base_run), run_dir, chunk_size)
+            new_paths = external_sort(scan_paths(date_str), run_dir, chunk_size)
+            for status, path in merge_join(old_paths, new_paths):
+                write_to_file(diff_files[status], path)
+                counts[status] += 1
+
+        summary[process_type] = counts
+        logging.info(f"Scan diff {base_run} -> {date_str} | Type: {process_type} | Added: {counts['added']} | Removed: {counts['removed']} | Unchanged: {counts['unchanged']}")
+        print(f"Scan diff {base_run} -> {date_str} | Type: {process_type} | Added: {counts['added']} | Removed: {counts['removed']} | Unchanged: {counts['unchanged']}")
+    return summary
+
+
+def close_dir_fd_cache():
+    """ Closes the cached directory handles at the end of a phase and logs how often they were reused. """
+    if DIR_FD_CACHE is None:
+        return
+    logging.info(f"Directory handle cache | Hits: {DIR_FD_CACHE.hits} | Misses: {DIR_FD_CACHE.misses}")
+    DIR_FD_CACHE.close_all()
+
+
+def parse_time_budget(value):
+    """ Parses a '--time-budget' argument such as '2h', '90m' or '45s' into seconds. A bare number is in minutes. """
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([hms]?)', value.strip().lower())
+    if not match or float(match.group(1)) <= 0:
+        raise argparse.ArgumentTypeError(f"Invalid time budget '{value}'. Expected a positive duration, e.g. 2h, 90m or 45s.")
+    return float(match.group(1)) * {'h': 3600, 'm': 60, '': 60, 's': 1}[match.group(2)]
+
+
+def prioritize_queue(items, priority):
+    """ Yields the items highest priority first. The heap is built in linear time, and only the items consumed are sorted. """
+    heap = [(-priority(item), index, item) for index, item in enumerate(items)]
+    heapq.heapify(heap)
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+def get_checkpoint_path(process_type):
+    """ Returns the checkpoint file holding the queued paths a time-budgeted run did not reach. """
+    scan_dir = CONFIG_VALUES.get('dir_scan_dir' if process_type == 'dir' else 'filename_scan_dir')
+    scan_output = CONFIG_VALUES.get('long_dir_path_scan_output' if process_type == 'dir' else 'long_filename_scan_output')
+    return os.path.join(CONFIG_VALUES.get('output_dir'), scan_dir, f"{scan_output}_{CONFIG_VALUES.get('date_str')}_checkpoint.txt")
+
+
+def write_checkpoint(checkpoint_file_path, records):
+    """ Writes the remaining records to the checkpoint file, replacing it atomically, or removes it once nothing remains. """
+    if not records:
+        if os.path.isfile(checkpoint_file_path):
+            os.remove(checkpoint_file_path)
+        return
+    temp_file_path = f"{checkpoint_file_path}.tmp"
+    with open(temp_file_path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{format_queued_record(path, metadata)}\n" for path, metadata in records)
+    os.replace(temp_file_path, checkpoint_file_path)
+
+
+def process_dir_or_filename(process_type, time_budget=None):
     """
     Process directory or filename based on the given process_type.
     This is the entry point for the shortening process.
+
+    With a `time_budget` in seconds, the queue is worked off in priority order: the directory paths, or the folders
+    holding the long filenames, that exceed their threshold the most come first. Once the budget is spent, the path in
+    progress is finished and the paths not reached are written to a checkpoint file, which the next run of the same
+    scan (`--run`) processes instead of the part files. A resumed `-p dir` run first replays the folder renames logged
+    by the earlier windows, so the checkpointed paths are found under their renamed folders.
     """
     
     output_dir = CONFIG_VALUES.get('output_dir')
@@ -577,37 +2003,474 @@ def process_dir_or_filename(process_type):
     
     print(f"Processing type: {process_type} | Dry Run: {dry_run} | File pattern: {file_pattern}")
 
-    for file_path in glob.glob(os.path.join(output_dir, scan_dir, file_pattern)):
+    global RENAME_OVERLAY, FOLDER_NAMES
+    RENAME_OVERLAY = RenameOverlay(virtual=dry_run) if process_type == 'dir' else None
+    FOLDER_NAMES = FolderNames() if process_type == 'filename' else None
+
+    part_files = list(glob.glob(os.path.join(output_dir, scan_dir, file_pattern)))
+    load_conversion_cache()
+
+    # Dry runs leave the checkpoint alone, so they can rehearse a window without moving the real queue forward
+    checkpoint_file_path = get_checkpoint_path(process_type)
+    queue_files = part_files
+    if not dry_run and os.path.isfile(checkpoint_file_path):
+        logging.info(f"Resuming from checkpoint: {checkpoint_file_path}")
+        print(f"Resuming from checkpoint: {checkpoint_file_path}")
+        queue_files = [checkpoint_file_path]
+        # The checkpointed paths are from the scan, before the folder renames of the earlier windows
+        if process_type == 'dir':
+            RENAME_OVERLAY = load_dir_rename_map(date_str) or RENAME_OVERLAY
+
+    deadline = time.monotonic() + time_budget if time_budget else None
+    remaining = []
+    remaining_lock = threading.Lock()
+
+    # The filename scan describes the tree before the directory renames of this run, whose paths are rewritten lazily,
+    # once per folder, as the folders are processed
+    dir_rename_map = load_dir_rename_map(date_str) if process_type == 'filename' else None
+
+    def rewrite_dir_path(dir_path):
+        return dir_rename_map.resolve(dir_path) if dir_rename_map is not None else dir_path
+
+    verify = CONFIG_VALUES.get('verify_renames') and not dry_run
+    if verify:
+        queued_paths = read_queued_paths(queue_files)
+        if dir_rename_map is not None:
+            queued_paths = (dir_rename_map.resolve(path) for path in queued_paths)
+        hashes_before = hash_files_for_verification(queued_paths)
+
+    # Filenames are renamed folder by folder, so each folder is listed once and its renames run back to back.
+    # Filenames in different folders are independent, so each folder can be a task for the rename workers.
+    # Directory renames change the paths of the lines that follow, so they always run in order.
+    if process_type == 'filename':
+        paths_by_dir = collections.OrderedDict()
+        for path, metadata in read_queued_records(queue_files):
+            paths_by_dir.setdefault(os.path.dirname(path), []).append((path, metadata))
+
+        def process_folder(dir_path):
+            current_dir_path = rewrite_dir_path(dir_path)
+            records = paths_by_dir[dir_path]
+            for index, (path, metadata) in enumerate(records):
+                if deadline is not None and time.monotonic() >= deadline:
+                    with remaining_lock:
+                        remaining.extend(records[index:])
+                    break
+                current_path = current_dir_path + path[len(dir_path):]
+                process_queued_path(process_type, current_path, if_use_regular_expression, dry_run, metadata)
+            FOLDER_NAMES.release(current_dir_path)
+
+        dir_paths = list(paths_by_dir)
+        if deadline is not None:
+            filename_length_threshold = CONFIG_VALUES.get('filename_length_threshold')
+            dir_paths = list(prioritize_queue(dir_paths, lambda dir_path: sum(get_length(os.path.basename(path)) - filename_length_threshold for path, _ in paths_by_dir[dir_path])))
+
+        rename_workers = CONFIG_VALUES.get('rename_workers') or 1
+        if rename_workers > 1:
+            # Workers take their own tasks from the end of their queue, so the highest priority folders go in last
+            stats = WorkStealingScheduler(rename_workers, process_folder).run(reversed(dir_paths) if deadline is not None else dir_paths)
+            log_scheduler_stats("Filename rename", stats)
+        else:
+            for dir_path in dir_paths:
+                process_folder(dir_path)
+    else:
+        records = read_queued_records(queue_files)
+        if deadline is not None:
+            dir_length_threshold = CONFIG_VALUES.get('dir_length_threshold')
+            records = prioritize_queue(list(records), lambda record: get_length(os.path.dirname(record[0])) - dir_length_threshold)
+        for path, metadata in records:
+            if deadline is not None and time.monotonic() >= deadline:
+                remaining.append((path, metadata))
+                remaining.extend(records)
+                break
+            process_queued_path(process_type, path, if_use_regular_expression, dry_run, metadata)
+
+    if remaining:
+        logging.info(f"Time budget spent | Paths not reached: {len(remaining)}{'' if dry_run else f' | Checkpoint: {checkpoint_file_path}'}")
+        print(f"Time budget spent | Paths not reached: {len(remaining)}{'' if dry_run else f' | Checkpoint: {checkpoint_file_path}'}")
+    if not dry_run and (remaining or queue_files != part_files):
+        write_checkpoint(checkpoint_file_path, remaining)
+
+    close_dir_fd_cache()
+    save_conversion_cache()
+    log_strategy_stats()
+    log_io_throttle_stats("Rename")
+
+    if process_type == 'dir':
+        logging.info(f"Directory rename operations {'planned' if dry_run else 'performed'}: {RENAME_OVERLAY.operations}")
+        print(f"Directory rename operations {'planned' if dry_run else 'performed'}: {RENAME_OVERLAY.operations}")
+        if dry_run:
+            write_dry_run_final_layout(part_files, RENAME_OVERLAY)
+
+    if verify:
+        verify_renamed_files(process_type, hashes_before)
+
+
+def read_queued_records(part_files):
+    """
+    Yields the (path, metadata) records of the scan output part files, with None metadata for bare path lines.
+
+    Compressed part files are streamed one chunk at a time.
+    """
+    for file_path in part_files:
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:                
-                for line in f:
-                    path = line.strip()
-                    try:
-                        logging.info(f"\nProcess Type: {process_type} |  Processing path: {path}")
-                        if process_type == 'dir':
-                            dir_length_threshold = CONFIG_VALUES.get('dir_length_threshold')
-                            shorten_long_dir(path, if_use_regular_expression, dir_length_threshold, dry_run)
-                        else:
-                            filename_length_threshold = CONFIG_VALUES.get('filename_length_threshold')
-                            shorten_long_filename(path, if_use_regular_expression, filename_length_threshold, dry_run)
-                    except OSError as e:
-                        logging.error(f"Error processing path: {path} | Maybe already processed. | {e}")
-        except OSError or Exception as e:
+            for line in read_lines(file_path):
+                yield parse_scan_record(line)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error reading file {file_path}: {e}")
+
+
+def read_queued_paths(part_files):
+    """ Yields the paths listed in the scan output part files. """
+    for path, _ in read_queued_records(part_files):
+        yield path
+
+
+# Verification hashes of files: (device, inode, size, mtime, algorithm, sample size) -> hash
+HASH_CACHE = LRUCache(CONFIG_VALUES.get('hash_cache_size'))
+
+def hash_files_for_verification(file_paths, refresh=False):
+    """
+    Hashes files for the verification stage with the configured algorithm, sample size and number of workers.
+
+    Hashes are cached by inode, size and mtime, and the cache is saved to `verify_cache_file` so unchanged files
+    are not hashed again in the next run. A rename keeps all three, so the files are hashed again after their
+    rename with `refresh`, which reads them in full (or their samples) and updates the cache.
+    """
+    verify_cache_file = CONFIG_VALUES.get('verify_cache_file')
+    if verify_cache_file and not len(HASH_CACHE):
+        HASH_CACHE.load(os.path.join(CONFIG_VALUES.get('output_dir'), verify_cache_file))
+
+    hashes = hash_files(list(file_paths), HASH_CACHE, CONFIG_VALUES.get('verify_hash_algorithm'), CONFIG_VALUES.get('verify_sample_size'), CONFIG_VALUES.get('verify_workers'), refresh)
+
+    if verify_cache_file:
+        try:
+            HASH_CACHE.save(os.path.join(CONFIG_VALUES.get('output_dir'), verify_cache_file))
+        except OSError as e:
+            logging.error(f"Failed to save the verification hash cache: {e}")
+    return hashes
+
+
+def verify_renamed_files(process_type, hashes_before):
+    """
+    Hashes the files listed in the scan output at their location after the run and compares them with their hashes from before.
+
+    Directory runs locate the files through the rename overlay, filename runs through the renames in the modified output CSV.
+    Files that are missing or whose content changed are written to the verification error CSV.
+    """
+    output_dir = CONFIG_VALUES.get('output_dir')
+    date_str = CONFIG_VALUES.get('date_str')
+    verification_error = f"{output_dir}/{CONFIG_VALUES.get('verification_error')}_{date_str}.csv"
+
+    if process_type == 'dir':
+        new_paths = {path: RENAME_OVERLAY.resolve(path) for path in hashes_before}
+    else:
+        renamed = {}
+        long_filename_modified_output = f"{output_dir}/{CONFIG_VALUES.get('long_filename_modified_output')}_{date_str}.csv"
+        if os.path.isfile(long_filename_modified_output):
+            with open(long_filename_modified_output, 'r', encoding='utf-8', newline='') as f:
+                renamed = {row[0]: row[1] for row in csv.reader(f) if len(row) >= 2}
+        new_paths = {path: renamed.get(path, path) for path in hashes_before}
+
+    hashes_after = hash_files_for_verification(new_paths.values(), refresh=True)
+
+    failures = 0
+    for path, hash_before in hashes_before.items():
+        new_path = new_paths[path]
+        hash_after = hashes_after.get(new_path)
+        if hash_before is None or hash_after == hash_before:
+            continue
+        failures += 1
+        reason = "File not found after rename" if hash_after is None else "Hash mismatch after rename"
+        logging.error(f"Verification failed: {path} -> {new_path} | {reason}")
+        write_to_csv(verification_error, [path, new_path, reason])
+
+    logging.info(f"Verification | Files: {len(hashes_before)} | Failed: {failures} | Hash cache hit rate: {HASH_CACHE.hit_rate():.1%}")
+    print(f"Verification | Files: {len(hashes_before)} | Failed: {failures}")
+
+
+def process_queued_path(process_type, path, if_use_regular_expression, dry_run, metadata=None):
+    """
+    Shortens the directory path or the filename of a single path read from the scan output.
+
+    If the scan recorded the file's metadata, the file is first checked with one lstat at its current location
+    (through the directory renames already made), and skipped if it is gone or was replaced since the scan.
+    """
+    try:
+        logging.info(f"\nProcess Type: {process_type} |  Processing path: {path}")
+        if metadata is not None:
+            current_path = RENAME_OVERLAY.resolve(path) if process_type == 'dir' and not dry_run else path
+            stale_reason = is_stale_scan_record(current_path, metadata)
+            if stale_reason:
+                output_dir = CONFIG_VALUES.get('output_dir')
+                date_str = CONFIG_VALUES.get('date_str')
+                modified_error = CONFIG_VALUES.get('long_dir_path_modified_error' if process_type == 'dir' else 'long_filename_modified_error')
+                logging.error(f"Skipping stale scan entry: {path} | {stale_reason}")
+                write_to_csv(f'{output_dir}/{modified_error}_{date_str}.csv', [path, f"Skipped: {stale_reason}"])
+                return
+
+        if process_type == 'dir':
+            dir_length_threshold = CONFIG_VALUES.get('dir_length_threshold')
+            shorten_long_dir(path, if_use_regular_expression, dir_length_threshold, dry_run)
+        else:
+            filename_length_threshold = CONFIG_VALUES.get('filename_length_threshold')
+            shorten_long_filename(path, if_use_regular_expression, filename_length_threshold, dry_run)
+    except OSError as e:
+        logging.error(f"Error processing path: {path} | Maybe already processed. | {e}")
+
+
+def write_dry_run_final_layout(part_files, overlay):
+    """
+    Writes the predicted location of every path from the scan output once all simulated directory renames are applied.
+
+    The paths are re-read from the part files and resolved through the rename overlay at the end of the run,
+    so renames simulated for later lines are reflected in earlier ones as well.
+    """
+    dry_run_dir = CONFIG_VALUES.get('dry_run_dir')
+    output_dir = CONFIG_VALUES.get('output_dir')
+    date_str = CONFIG_VALUES.get('date_str')
+    long_dir_path_modified_output = CONFIG_VALUES.get('long_dir_path_modified_output')
+    layout_file_path = f'{output_dir}/{dry_run_dir}/dry_run_{long_dir_path_modified_output}_final_layout_{date_str}.csv'
+
+    for file_path in part_files:
+        try:
+            rows = [[path, overlay.resolve(path)] for path, _ in map(parse_scan_record, read_lines(file_path))]
+        except (OSError, ValueError) as e:
             logging.error(f"Error reading file {file_path}: {e}")
+            continue
+
+        # Part files are bounded by `scan_entry_threshold`, so write each one's rows in a single open
+        if rows:
+            with open(layout_file_path, 'a', encoding='utf-8', newline='') as layout_file:
+                csv.writer(layout_file).writerows(rows)
+
+def process_watch_batch(paths, own_paths):
+    """
+    Checks and shortens a batch of new files found by `-p watch`.
+
+    The files go through the same length checks as the legacy scan (`handle_long_dir_path`, `handle_long_filename`),
+    then long directory paths are shortened before long filenames, whose paths are resolved through the directory renames.
+    The paths the batch renamed files to are added to `own_paths`, so the events of those renames are not processed again.
+    """
+    if_use_regular_expression = CONFIG_VALUES.get('regular_expression')
+    dry_run = CONFIG_VALUES.get('dry_run')
+    output_dir = CONFIG_VALUES.get('output_dir')
+    date_str = CONFIG_VALUES.get('date_str')
+
+    long_dir_paths = io.StringIO()
+    long_filenames = io.StringIO()
+    for path in paths:
+        handle_long_dir_path(path, long_dir_paths)
+        handle_long_filename(path, long_filenames)
+
+    # The watch output files keep a record of every long path found, like the part files of a scan
+    for scan_dir, scan_output, found in [('dir_scan_dir', 'long_dir_path_scan_output', long_dir_paths), ('filename_scan_dir', 'long_filename_scan_output', long_filenames)]:
+        if found.getvalue():
+            with open(f"{output_dir}/{CONFIG_VALUES.get(scan_dir)}/{CONFIG_VALUES.get(scan_output)}_{date_str}_watch.txt", 'a', encoding='utf-8') as f:
+                f.write(found.getvalue())
+
+    global RENAME_OVERLAY
+    RENAME_OVERLAY = RenameOverlay(virtual=dry_run)
+    long_dir_files = long_dir_paths.getvalue().splitlines()
+    for path in long_dir_files:
+        process_queued_path('dir', path, if_use_regular_expression, dry_run)
+    if not dry_run:
+        own_paths.update(RENAME_OVERLAY.resolve(path) for path in long_dir_files)
+
+    for path in long_filenames.getvalue().splitlines():
+        new_file_path = shorten_long_filename(RENAME_OVERLAY.resolve(path), if_use_regular_expression, CONFIG_VALUES.get('filename_length_threshold'), dry_run)
+        if new_file_path is not None and not dry_run:
+            own_paths.add(new_file_path)
+
+    logging.info(f"Watch: Batch of {len(paths)} new files | Long directory paths: {len(long_dir_files)} | Directory renames: {RENAME_OVERLAY.operations}")
+    print(f"Watch: Batch of {len(paths)} new files | Long directory paths: {len(long_dir_files)} | Directory renames: {RENAME_OVERLAY.operations}")
+
+
+def process_watch(watcher=None, max_batches=None):
+    """
+    Watches the base directory and shortens new long paths within seconds of their creation.
+
+    New and moved-in files are collected until no event arrived for `watch_debounce_seconds`, or until
+    `watch_batch_size` files are pending, and are then processed as one batch. Runs until interrupted.
+    """
+    base_dir = os.path.abspath(CONFIG_VALUES.get('base_dir'))
+    debounce_seconds = CONFIG_VALUES.get('watch_debounce_seconds')
+    batch_size = CONFIG_VALUES.get('watch_batch_size')
+    if watcher is None:
+        watcher = create_watcher(base_dir, CONFIG_VALUES.get('watch_poll_seconds'), CONFIG_VALUES.get('watch_use_inotify'))
+
+    logging.info(f"Watching base directory: {base_dir} | Watcher: {type(watcher).__name__} | Dry Run: {CONFIG_VALUES.get('dry_run')}")
+    print(f"Watching base directory: {base_dir} | Watcher: {type(watcher).__name__} | Dry Run: {CONFIG_VALUES.get('dry_run')}")
+
+    load_conversion_cache()
+    pending = collections.OrderedDict()
+    own_paths = set()
+    batches = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            events = watcher.read_events(debounce_seconds)
+            for path, is_dir in events:
+                if path in own_paths:
+                    own_paths.discard(path)
+                elif not is_dir:
+                    pending[path] = None
+
+            if pending and (not events or len(pending) >= batch_size):
+                process_watch_batch(list(pending), own_paths)
+                pending.clear()
+                batches += 1
+    except KeyboardInterrupt:
+        logging.info("Watch stopped")
+        print("Watch stopped")
+    finally:
+        watcher.close()
+        close_dir_fd_cache()
+        save_conversion_cache()
+        log_strategy_stats()
+
+
+def load_rename_log(log_file_path):
+    """ Reads the (old path, new path) pairs of a rename log, in the order the renames happened. """
+    if not os.path.isfile(log_file_path):
+        logging.info(f"Rename log does not exist: {log_file_path}")
+        return []
+    with open(log_file_path, 'r', encoding='utf-8', newline='') as f:
+        return [(row[0], row[1]) for row in csv.reader(f) if len(row) >= 2]
+
+
+def undo_rename(old_path, new_path, overlay, dry_run, rollback_output, rollback_error):
+    """
+    Renames `new_path` back to `old_path`.
+
+    Returns False without logging an error if `new_path` does not exist (yet), so the caller can retry it later.
+    In a dry run the rename is only recorded in the overlay, so the following checks see it.
+    """
+    if not overlay.exists(new_path):
+        return False
+
+    if overlay.exists(old_path):
+        logging.error(f"Rollback: Original path is taken, not restoring: {new_path} -> {old_path}")
+        write_to_csv(rollback_error, [new_path, old_path, "Original path is taken"])
+        return True
+
+    try:
+        if dry_run:
+            logging.info(f"Dry Run: Simulating rollback of '{new_path}' to '{old_path}'")
+        else:
+            with io_operation():
+                rename_path(new_path, old_path, DIR_FD_CACHE)
+            logging.info(f"Rollback: Renamed '{new_path}' back to '{old_path}'")
+        overlay.record(new_path, old_path)
+        write_to_csv(rollback_output, [new_path, old_path])
+    except OSError as e:
+        logging.error(f"Rollback: Failed to rename '{new_path}' back to '{old_path}': {e}")
+        write_to_csv(rollback_error, [new_path, old_path, str(e)])
+    return True
+
+
+def process_rollback(run_id, dry_run):
+    """
+    Reverts the renames of a completed run, read from its modified output CSVs.
+
+    Each log records paths as they were when the rename happened, so the renames are undone in reverse order:
+    the filenames first, then the directories, which restores parents before the children renamed under them.
+    Filenames renamed before their directories were renamed do not exist under their logged path yet;
+    they are retried once the directories are restored. Filenames in different folders are restored
+    concurrently by the rename workers.
+    """
+    output_dir = CONFIG_VALUES.get('output_dir')
+    dry_run_dir = CONFIG_VALUES.get('dry_run_dir')
+    rollback_dir = f'{output_dir}/{dry_run_dir}/dry_run_' if dry_run else f'{output_dir}/'
+    rollback_output = f'{rollback_dir}rollback_output_{run_id}.csv'
+    rollback_error = f'{rollback_dir}rollback_error_{run_id}.csv'
+
+    file_renames = load_rename_log(f"{output_dir}/{CONFIG_VALUES.get('long_filename_modified_output')}_{run_id}.csv")
+    dir_renames = load_rename_log(f"{output_dir}/{CONFIG_VALUES.get('long_dir_path_modified_output')}_{run_id}.csv")
+
+    logging.info(f"Rolling back run {run_id} | Dry Run: {dry_run} | Filename renames: {len(file_renames)} | Directory renames: {len(dir_renames)}")
+    print(f"Rolling back run {run_id} | Dry Run: {dry_run} | Filename renames: {len(file_renames)} | Directory renames: {len(dir_renames)}")
+
+    overlay = RenameOverlay(virtual=dry_run)
+    deferred_file_renames = []
+
+    def undo_file_renames(renames):
+        for old_path, new_path in renames:
+            if not undo_rename(old_path, new_path, overlay, dry_run, rollback_output, rollback_error):
+                deferred_file_renames.append((old_path, new_path))
+
+    rename_workers = CONFIG_VALUES.get('rename_workers') or 1
+    if rename_workers > 1 and not dry_run:
+        file_renames_by_dir = collections.OrderedDict()
+        for old_path, new_path in reversed(file_renames):
+            file_renames_by_dir.setdefault(os.path.dirname(new_path), []).append((old_path, new_path))
+        stats = WorkStealingScheduler(rename_workers, lambda dir_path: undo_file_renames(file_renames_by_dir[dir_path])).run(file_renames_by_dir)
+        log_scheduler_stats("Rollback", stats)
+    else:
+        undo_file_renames(reversed(file_renames))
+
+    for old_path, new_path in reversed(dir_renames):
+        if not undo_rename(old_path, new_path, overlay, dry_run, rollback_output, rollback_error):
+            logging.error(f"Rollback: Renamed directory not found: {new_path}")
+            write_to_csv(rollback_error, [new_path, old_path, "Renamed directory not found"])
+
+    for old_path, new_path in deferred_file_renames:
+        if not undo_rename(old_path, new_path, overlay, dry_run, rollback_output, rollback_error):
+            logging.error(f"Rollback: Renamed file not found: {new_path}")
+            write_to_csv(rollback_error, [new_path, old_path, "Renamed file not found"])
+
+    close_dir_fd_cache()
+    logging.info(f"Rollback of run {run_id} {'simulated' if dry_run else 'completed'} | Renames reverted: {overlay.operations}")
+    print(f"Rollback of run {run_id} {'simulated' if dry_run else 'completed'} | Renames reverted: {overlay.operations}")
+
 
 def main():
     parser = argparse.ArgumentParser(description='Shorten long file names or directory paths.')
-    parser.add_argument('-p', '--process', choices=['dir', 'filename', 'scan'], default='scan', help='Specify whether to process directories (-p dir), filenames (-p filename), or perform a scan (-p scan).')
+    parser.add_argument('-p', '--process', choices=['dir', 'filename', 'scan', 'merge', 'rollback', 'watch', 'build-dictionary', 'diff'], default='scan', help='Specify whether to process directories (-p dir), filenames (-p filename), perform a scan (-p scan), merge shard scan outputs (-p merge), revert a run (-p rollback), shorten new long paths as they appear (-p watch), propose dictionary entries from a scan (-p build-dictionary), or compare a scan with an earlier one (-p diff).')
+    parser.add_argument('--shard', type=parse_shard, default=None, help='Only scan shard i of N of the base directory (e.g. --shard 1/4). Run -p merge once all shards are done.')
+    parser.add_argument('--run', default=None, help='Run to revert with -p rollback: the date stamp of its modified output CSVs (e.g. 20240131). With -p dir, -p filename, -p build-dictionary or -p diff, process the scan of that run, e.g. to resume from its checkpoint.')
+    parser.add_argument('--time-budget', type=parse_time_budget, default=None, help='With -p dir or -p filename, stop after this long (e.g. 2h, 90m) with a checkpoint, working on the longest paths first.')
+    parser.add_argument('--against', default=None, help='With -p diff, the run to compare with (e.g. 20240130). Defaults to the latest earlier scan in the output folder.')
+    parser.add_argument('--dry-run', action='store_true', help='Simulate the rollback. Also enabled by dry_run in config.ini.')
     args = parser.parse_args()
 
-    print(f"Base directory: {CONFIG_VALUES.get('base_dir')}")
-    print(f"Filename length threshold: {CONFIG_VALUES.get('filename_length_threshold')}")
-    print(f"Directory length threshold: {CONFIG_VALUES.get('dir_length_threshold')}")
+    if args.process == 'rollback' and args.run is None:
+        parser.error("-p rollback requires --run")
+
+    # With [ROOT name] sections, scan, dir, filename, rollback, build-dictionary and diff cover every root, each in its own output folder
+    roots = CONFIG_VALUES.get('roots')
+    if roots and args.shard is not None:
+        parser.error("--shard scans base_dir and cannot be combined with [ROOT] sections in config.ini")
+
+    if roots:
+        for root in roots:
+            print(f"Root: {root['name']} | Base directory: {root['base_dir']} | Filename length threshold: {root['filename_length_threshold']} | Directory length threshold: {root['dir_length_threshold']}")
+    else:
+        print(f"Base directory: {CONFIG_VALUES.get('base_dir')}")
+        print(f"Filename length threshold: {CONFIG_VALUES.get('filename_length_threshold')}")
+        print(f"Directory length threshold: {CONFIG_VALUES.get('dir_length_threshold')}")
     
-    if args.process == 'scan':
-        process_scan()
+    if args.process == 'scan' and roots:
+        process_scan_roots(roots)
+        close_dir_fd_cache()
+        log_io_throttle_stats("Scan")
+    elif args.process == 'scan':
+        process_scan(args.shard)
+    elif args.process == 'merge':
+        merge_shard_scan_outputs()
+    elif args.process == 'watch':
+        process_watch()
     else:
-        process_dir_or_filename(args.process)
+        if args.run is not None and args.process != 'rollback':
+            CONFIG_VALUES['date_str'] = args.run
+        for overrides in [get_root_overrides(root) for root in roots] or [{}]:
+            with CONFIG_VALUES.override(overrides):
+                if args.process == 'rollback':
+                    process_rollback(args.run, args.dry_run or CONFIG_VALUES.get('dry_run'))
+                elif args.process == 'build-dictionary':
+                    process_build_dictionary()
+                elif args.process == 'diff':
+                    process_diff(args.against)
+                else:
+                    process_dir_or_filename(args.process, args.time_budget)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,129 @@
+import base64
+import hashlib
+import re
+import threading
+import time
+
+from utilities import measure_length, truncate_to_length
+
+
+class DictionaryStrategy:
+    """ Replaces each name component found in the abbreviation dictionary. """
+
+    name = 'dictionary'
+
+    def __init__(self, dictionary):
+        self.dictionary = dictionary
+
+    def apply(self, components, kind, original_name):
+        return [self.dictionary.get(component, component) for component in components]
+
+
+class PhraseStrategy:
+    """
+    Replaces runs of consecutive components that form a phrase of the phrase dictionary, longest phrase first.
+
+    Phrases are matched case-insensitively, so 'Human_Resources' and 'human-resources' both match 'human resources'.
+    """
+
+    name = 'phrase'
+
+    def __init__(self, phrase_dictionary):
+        self.phrases = {tuple(phrase.lower().split()): abbreviation for phrase, abbreviation in phrase_dictionary.items()}
+        self.max_words = max((len(words) for words in self.phrases), default=0)
+
+    def apply(self, components, kind, original_name):
+        lowered = [component.lower() for component in components]
+        new_components = []
+        i = 0
+        while i < len(components):
+            for word_count in range(min(self.max_words, len(components) - i), 1, -1):
+                abbreviation = self.phrases.get(tuple(lowered[i:i + word_count]))
+                if abbreviation is not None:
+                    new_components.append(abbreviation)
+                    i += word_count
+                    break
+            else:
+                new_components.append(components[i])
+                i += 1
+        return new_components
+
+
+class VowelStripStrategy:
+    """ Removes the characters matched by the regular expression of the name kind from components longer than `min_length`. """
+
+    name = 'vowel_strip'
+
+    def __init__(self, dir_regex, file_regex, min_length=4):
+        self.regexes = {'dir': re.compile(dir_regex), 'file': re.compile(file_regex)}
+        self.min_length = min_length
+
+    def apply(self, components, kind, original_name):
+        regex = self.regexes[kind]
+        return [regex.sub('', component) if len(component) >= self.min_length else component for component in components]
+
+
+class TruncateHashStrategy:
+    """
+    Cuts names still longer than `max_length` and appends '~' and a short hash of the original name.
+
+    The hash keeps names that only differ after the cut apart. The extension of a filename is kept.
+    Lengths are measured in `length_unit` (see `utilities.measure_length`), and the cut never splits a character.
+    """
+
+    name = 'truncate_hash'
+
+    def __init__(self, max_length, hash_length=6, length_unit='chars', join_with='-'):
+        self.max_length = max_length
+        self.hash_length = hash_length
+        self.length_unit = length_unit
+        self.join_with = join_with
+
+    def apply(self, components, kind, original_name):
+        joined = self.join_with.join(components)
+        extension_length = measure_length(get_extension(original_name), self.length_unit) if kind == 'file' else 0
+        if not self.max_length or measure_length(joined, self.length_unit) + extension_length <= self.max_length:
+            return components
+
+        digest = hashlib.blake2b(original_name.encode('utf-8', 'surrogateescape'), digest_size=10).digest()
+        suffix = '~' + base64.b32encode(digest).decode('ascii').lower()[:self.hash_length]
+        keep_length = max(1, self.max_length - extension_length - len(suffix))
+        return [truncate_to_length(joined, keep_length, self.length_unit) + suffix]
+
+
+def get_extension(name):
+    """ Returns the extension the filename breakdown keeps apart, including the dot, or '' if there is none. """
+    extension_match = re.search(r'\.\w+$', name)
+    return name[extension_match.start():] if extension_match else ''
+
+
+class StrategyPipeline:
+    """
+    Runs an ordered chain of shortening strategies over the components of a name.
+
+    Each strategy's total time and the number of UTF-8 bytes it removed are recorded, so the cost of every stage
+    can be weighed against what it saves.
+    """
+
+    def __init__(self, strategies, version):
+        self.strategies = strategies
+        self.version = version
+        self.names = ','.join(strategy.name for strategy in strategies)
+        self.stats = {strategy.name: {'calls': 0, 'time': 0.0, 'bytes_saved': 0} for strategy in strategies}
+        self._lock = threading.Lock()
+
+    def apply(self, components, kind, original_name, join_with='-'):
+        size_after = measure_length(join_with.join(components), 'utf8')
+        for strategy in self.strategies:
+            size_before = size_after
+            start = time.perf_counter()
+            components = strategy.apply(components, kind, original_name)
+            elapsed = time.perf_counter() - start
+            size_after = measure_length(join_with.join(components), 'utf8')
+
+            with self._lock:
+                stats = self.stats[strategy.name]
+                stats['calls'] += 1
+                stats['time'] += elapsed
+                stats['bytes_saved'] += size_before - size_after
+        return components
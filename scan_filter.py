@@ -0,0 +1,124 @@
+import os
+import re
+
+
+def split_patterns(value):
+    """ Splits a config value of comma or newline separated patterns. """
+    return [pattern.strip() for pattern in re.split(r'[,\n]', value or '') if pattern.strip()]
+
+
+def glob_to_regex(pattern):
+    """
+    Translates a gitignore-style glob into a regular expression for '/' separated paths relative to the base directory.
+
+    '*' and '?' do not match '/', '**' matches any number of folders. A pattern with a '/' other than a trailing one
+    is anchored to the base directory, other patterns match at any depth.
+    """
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            regex += '(?:/.*)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            char_class = pattern[i + 1:end]
+            regex += '[' + ('^' + char_class[1:] if char_class.startswith('!') else char_class) + ']'
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+
+    return ('' if anchored else '(?:.*/)?') + regex
+
+
+def compile_patterns(patterns):
+    """ Compiles globs into a single regular expression, or None if there are none. """
+    if not patterns:
+        return None
+    return re.compile('^(?:' + '|'.join(glob_to_regex(pattern) for pattern in patterns) + ')$')
+
+
+class ScanFilter:
+    """
+    Decides which folders the scanner lists and which files it records, before any system call is made for them.
+
+    `exclude` takes gitignore-style patterns. Excluded folders are never listed, so nothing beneath them costs a
+    system call, and excluded files are not recorded. A trailing '/' only matches folders, and a leading '!' turns
+    the pattern into an exception that keeps a path the other patterns exclude. If `include` patterns are given,
+    only the files matching one of them are recorded.
+
+    Depths count from the base directory, whose direct sub-folders are at depth 1. Folders deeper than `max_depth`
+    are not listed, and files in folders above `min_depth` are not recorded. A depth of 0 means no limit.
+    """
+
+    def __init__(self, base_dir, exclude=(), include=(), min_depth=0, max_depth=0):
+        self.base_dir = base_dir.rstrip(os.sep)
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+
+        exclude_patterns = [pattern for pattern in exclude if not pattern.startswith('!')]
+        exception_patterns = [pattern[1:] for pattern in exclude if pattern.startswith('!')]
+        self._dir_exclude = compile_patterns([pattern.rstrip('/') for pattern in exclude_patterns])
+        self._dir_exceptions = compile_patterns([pattern.rstrip('/') for pattern in exception_patterns])
+        self._file_exclude = compile_patterns([pattern for pattern in exclude_patterns if not pattern.endswith('/')])
+        self._file_exceptions = compile_patterns([pattern for pattern in exception_patterns if not pattern.endswith('/')])
+        self._file_include = compile_patterns(include)
+
+    @classmethod
+    def from_config(cls, base_dir, config_values):
+        return cls(base_dir,
+                   split_patterns(config_values.get('scan_exclude')),
+                   split_patterns(config_values.get('scan_include')),
+                   config_values.get('scan_min_depth') or 0,
+                   config_values.get('scan_max_depth') or 0)
+
+    def is_active(self):
+        return any([self._dir_exclude, self._file_exclude, self._file_include, self.min_depth, self.max_depth])
+
+    def relative_path(self, path):
+        relative_path = path[len(self.base_dir) + 1:]
+        return relative_path.replace(os.sep, '/') if os.sep != '/' else relative_path
+
+    def depth(self, dir_path):
+        """ Returns the depth of a folder under the base directory, 0 for the base directory itself. """
+        if len(dir_path) <= len(self.base_dir) + 1:
+            return 0
+        return dir_path.count(os.sep, len(self.base_dir))
+
+    def allows_dir(self, dir_path):
+        """ Checks if a sub-folder of the base directory should be listed. """
+        if self.max_depth and self.depth(dir_path) > self.max_depth:
+            return False
+        if self._dir_exclude is None:
+            return True
+        relative_path = self.relative_path(dir_path)
+        return not self._dir_exclude.match(relative_path) or bool(self._dir_exceptions and self._dir_exceptions.match(relative_path))
+
+    def allows_file(self, file_path, dir_path):
+        """ Checks if a file found in `dir_path` should be recorded. """
+        if self.min_depth and self.depth(dir_path) < self.min_depth:
+            return False
+        if self._file_exclude is None and self._file_include is None:
+            return True
+        relative_path = self.relative_path(file_path)
+        if self._file_include is not None and not self._file_include.match(relative_path):
+            return False
+        if self._file_exclude is not None and self._file_exclude.match(relative_path):
+            return bool(self._file_exceptions and self._file_exceptions.match(relative_path))
+        return True
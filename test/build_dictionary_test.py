@@ -0,0 +1,114 @@
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import long_filepath_filename_shortener as shortener
+from long_filepath_filename_shortener import process_build_dictionary, propose_abbreviation, iter_scan_name_tokens
+from token_sketch import CountMinSketch, HeavyHitters
+
+
+class TestTokenSketch(unittest.TestCase):
+    def test_count_min_sketch_never_undercounts(self):
+        sketch = CountMinSketch(width=64, depth=3)
+        counts = {f"token{i}": i % 7 + 1 for i in range(200)}
+        for token, count in counts.items():
+            for _ in range(count):
+                sketch.add(token)
+
+        self.assertEqual(sketch.total, sum(counts.values()))
+        for token, count in counts.items():
+            self.assertGreaterEqual(sketch.estimate(token), count)
+
+    def test_count_min_sketch_is_exact_without_collisions(self):
+        sketch = CountMinSketch(width=4096, depth=4)
+        sketch.add('production', 5)
+        sketch.add('document')
+        self.assertEqual(sketch.estimate('production'), 5)
+        self.assertEqual(sketch.estimate('document'), 1)
+        self.assertEqual(sketch.estimate('absent'), 0)
+
+    def test_heavy_hitters_stay_bounded(self):
+        hitters = HeavyHitters(capacity=10)
+        for i in range(1000):
+            hitters.update(f"token{i}", i)
+            self.assertLessEqual(len(hitters), 20)
+        self.assertEqual([key for key, _ in hitters.top(3)], ['token999', 'token998', 'token997'])
+
+
+class TestBuildDictionary(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'output')
+        self.base_dir = os.path.join(self.test_dir, 'base')
+        os.makedirs(os.path.join(self.output_dir, 'dir_scan'))
+        os.makedirs(os.path.join(self.output_dir, 'filename_scan'))
+
+        dir_paths = [os.path.join(self.base_dir, 'Marketing_Campaigns', f"Quarterly-Campaigns_{i}", 'file.txt') for i in range(3)]
+        filename_paths = [os.path.join(self.base_dir, f"Marketing_Presentation_Final_{i}.pptx") for i in range(4)]
+        for scan_dir, scan_output, paths in [('dir_scan', 'long_dir_path_scan_output', dir_paths),
+                                             ('filename_scan', 'long_filename_scan_output', filename_paths)]:
+            with open(os.path.join(self.output_dir, scan_dir, f"{scan_output}_20220101_part1.txt"), 'w', encoding='utf-8') as f:
+                f.writelines(f"{path}\n" for path in paths)
+
+        self.config_values = {
+            'base_dir': self.base_dir,
+            'output_dir': self.output_dir,
+            'dir_scan_dir': 'dir_scan',
+            'filename_scan_dir': 'filename_scan',
+            'long_dir_path_scan_output': 'long_dir_path_scan_output',
+            'long_filename_scan_output': 'long_filename_scan_output',
+            'date_str': '20220101',
+            'length_unit': 'chars',
+            'dictionary_sketch_width': 1024,
+            'dictionary_sketch_depth': 4,
+            'dictionary_candidates': 10,
+            'dictionary_min_token_length': 6,
+            'proposed_dictionary_output': 'proposed_dictionary',
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_propose_abbreviation(self):
+        self.assertEqual(propose_abbreviation('production', set()), 'prod')
+        self.assertEqual(propose_abbreviation('document', set()), 'doc')
+        self.assertEqual(propose_abbreviation('Document', {'doc'}), 'Docum')
+        self.assertIsNone(propose_abbreviation('abcd', set()))
+
+    def test_shared_folders_are_counted_once(self):
+        records = [(os.path.join(self.base_dir, 'Shared', 'Alpha', 'a.txt'), None), (os.path.join(self.base_dir, 'Shared', 'Beta', 'b.txt'), None)]
+        self.assertEqual(list(iter_scan_name_tokens(records, [], self.base_dir, self.test_dir)), ['Shared', 'Alpha', 'Beta'])
+
+    def test_interleaved_records_are_counted_once(self):
+        # Records as concurrent scan workers write them, with a sibling whose name extends another folder's name
+        folders = [('Shared', 'Alpha', 'Deep'), ('Shared-Extra',), ('Shared', 'Beta'), ('Shared', 'Alpha'), ('Shared', 'Alpha', 'Deep')]
+        records = [(os.path.join(self.base_dir, *folder, 'a.txt'), None) for folder in folders]
+
+        tokens = list(iter_scan_name_tokens(records, [], self.base_dir, self.test_dir, chunk_size=2))
+        self.assertEqual(sorted(tokens), sorted(['Shared', 'Alpha', 'Deep', 'Beta', 'Shared', 'Extra']))
+
+    def test_relative_base_dir_is_not_tokenized(self):
+        records = [(os.path.join(os.path.abspath('base'), 'Reports', 'a.txt'), None)]
+        self.assertEqual(list(iter_scan_name_tokens(records, [], 'base', self.test_dir)), ['Reports'])
+
+    def test_proposals_ranked_by_characters_saved(self):
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), \
+                patch.object(shortener, 'get_dictionary', lambda: ({'Presentation': 'pres'}, '')):
+            proposals = process_build_dictionary()
+
+        with open(os.path.join(self.output_dir, 'proposed_dictionary_20220101.csv'), 'r', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+
+        # 'Marketing' is in one folder name and every filename, 'Campaigns' in every folder name, 'Presentation' is known
+        self.assertEqual(rows, [['Marketing', 'Mar', '5', '30'], ['Campaigns', 'Cam', '4', '24'], ['Quarterly', 'Quar', '3', '15']])
+        self.assertEqual(len(proposals), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
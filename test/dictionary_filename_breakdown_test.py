@@ -5,7 +5,10 @@ import unittest
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from long_filepath_filename_shortener import convert_components, load_dictionary, break_down_filename
+import long_filepath_filename_shortener as shortener
+from long_filepath_filename_shortener import convert_components, load_dictionary, break_down_filename, convert_name
+from unittest.mock import patch
+from utilities import LRUCache
 
 class TestBreakDownFilename(unittest.TestCase):
     def test_break_down_filename(self):
@@ -174,5 +177,28 @@ class TestBreakDownFilename(unittest.TestCase):
         self.assertEqual(break_down_filename('my_fileName.txt'), ['my', 'file', 'Name', '.txt'])
         self.assertEqual(break_down_filename('my-fileName.txt'), ['my', 'file', 'Name', '.txt'])
 
+class TestConvertName(unittest.TestCase):
+    def setUp(self):
+        self.config_values = {'config_dir': 'test', 'dictionary_path': 'convert_name_dictionary.csv', 'dir_path_regex': '(?<!^)[aeiou](?!([A-Z]|$))'}
+        with open(os.path.join('test', 'convert_name_dictionary.csv'), 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(["production", "prod"])
+            writer.writerow(["version", "ver"])
+
+    def tearDown(self):
+        os.remove(os.path.join('test', 'convert_name_dictionary.csv'))
+
+    def test_dictionary_conversion(self):
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'CONVERSION_CACHE', LRUCache()), patch.object(shortener, 'LOADED_DICTIONARIES', {}):
+            self.assertEqual(convert_name('production_version', 'dir', False), 'prod-ver')
+            self.assertEqual(convert_name('production_version_notes.txt', 'file', False), 'prod-ver-notes.txt')
+
+    def test_repeated_names_hit_the_cache(self):
+        cache = LRUCache()
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'CONVERSION_CACHE', cache):
+            for _ in range(3):
+                self.assertEqual(convert_name('Production_Documents', 'dir', True), 'Prdctn-Dcmnts')
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
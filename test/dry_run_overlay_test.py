@@ -0,0 +1,120 @@
+import os
+import sys
+import shutil
+import threading
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import long_filepath_filename_shortener as shortener
+from long_filepath_filename_shortener import RenameOverlay, shorten_long_dir
+
+
+class TestRenameOverlay(unittest.TestCase):
+    def test_resolve_and_to_disk(self):
+        overlay = RenameOverlay(virtual=True)
+        overlay.record(os.path.join('base', 'parent', 'child'), os.path.join('base', 'parent', 'chld'))
+        overlay.record(os.path.join('base', 'parent'), os.path.join('base', 'prnt'))
+
+        self.assertEqual(overlay.resolve(os.path.join('base', 'parent', 'child', 'file.txt')), os.path.join('base', 'prnt', 'chld', 'file.txt'))
+        self.assertEqual(overlay.resolve(os.path.join('base', 'other')), os.path.join('base', 'other'))
+        self.assertEqual(overlay.to_disk(os.path.join('base', 'prnt', 'chld', 'file.txt')), os.path.join('base', 'parent', 'child', 'file.txt'))
+        self.assertEqual(overlay.operations, 2)
+
+    def test_rename_under_renamed_parent(self):
+        overlay = RenameOverlay(virtual=True)
+        overlay.record(os.path.join('base', 'parent'), os.path.join('base', 'prnt'))
+        overlay.record(os.path.join('base', 'prnt', 'child'), os.path.join('base', 'prnt', 'chld'))
+
+        self.assertEqual(overlay.resolve(os.path.join('base', 'parent', 'child')), os.path.join('base', 'prnt', 'chld'))
+        self.assertEqual(overlay.to_disk(os.path.join('base', 'prnt', 'chld')), os.path.join('base', 'parent', 'child'))
+
+    def test_concurrent_records_are_all_counted(self):
+        overlay = RenameOverlay()
+        renames = [(os.path.join('base', f"folder{i}", f"child{j}"), os.path.join('base', f"folder{i}", f"chld{j}")) for i in range(20) for j in range(50)]
+        threads = [threading.Thread(target=lambda start=start: [overlay.record(*rename) for rename in renames[start::8]]) for start in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(overlay.operations, len(renames))
+        for old_dir_path, new_dir_path in renames:
+            self.assertEqual(overlay.resolve(old_dir_path), new_dir_path)
+
+
+class TestDryRunMatchesRealRun(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.base_dir = os.path.join(self.test_dir, 'base')
+        self.nested_dir = os.path.join(self.base_dir, 'production_folder', 'version_directory', 'preprocess_results')
+        os.makedirs(self.nested_dir)
+        os.makedirs(os.path.join(self.test_dir, 'output', 'dry_run'))
+
+        self.paths = [
+            os.path.join(self.base_dir, 'production_folder', 'version_directory', 'file1.txt'),
+            os.path.join(self.nested_dir, 'file2.txt'),
+        ]
+        for path in self.paths:
+            with open(path, 'w') as f:
+                f.write("test content")
+
+        self.config_values = {
+            'output_dir': os.path.join(self.test_dir, 'output'),
+            'dry_run_dir': 'dry_run',
+            'date_str': '20220101',
+            'long_dir_path_modified_output': 'long_dir_path_modified_output',
+            'long_dir_path_modified_error': 'long_dir_path_modified_error',
+            'number_of_retry': 5,
+            'dir_path_regex': '(?<!^)[aeiou](?!([A-Z]|$))',
+            'folder_conversion_stop_level': len(self.base_dir.split(os.sep)) - 2,
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def run_shortener(self, dry_run):
+        overlay = RenameOverlay(virtual=dry_run)
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'RENAME_OVERLAY', overlay):
+            for path in self.paths:
+                shorten_long_dir(path, True, len(self.base_dir) + 5, dry_run)
+        return overlay
+
+    def test_single_dry_run_predicts_real_run(self):
+        dry_overlay = self.run_shortener(dry_run=True)
+        predicted = [dry_overlay.resolve(path) for path in self.paths]
+
+        # Nothing has been renamed on disk
+        self.assertTrue(all(os.path.exists(path) for path in self.paths))
+        self.assertEqual(dry_overlay.operations, 3)
+
+        real_overlay = self.run_shortener(dry_run=False)
+        self.assertEqual(real_overlay.operations, dry_overlay.operations)
+        self.assertEqual([real_overlay.resolve(path) for path in self.paths], predicted)
+        self.assertTrue(all(os.path.exists(path) for path in predicted))
+
+    def test_name_collisions_resolve_alike(self):
+        # An empty folder, which a POSIX rename would replace, and a folder with contents, which it would fail on
+        empty_target = os.path.join(self.base_dir, 'prdctn-fldr')
+        full_target = os.path.join(self.base_dir, 'production_folder', 'vrsn-drctry')
+        os.makedirs(empty_target)
+        os.makedirs(full_target)
+        with open(os.path.join(full_target, 'keep.txt'), 'w') as f:
+            f.write("test content")
+
+        dry_overlay = self.run_shortener(dry_run=True)
+        predicted = [dry_overlay.resolve(path) for path in self.paths]
+        real_overlay = self.run_shortener(dry_run=False)
+
+        self.assertEqual(real_overlay.operations, dry_overlay.operations)
+        self.assertEqual([real_overlay.resolve(path) for path in self.paths], predicted)
+        self.assertTrue(all(os.path.exists(path) for path in predicted))
+        self.assertTrue(os.path.isdir(empty_target))
+        self.assertTrue(os.path.exists(os.path.join(real_overlay.resolve(full_target), 'keep.txt')))
+        self.assertFalse(predicted[0].startswith(empty_target + os.sep))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import long_filepath_filename_shortener as shortener
+from long_filepath_filename_shortener import process_dir_or_filename
+
+
+class TestFilenameRenamesByFolder(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.folder = os.path.join(self.test_dir, 'base', 'folder')
+        self.output_dir = os.path.join(self.test_dir, 'output')
+        os.makedirs(self.folder)
+        os.makedirs(os.path.join(self.output_dir, 'filename_scan'))
+
+        # Both long names shorten to 'prdctn-rprt.txt', which is already taken
+        self.files = [os.path.join(self.folder, name) for name in ['production_report.txt', 'prodaction_report.txt']]
+        for path in self.files + [os.path.join(self.folder, 'prdctn-rprt.txt')]:
+            with open(path, 'w') as f:
+                f.write(os.path.basename(path))
+
+        with open(os.path.join(self.output_dir, 'filename_scan', 'long_filename_scan_output_20220101_part1.txt'), 'w', encoding='utf-8') as f:
+            f.writelines(f"{path}\n" for path in self.files)
+
+        self.config_values = {
+            'output_dir': self.output_dir,
+            'dir_scan_dir': 'dir_scan',
+            'filename_scan_dir': 'filename_scan',
+            'long_dir_path_scan_output': 'long_dir_path_scan_output',
+            'long_filename_scan_output': 'long_filename_scan_output',
+            'long_filename_modified_output': 'long_filename_modified_output',
+            'long_filename_modified_error': 'long_filename_modified_error',
+            'date_str': '20220101',
+            'filename_length_threshold': 15,
+            'number_of_retry': 5,
+            'rename_workers': 1,
+            'naming_mode': 'counter',
+            'conversion_cache_file': '',
+            'verify_renames': False,
+            'dry_run': False,
+            'regular_expression': True,
+            'dir_path_regex': '(?<!^)[aeiou](?!([A-Z]|$))',
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_folder_is_listed_once_and_conflicts_resolved(self):
+        listdir = os.listdir
+        listed = []
+
+        def recording_listdir(path):
+            listed.append(path)
+            return listdir(path)
+
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'DIR_FD_CACHE', None), \
+                patch.object(shortener, 'CONVERSION_CACHE', shortener.LRUCache()), patch('os.listdir', recording_listdir):
+            process_dir_or_filename('filename')
+
+        self.assertEqual(listed, [self.folder])
+        self.assertEqual(sorted(os.listdir(self.folder)), ['prdctn-rprt.txt', 'prdctn-rprt_1.txt', 'prdctn-rprt_2.txt'])
+        with open(os.path.join(self.folder, 'prdctn-rprt.txt')) as f:
+            self.assertEqual(f.read(), 'prdctn-rprt.txt')
+
+    def test_paths_follow_directory_renames_of_the_run(self):
+        # Both levels renamed by a '-p dir' run after the scan, the child under its parent's new path
+        base_dir = os.path.dirname(self.folder)
+        os.rename(base_dir, os.path.join(self.test_dir, 'bs'))
+        os.rename(os.path.join(self.test_dir, 'bs', 'folder'), os.path.join(self.test_dir, 'bs', 'fldr'))
+        with open(os.path.join(self.output_dir, 'long_dir_path_modified_output_20220101.csv'), 'w', encoding='utf-8') as f:
+            f.write(f"{base_dir},{os.path.join(self.test_dir, 'bs')}\n")
+            f.write(f"{os.path.join(self.test_dir, 'bs', 'folder')},{os.path.join(self.test_dir, 'bs', 'fldr')}\n")
+
+        self.config_values['long_dir_path_modified_output'] = 'long_dir_path_modified_output'
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'DIR_FD_CACHE', None), \
+                patch.object(shortener, 'CONVERSION_CACHE', shortener.LRUCache()):
+            process_dir_or_filename('filename')
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.test_dir, 'bs', 'fldr'))), ['prdctn-rprt.txt', 'prdctn-rprt_1.txt', 'prdctn-rprt_2.txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
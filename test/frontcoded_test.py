@@ -0,0 +1,50 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from frontcoded import FrontCodedReader, FrontCodedWriter, read_lines
+
+
+class TestFrontCoded(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.lines = sorted(f"\\\\server\\share\\department_{i // 100:03d}\\projects\\report_{i:05d}_été.docx\tf\t{i}\t10\t20" for i in range(1000))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def write(self, codec, close=True):
+        file_path = os.path.join(self.test_dir, f'part1_{codec}.fcz')
+        writer = FrontCodedWriter(file_path, codec, chunk_size=64)
+        for line in self.lines:
+            writer.write(line)
+        if close:
+            writer.close()
+        return file_path
+
+    def test_round_trip_and_size(self):
+        for codec in ['gzip', 'lzma']:
+            file_path = self.write(codec)
+            self.assertEqual(list(read_lines(file_path)), self.lines)
+            text_size = sum(len(line.encode('utf-8')) + 1 for line in self.lines)
+            self.assertLess(os.path.getsize(file_path) * 10, text_size)
+
+    def test_seek_and_find(self):
+        reader = FrontCodedReader(self.write('gzip'))
+        self.assertEqual(len(reader), len(self.lines))
+        self.assertEqual(list(reader.lines(700)), self.lines[700:])
+        self.assertEqual(list(reader.lines(5000)), [])
+        self.assertEqual(reader.find(self.lines[333]), 333)
+        self.assertEqual(reader.find('missing'), -1)
+
+    def test_file_without_index_is_read_up_to_last_full_chunk(self):
+        file_path = self.write('gzip', close=False)
+        self.assertEqual(list(read_lines(file_path)), self.lines[:len(self.lines) // 64 * 64])
+
+
+if __name__ == '__main__':
+    unittest.main()
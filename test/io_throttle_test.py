@@ -0,0 +1,76 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from io_throttle import AdaptiveConcurrencyLimiter, IOThrottle, RateLimiter
+
+
+class TestAdaptiveConcurrencyLimiter(unittest.TestCase):
+    def test_limit_grows_while_fast_and_halves_when_slow(self):
+        limiter = AdaptiveConcurrencyLimiter(max_concurrency=8, p99_target=0.1, adjust_every=10)
+        for _ in range(60):
+            limiter.acquire()
+            limiter.release(0.01)
+        self.assertEqual(limiter.limit, 7)
+
+        for _ in range(10):
+            limiter.acquire()
+            limiter.release(0.5)
+        self.assertEqual(limiter.limit, 3)
+        self.assertEqual(limiter.stats['decreases'], 1)
+
+    def test_limit_bounds_operations_in_flight(self):
+        limiter = AdaptiveConcurrencyLimiter(max_concurrency=4, p99_target=1)
+        in_flight = []
+        lock = threading.Lock()
+        peak = [0]
+
+        def work():
+            limiter.acquire()
+            with lock:
+                in_flight.append(1)
+                peak[0] = max(peak[0], len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.pop()
+            limiter.release(0.01)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # The limit starts at the minimum of one operation in flight
+        self.assertEqual(peak[0], 1)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_operations_per_second_are_capped(self):
+        limiter = RateLimiter(50)
+        start = time.monotonic()
+        for _ in range(75):
+            limiter.acquire()
+        # 50 tokens are available at once, the other 25 come in at 50 per second
+        self.assertGreaterEqual(time.monotonic() - start, 0.45)
+
+
+class TestIOThrottle(unittest.TestCase):
+    def test_from_config(self):
+        self.assertIsNone(IOThrottle.from_config({'io_max_ops_per_second': 0, 'io_p99_target_ms': 0}))
+        throttle = IOThrottle.from_config({'io_max_ops_per_second': 100, 'io_p99_target_ms': 0})
+        self.assertIsNotNone(throttle.rate_limiter)
+        self.assertIsNone(throttle.concurrency_limiter)
+
+    def test_operation_records_latency(self):
+        throttle = IOThrottle(p99_target_ms=100, max_concurrency=2)
+        with throttle.operation():
+            pass
+        self.assertEqual(throttle.concurrency_limiter.stats['operations'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import csv
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import long_filepath_filename_shortener as shortener
+from long_filepath_filename_shortener import process_scan_roots
+from work_scheduler import WorkStealingScheduler
+
+
+class TestConfigOverrides(unittest.TestCase):
+    def test_overrides_reach_scheduler_workers(self):
+        with patch.dict(shortener.CONFIG_VALUES, {'dir_length_threshold': 10}):
+            with shortener.CONFIG_VALUES.override({'dir_length_threshold': 99}):
+                seen = []
+                WorkStealingScheduler(3, lambda task: seen.append(shortener.CONFIG_VALUES.get('dir_length_threshold'))).run(range(6))
+                self.assertEqual(seen, [99] * 6)
+            self.assertEqual(shortener.CONFIG_VALUES['dir_length_threshold'], 10)
+
+
+class TestMultiRootScan(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'output')
+        os.makedirs(self.output_dir)
+
+        # The same filename in both roots, only over the filename threshold of the second one
+        self.roots = []
+        self.files = {}
+        for name, filename_length_threshold in [('first', 40), ('second', 20)]:
+            base_dir = os.path.join(self.test_dir, name)
+            os.makedirs(os.path.join(base_dir, 'folder'))
+            self.files[name] = os.path.join(base_dir, 'folder', 'a_fairly_long_filename.txt')
+            with open(self.files[name], 'w') as f:
+                f.write(name)
+            self.roots.append({'name': name, 'base_dir': base_dir, 'filename_length_threshold': filename_length_threshold,
+                               'dir_length_threshold': 1000, 'folder_conversion_stop_level': 6})
+
+        self.config_values = {
+            'output_dir': self.output_dir,
+            'date_str': '20220101',
+            'scan_entry_threshold': 1000,
+            'scan_workers': 2,
+            'scan_pruning': False,
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def read_filename_scan(self, name):
+        path = os.path.join(self.output_dir, name, 'filename_scan', 'long_filename_scan_output_20220101_part1.txt')
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f]
+
+    def test_roots_use_their_thresholds_and_output_folders(self):
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+            process_scan_roots(self.roots)
+
+        self.assertEqual(self.read_filename_scan('first'), [])
+        self.assertEqual(self.read_filename_scan('second'), [self.files['second']])
+
+        with open(os.path.join(self.output_dir, 'scan_summary_20220101.csv'), 'r', encoding='utf-8', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual([row[0] for row in rows], ['root', 'first', 'second', 'TOTAL'])
+        self.assertEqual(rows[-1][2], '1')
+
+
+if __name__ == '__main__':
+    unittest.main()
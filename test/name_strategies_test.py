@@ -0,0 +1,65 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import long_filepath_filename_shortener as shortener
+from long_filepath_filename_shortener import convert_name
+from name_strategies import DictionaryStrategy, PhraseStrategy, TruncateHashStrategy, VowelStripStrategy, StrategyPipeline
+from utilities import LRUCache
+
+
+class TestStrategies(unittest.TestCase):
+    def test_phrase_strategy_prefers_longest_phrase(self):
+        strategy = PhraseStrategy({'human resources': 'hr', 'human resources department': 'hrd'})
+        self.assertEqual(strategy.apply(['Human', 'Resources', 'Department', 'Budget'], 'dir', ''), ['hrd', 'Budget'])
+        self.assertEqual(strategy.apply(['human', 'Resources', 'Budget'], 'dir', ''), ['hr', 'Budget'])
+        self.assertEqual(strategy.apply(['Human', 'Budget'], 'dir', ''), ['Human', 'Budget'])
+
+    def test_truncate_hash_strategy(self):
+        strategy = TruncateHashStrategy(max_length=16, hash_length=4)
+        short = strategy.apply(['short', 'name'], 'file', 'short_name.txt')
+        self.assertEqual(short, ['short', 'name'])
+
+        first = strategy.apply(['a', 'really', 'long', 'name', 'one'], 'file', 'a_really_long_name_one.txt')
+        second = strategy.apply(['a', 'really', 'long', 'name', 'two'], 'file', 'a_really_long_name_two.txt')
+        self.assertEqual(len(first[0]) + len('.txt'), 16)
+        self.assertNotEqual(first, second)
+        self.assertTrue(first[0].startswith('a-reall~'))
+
+    def test_pipeline_records_bytes_saved(self):
+        pipeline = StrategyPipeline([DictionaryStrategy({'production': 'prod'}), VowelStripStrategy('[aeiou]', '[aeiou]')], 'test')
+        self.assertEqual(pipeline.apply(['production', 'report'], 'dir', 'production_report'), ['prd', 'rprt'])
+        self.assertEqual(pipeline.stats['dictionary']['bytes_saved'], 6)
+        self.assertEqual(pipeline.stats['vowel_strip']['bytes_saved'], 3)
+        self.assertEqual(pipeline.stats['vowel_strip']['calls'], 1)
+
+
+class TestConfiguredStrategies(unittest.TestCase):
+    def setUp(self):
+        self.config_values = {
+            'config_dir': 'config',
+            'dictionary_path': 'abbreviation_dictionary.csv',
+            'phrase_dictionary_path': 'phrase_dictionary.csv',
+            'shortening_strategies': 'dictionary, phrase, vowel_strip',
+            'dir_path_regex': '(?<!^)[aeiou](?!([A-Z]|$))',
+            'filename_regex': '[xyz]',
+        }
+
+    def test_filenames_use_filename_regex(self):
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'CONVERSION_CACHE', LRUCache()), patch.object(shortener, 'STRATEGY_PIPELINES', {}):
+            self.assertEqual(convert_name('human_resources_production_report', 'dir', False), 'hr-prd-rprt')
+            self.assertEqual(convert_name('Human_Resources_production_report.txt', 'file', False), 'hr-prod-report.txt')
+            self.assertEqual(convert_name('notes_without_extension', 'file', False), 'notes-without-etension')
+
+    def test_unknown_strategy_is_rejected(self):
+        self.config_values['shortening_strategies'] = 'dictionary, compress'
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'CONVERSION_CACHE', LRUCache()):
+            with self.assertRaises(ValueError):
+                convert_name('Production', 'dir', False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import long_filepath_filename_shortener as shortener
+from long_filepath_filename_shortener import RenameOverlay, load_rename_log, process_rollback, rename_filename, shorten_long_dir
+
+
+class TestRollback(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.base_dir = os.path.join(self.test_dir, 'base')
+        self.nested_dir = os.path.join(self.base_dir, 'production_folder', 'version_directory')
+        os.makedirs(self.nested_dir)
+        os.makedirs(os.path.join(self.test_dir, 'output', 'dry_run'))
+
+        self.file_path = os.path.join(self.nested_dir, 'a_long_report_name.txt')
+        with open(self.file_path, 'w') as f:
+            f.write("test content")
+
+        self.config_values = {
+            'output_dir': os.path.join(self.test_dir, 'output'),
+            'dry_run_dir': 'dry_run',
+            'date_str': '20220101',
+            'long_dir_path_modified_output': 'long_dir_path_modified_output',
+            'long_dir_path_modified_error': 'long_dir_path_modified_error',
+            'long_filename_modified_output': 'long_filename_modified_output',
+            'long_filename_modified_error': 'long_filename_modified_error',
+            'number_of_retry': 5,
+            'rename_workers': 1,
+            'dir_path_regex': '(?<!^)[aeiou](?!([A-Z]|$))',
+            'folder_conversion_stop_level': len(self.base_dir.split(os.sep)) - 2,
+        }
+
+        # A filename rename followed by the renames of its parent folders
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'RENAME_OVERLAY', RenameOverlay()):
+            renamed_file_path = os.path.join(self.nested_dir, 'report.txt')
+            rename_filename(self.file_path, renamed_file_path)
+            shorten_long_dir(renamed_file_path, True, len(self.base_dir) + 5, False)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_rollback_restores_original_tree(self):
+        self.assertFalse(os.path.exists(self.file_path))
+
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+            process_rollback('20220101', False)
+
+        self.assertTrue(os.path.isfile(self.file_path))
+        self.assertEqual(os.listdir(self.base_dir), ['production_folder'])
+        rollback_log = load_rename_log(os.path.join(self.test_dir, 'output', 'rollback_output_20220101.csv'))
+        self.assertEqual(len(rollback_log), 3)
+
+    def test_dry_run_rollback_leaves_tree_untouched(self):
+        tree_before = sorted(os.walk(self.base_dir))
+
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+            process_rollback('20220101', True)
+
+        self.assertEqual(sorted(os.walk(self.base_dir)), tree_before)
+        rollback_log = load_rename_log(os.path.join(self.test_dir, 'output', 'dry_run', 'dry_run_rollback_output_20220101.csv'))
+        self.assertEqual(len(rollback_log), 3)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, 'output', 'dry_run', 'dry_run_rollback_error_20220101.csv')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import external_sort as external_sort_module
+import long_filepath_filename_shortener as shortener
+from long_filepath_filename_shortener import process_diff, find_previous_scan_run
+from external_sort import external_sort, merge_join
+
+
+class TestExternalSort(unittest.TestCase):
+    def setUp(self):
+        self.run_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.run_dir)
+
+    def test_sorts_in_memory_and_on_disk(self):
+        lines = [f"path/{random.randrange(500)}" for _ in range(1000)]
+        self.assertEqual(list(external_sort(lines, self.run_dir, chunk_size=5000)), sorted(set(lines)))
+        self.assertEqual(list(external_sort(lines, self.run_dir, chunk_size=7)), sorted(set(lines)))
+
+    def test_merges_in_several_passes(self):
+        lines = [f"path/{i:04d}" for i in reversed(range(300))]
+        with patch.object(external_sort_module, 'MAX_MERGE_FAN_IN', 4):
+            self.assertEqual(list(external_sort(lines, self.run_dir, chunk_size=10)), sorted(lines))
+        # Only the runs of the last pass are left for the caller to remove
+        self.assertLessEqual(len(os.listdir(self.run_dir)), 4)
+
+    def test_merge_join(self):
+        self.assertEqual(list(merge_join(['a', 'b', 'd'], ['b', 'c', 'd', 'e'])),
+                         [('removed', 'a'), ('unchanged', 'b'), ('added', 'c'), ('unchanged', 'd'), ('added', 'e')])
+        self.assertEqual(list(merge_join([], ['a'])), [('added', 'a')])
+        self.assertEqual(list(merge_join(['a'], [])), [('removed', 'a')])
+
+
+class TestScanDiff(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'output')
+        os.makedirs(os.path.join(self.output_dir, 'dir_scan'))
+        os.makedirs(os.path.join(self.output_dir, 'filename_scan'))
+
+        self.write_scan('filename_scan', 'long_filename_scan_output', '20220101', ['/share/old.txt', '/share/kept.txt'])
+        self.write_scan('filename_scan', 'long_filename_scan_output', '20220102', ['/share/kept.txt', '/share/new.txt'])
+        # The directory scan may list another file of the same long directory
+        self.write_scan('dir_scan', 'long_dir_path_scan_output', '20220101', ['/share/long/a.txt', '/share/gone/a.txt'])
+        self.write_scan('dir_scan', 'long_dir_path_scan_output', '20220102', ['/share/long/b.txt'])
+
+        self.config_values = {
+            'output_dir': self.output_dir,
+            'dir_scan_dir': 'dir_scan',
+            'filename_scan_dir': 'filename_scan',
+            'long_dir_path_scan_output': 'long_dir_path_scan_output',
+            'long_filename_scan_output': 'long_filename_scan_output',
+            'date_str': '20220102',
+            'diff_sort_chunk_size': 1,
+            'scan_diff_output': 'scan_diff',
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def write_scan(self, scan_dir, scan_output, run, paths):
+        with open(os.path.join(self.output_dir, scan_dir, f"{scan_output}_{run}_part1.txt"), 'w', encoding='utf-8') as f:
+            f.writelines(f"{path}\n" for path in paths)
+
+    def read_diff(self, process_type, status):
+        with open(os.path.join(self.output_dir, f"scan_diff_{process_type}_20220102_{status}.txt"), 'r', encoding='utf-8') as f:
+            return [line.rstrip('\n') for line in f]
+
+    def test_diff_against_previous_scan(self):
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+            self.assertEqual(find_previous_scan_run('20220102'), '20220101')
+            summary = process_diff()
+
+        self.assertEqual(self.read_diff('filename', 'added'), ['/share/new.txt'])
+        self.assertEqual(self.read_diff('filename', 'removed'), ['/share/old.txt'])
+        self.assertEqual(self.read_diff('filename', 'unchanged'), ['/share/kept.txt'])
+        self.assertEqual(self.read_diff('dir', 'added'), [])
+        self.assertEqual(self.read_diff('dir', 'removed'), ['/share/gone'])
+        self.assertEqual(self.read_diff('dir', 'unchanged'), ['/share/long'])
+        self.assertEqual(summary['filename'], {'added': 1, 'removed': 1, 'unchanged': 1})
+        # The sorted runs are removed
+        self.assertEqual(sorted(os.listdir(self.output_dir))[:2], ['dir_scan', 'filename_scan'])
+        self.assertEqual(len(os.listdir(self.output_dir)), 8)
+
+    def test_no_earlier_scan(self):
+        with patch.dict(shortener.CONFIG_VALUES, dict(self.config_values, date_str='20220101')):
+            self.assertIsNone(process_diff())
+
+
+if __name__ == '__main__':
+    unittest.main()
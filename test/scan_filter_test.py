@@ -0,0 +1,60 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scan_filter import ScanFilter, split_patterns
+
+
+class TestScanFilter(unittest.TestCase):
+    def setUp(self):
+        self.base_dir = os.path.join(os.sep, 'share', 'base')
+
+    def path(self, *parts):
+        return os.path.join(self.base_dir, *parts)
+
+    def test_split_patterns(self):
+        self.assertEqual(split_patterns(".git/, node_modules/\n*.bak,"), ['.git/', 'node_modules/', '*.bak'])
+        self.assertEqual(split_patterns(''), [])
+
+    def test_excluded_folders_at_any_depth(self):
+        scan_filter = ScanFilter(self.base_dir, exclude=['.git/', 'node_modules/', 'archive/**/backup'])
+
+        self.assertFalse(scan_filter.allows_dir(self.path('.git')))
+        self.assertFalse(scan_filter.allows_dir(self.path('project', 'web', 'node_modules')))
+        self.assertFalse(scan_filter.allows_dir(self.path('archive', 'backup')))
+        self.assertFalse(scan_filter.allows_dir(self.path('archive', '2020', 'backup')))
+        self.assertTrue(scan_filter.allows_dir(self.path('project', 'archive', 'backup')))
+        self.assertTrue(scan_filter.allows_dir(self.path('project', 'src')))
+
+        # Folder-only patterns do not match files
+        self.assertTrue(scan_filter.allows_file(self.path('project', 'node_modules'), self.path('project')))
+
+    def test_file_patterns_and_exceptions(self):
+        scan_filter = ScanFilter(self.base_dir, exclude=['*.bak', '!keep_*.bak', '~$*'])
+
+        self.assertFalse(scan_filter.allows_file(self.path('docs', 'report.bak'), self.path('docs')))
+        self.assertTrue(scan_filter.allows_file(self.path('docs', 'keep_report.bak'), self.path('docs')))
+        self.assertFalse(scan_filter.allows_file(self.path('docs', '~$report.docx'), self.path('docs')))
+        self.assertTrue(scan_filter.allows_file(self.path('docs', 'report.docx'), self.path('docs')))
+
+    def test_include_patterns(self):
+        scan_filter = ScanFilter(self.base_dir, include=['*.pdf', 'docs/*.docx'])
+
+        self.assertTrue(scan_filter.allows_file(self.path('a', 'b', 'report.pdf'), self.path('a', 'b')))
+        self.assertTrue(scan_filter.allows_file(self.path('docs', 'report.docx'), self.path('docs')))
+        self.assertFalse(scan_filter.allows_file(self.path('a', 'docs', 'report.docx'), self.path('a', 'docs')))
+
+    def test_depth_limits(self):
+        scan_filter = ScanFilter(self.base_dir, min_depth=2, max_depth=3)
+
+        self.assertTrue(scan_filter.allows_dir(self.path('a', 'b', 'c')))
+        self.assertFalse(scan_filter.allows_dir(self.path('a', 'b', 'c', 'd')))
+        self.assertFalse(scan_filter.allows_file(self.path('a', 'file.txt'), self.path('a')))
+        self.assertTrue(scan_filter.allows_file(self.path('a', 'b', 'file.txt'), self.path('a', 'b')))
+        self.assertFalse(ScanFilter(self.base_dir).is_active())
+
+
+if __name__ == '__main__':
+    unittest.main()
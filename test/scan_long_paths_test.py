@@ -0,0 +1,435 @@
+import os
+import sys
+import glob
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import long_filepath_filename_shortener as shortener
+from long_filepath_filename_shortener import scan_long_paths_and_long_filename, merge_shard_scan_outputs, parse_shard, parse_scan_record, process_queued_path
+from utilities import to_long_path
+
+
+class TestToLongPath(unittest.TestCase):
+    def test_windows_paths(self):
+        self.assertEqual(to_long_path('C:\\Users\\test', os_name='nt'), '\\\\?\\C:\\Users\\test')
+        self.assertEqual(to_long_path('\\\\server\\share\\dir', os_name='nt'), '\\\\?\\UNC\\server\\share\\dir')
+        self.assertEqual(to_long_path('\\\\?\\C:\\Users\\test', os_name='nt'), '\\\\?\\C:\\Users\\test')
+
+    def test_posix_paths(self):
+        self.assertEqual(to_long_path('/mnt/share/dir', os_name='posix'), b'/mnt/share/dir')
+
+
+class ScanTestCase(unittest.TestCase):
+    """ Creates a small tree with long filenames and long directories, and an output directory for the scan. """
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.base_dir = os.path.join(self.test_dir, 'base')
+        self.output_dir = os.path.join(self.test_dir, 'output')
+        self.long_dir = os.path.join(self.base_dir, 'a_rather_long_directory_name', 'another_long_directory')
+        os.makedirs(self.long_dir)
+        os.makedirs(os.path.join(self.base_dir, 'short'))
+        os.makedirs(os.path.join(self.output_dir, 'dir_scan'))
+        os.makedirs(os.path.join(self.output_dir, 'filename_scan'))
+
+        self.files = {
+            'short_file': os.path.join(self.base_dir, 'short', 'a.txt'),
+            'long_filename': os.path.join(self.base_dir, 'short', 'a_very_long_filename_for_testing.txt'),
+            'long_dir_1': os.path.join(self.long_dir, 'b.txt'),
+            'long_dir_2': os.path.join(self.long_dir, 'c.txt'),
+        }
+        for path in self.files.values():
+            with open(path, 'w') as f:
+                f.write("test content")
+
+        self.config_values = {
+            'output_dir': self.output_dir,
+            'dir_scan_dir': 'dir_scan',
+            'filename_scan_dir': 'filename_scan',
+            'long_dir_path_scan_output': 'long_dir_path_scan_output',
+            'long_filename_scan_output': 'long_filename_scan_output',
+            'date_str': '20220101',
+            'filename_length_threshold': 20,
+            'dir_length_threshold': len(self.base_dir) + 30,
+            'scan_entry_threshold': 1000,
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def read_scan_output(self, scan_dir):
+        lines = []
+        for part_file in sorted(glob.glob(os.path.join(self.output_dir, scan_dir, '*_part*'))):
+            with open(part_file, 'r', encoding='utf-8') as f:
+                lines += [line.strip() for line in f]
+        return lines
+
+
+class TestScanLongPaths(ScanTestCase):
+    def test_scan_finds_long_filenames_and_dirs(self):
+        counters = {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1}
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+            scan_long_paths_and_long_filename(self.base_dir, counters)
+
+        self.assertEqual(self.read_scan_output('filename_scan'), [self.files['long_filename']])
+
+        # Only one file is reported per long directory
+        long_dir_lines = self.read_scan_output('dir_scan')
+        self.assertEqual(len(long_dir_lines), 1)
+        self.assertEqual(os.path.dirname(long_dir_lines[0]), self.long_dir)
+
+    @unittest.skipUnless(shortener.SUPPORTS_DIR_FD, "dir_fd-relative calls are not supported on this platform")
+    def test_tree_deeper_than_path_max(self):
+        # Built relative to open descriptors, since no single path to the bottom fits in PATH_MAX
+        names = [f"{i:02d}" + 'd' * 198 for i in range(25)]
+        self.config_values['scan_workers'] = 1
+        dir_fd = os.open(self.base_dir, os.O_RDONLY)
+        for name in names:
+            os.mkdir(name, dir_fd=dir_fd)
+            child_fd = os.open(name, os.O_RDONLY, dir_fd=dir_fd)
+            os.close(dir_fd)
+            dir_fd = child_fd
+            with open(os.open('a_very_long_filename_for_testing.txt', os.O_WRONLY | os.O_CREAT, dir_fd=dir_fd), 'w') as f:
+                f.write("test content")
+            # Siblings listed in between push the parents of the deep folders out of the small cache
+            for sibling in range(8):
+                os.mkdir(f"sibling{sibling}", dir_fd=dir_fd)
+        os.close(dir_fd)
+
+        counters = {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1}
+        fd_cache = shortener.DirFdCache(4)
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'DIR_FD_CACHE', fd_cache):
+            scan_long_paths_and_long_filename(self.base_dir, counters)
+        fd_cache.close_all()
+
+        # Every level is listed, down to the one whose path is over 4096 bytes
+        deep_files = [path for path in self.read_scan_output('filename_scan') if os.path.basename(os.path.dirname(path)) in names]
+        self.assertEqual(len(deep_files), len(names))
+        self.assertGreater(max(len(os.fsencode(path)) for path in deep_files), 4096)
+
+    def test_excluded_folders_are_not_listed(self):
+        self.config_values['scan_exclude'] = 'a_rather_long_directory_name/'
+        counters = {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1}
+        listed_dirs = []
+        scandir = os.scandir
+
+        def recording_scandir(path):
+            listed_dirs.append(path)
+            return scandir(path)
+
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'DIR_FD_CACHE', None), patch('os.scandir', recording_scandir):
+            scan_long_paths_and_long_filename(self.base_dir, counters)
+
+        self.assertEqual(self.read_scan_output('dir_scan'), [])
+        self.assertEqual(self.read_scan_output('filename_scan'), [self.files['long_filename']])
+        self.assertEqual(sorted(listed_dirs), [self.base_dir, os.path.join(self.base_dir, 'short')])
+
+    def test_compressed_output_format(self):
+        counters = {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1}
+        self.config_values['scan_output_format'] = 'lzma'
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+            scan_long_paths_and_long_filename(self.base_dir, counters)
+            part_files = glob.glob(os.path.join(self.output_dir, 'filename_scan', '*_part*'))
+            self.assertEqual([os.path.splitext(part_file)[1] for part_file in part_files], ['.fcz'])
+            self.assertEqual(list(shortener.read_queued_paths(part_files)), [self.files['long_filename']])
+
+    def test_byte_length_unit(self):
+        # 12 characters, but 36 UTF-8 bytes
+        cjk_file = os.path.join(self.base_dir, 'short', '\u5831\u544a' * 4 + '.txt')
+        with open(cjk_file, 'w') as f:
+            f.write("test content")
+
+        for length_unit, expected in [('chars', [self.files['long_filename']]), ('utf8', sorted([self.files['long_filename'], cjk_file]))]:
+            shutil.rmtree(os.path.join(self.output_dir, 'filename_scan'))
+            os.makedirs(os.path.join(self.output_dir, 'filename_scan'))
+            self.config_values['length_unit'] = length_unit
+            counters = {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1}
+            with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+                scan_long_paths_and_long_filename(self.base_dir, counters)
+            self.assertEqual(sorted(self.read_scan_output('filename_scan')), expected)
+
+
+class TestScanMetadata(ScanTestCase):
+    def scan_records(self):
+        self.config_values['scan_metadata'] = True
+        counters = {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1}
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+            scan_long_paths_and_long_filename(self.base_dir, counters)
+        return [parse_scan_record(line) for line in self.read_scan_output('filename_scan')]
+
+    def test_records_carry_metadata(self):
+        [(path, metadata)] = self.scan_records()
+        file_stat = os.lstat(self.files['long_filename'])
+        self.assertEqual(path, self.files['long_filename'])
+        self.assertEqual(metadata, ('f', file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns))
+
+    def test_bare_path_lines_are_still_read(self):
+        self.assertEqual(parse_scan_record('/tmp/a\tb.txt\n'), ('/tmp/a\tb.txt', None))
+        self.assertEqual(parse_scan_record('/tmp/a\tb.txt\tf\t12\t3\t45\n'), ('/tmp/a\tb.txt', ('f', 12, 3, 45)))
+
+    def test_replaced_files_are_skipped(self):
+        [(path, metadata)] = self.scan_records()
+        os.remove(path)
+        with open(path + '.tmp', 'w') as f:
+            f.write("new content")
+        os.rename(path + '.tmp', path)
+
+        self.config_values['long_filename_modified_error'] = 'long_filename_modified_error'
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'shorten_long_filename') as mock_shorten:
+            process_queued_path('filename', path, True, True, ('f', metadata[1] + 1, metadata[2], metadata[3]))
+            mock_shorten.assert_not_called()
+            process_queued_path('filename', path, True, True, ('f', os.lstat(path).st_ino, 0, 0))
+            mock_shorten.assert_called_once()
+
+        with open(os.path.join(self.output_dir, 'long_filename_modified_error_20220101.csv'), 'r', encoding='utf-8') as f:
+            self.assertIn(path, f.read())
+
+
+class TestScanLinks(ScanTestCase):
+    def setUp(self):
+        super().setUp()
+        # A loop back to the base directory and a second path to the long directory
+        os.symlink(self.base_dir, os.path.join(self.base_dir, 'short', 'loop'))
+        os.symlink(self.long_dir, os.path.join(self.base_dir, 'short', 'alias'))
+        self.config_values['scan_alias_output'] = 'scan_alias'
+
+    def scan(self, follow_links):
+        self.config_values['follow_links'] = follow_links
+        counters = {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1}
+        listed_dirs = []
+        scandir = os.scandir
+
+        def recording_scandir(path):
+            listed_dirs.append(path)
+            return scandir(path)
+
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'DIR_FD_CACHE', None), patch('os.scandir', recording_scandir):
+            scan_long_paths_and_long_filename(self.base_dir, counters)
+        return listed_dirs
+
+    def read_alias_output(self):
+        alias_output = os.path.join(self.output_dir, 'scan_alias_20220101.csv')
+        if not os.path.exists(alias_output):
+            return []
+        with open(alias_output, 'r', encoding='utf-8') as f:
+            return sorted(line.split(',')[0] for line in f)
+
+    def test_links_are_not_followed_by_default(self):
+        listed_dirs = self.scan(False)
+        self.assertNotIn(os.path.join(self.base_dir, 'short', 'loop'), listed_dirs)
+        self.assertEqual(self.read_alias_output(), [])
+        self.assertEqual(self.read_scan_output('filename_scan'), [self.files['long_filename']])
+
+    def test_each_physical_folder_is_listed_once_when_following_links(self):
+        listed_dirs = self.scan(True)
+        self.assertEqual(len(listed_dirs), len(set(listed_dirs)))
+        # Whichever path to the long directory is listed first is the one walked, the other is reported
+        aliases = self.read_alias_output()
+        self.assertEqual(len(aliases), 2)
+        self.assertIn(os.path.join(self.base_dir, 'short', 'loop'), aliases)
+        self.assertTrue({os.path.join(self.base_dir, 'short', 'alias'), self.long_dir} & set(aliases))
+        self.assertEqual(self.read_scan_output('filename_scan'), [self.files['long_filename']])
+
+
+class TestScanQuarantine(ScanTestCase):
+    def setUp(self):
+        super().setUp()
+        self.stalled_dir = os.path.join(self.base_dir, 'short')
+        self.stalls_left = 0
+        self.release = threading.Event()
+        self.config_values.update({
+            'scan_listing_timeout_seconds': 0.2, 'scan_retry_attempts': 2, 'scan_retry_backoff_seconds': 0,
+            'scan_quarantine_output': 'scan_quarantine', 'scan_pruning': True, 'dir_index_file': 'dir_index.csv',
+            'prune_revalidate_days': 7, 'prune_margin': 0,
+        })
+
+    def tearDown(self):
+        self.release.set()
+        super().tearDown()
+
+    def scan(self):
+        for scan_dir in ['dir_scan', 'filename_scan']:
+            shutil.rmtree(os.path.join(self.output_dir, scan_dir))
+            os.makedirs(os.path.join(self.output_dir, scan_dir))
+        counters = {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1}
+        listed_dirs = []
+        scandir = os.scandir
+
+        # Listings of the stalled folder hang like on an offline volume, until stalls_left runs out
+        def stalling_scandir(path):
+            listed_dirs.append(path)
+            if path == self.stalled_dir and self.stalls_left:
+                self.stalls_left -= 1
+                self.release.wait(5)
+            return scandir(path)
+
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'DIR_FD_CACHE', None), patch('os.scandir', stalling_scandir):
+            scan_long_paths_and_long_filename(self.base_dir, counters)
+        return listed_dirs, self.read_scan_output('filename_scan')
+
+    def read_quarantine_output(self):
+        with open(os.path.join(self.output_dir, 'scan_quarantine_20220101.csv'), 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f]
+
+    def test_stalled_folder_is_retried_at_the_end(self):
+        self.stalls_left = 1
+        listed_dirs, filenames = self.scan()
+        self.assertEqual(filenames, [self.files['long_filename']])
+        self.assertEqual(listed_dirs[-1], self.stalled_dir)
+        self.assertEqual(len(self.read_quarantine_output()), 1)
+
+    def test_folder_given_up_on_is_deferred_in_the_next_scan(self):
+        self.stalls_left = 3
+        _, filenames = self.scan()
+        self.assertEqual(filenames, [])
+        self.assertIn('Gave up after 2 retries', self.read_quarantine_output()[-1])
+
+        # Listed last, once the rest of the tree is done, and not pruned
+        listed_dirs, filenames = self.scan()
+        self.assertEqual(filenames, [self.files['long_filename']])
+        self.assertEqual(listed_dirs[-1], self.stalled_dir)
+
+    def test_deferred_folder_is_listed_without_retries(self):
+        self.stalls_left = 3
+        self.scan()
+
+        # Without retries, a folder quarantined by the last scan is still listed once in this one, without a backoff
+        self.config_values.update({'scan_retry_attempts': 0, 'scan_retry_backoff_seconds': 60})
+        with patch.object(shortener.time, 'sleep') as mock_sleep:
+            listed_dirs, filenames = self.scan()
+            mock_sleep.assert_not_called()
+        self.assertEqual(filenames, [self.files['long_filename']])
+        self.assertEqual(listed_dirs.count(self.stalled_dir), 1)
+
+        # Listed fine, so the next scan lists it in place
+        listed_dirs, _ = self.scan()
+        self.assertNotEqual(listed_dirs[-1], self.stalled_dir)
+
+
+class TestScanPruning(ScanTestCase):
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.base_dir, 'tiny', 'x'))
+        with open(os.path.join(self.base_dir, 'tiny', 'x', 'y.txt'), 'w') as f:
+            f.write("test content")
+        self.config_values.update({'scan_pruning': True, 'dir_index_file': 'dir_index.csv', 'prune_revalidate_days': 7, 'prune_margin': 0})
+
+    def scan(self):
+        for scan_dir in ['dir_scan', 'filename_scan']:
+            shutil.rmtree(os.path.join(self.output_dir, scan_dir))
+            os.makedirs(os.path.join(self.output_dir, scan_dir))
+        counters = {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1}
+        listed_dirs = []
+        scandir = os.scandir
+
+        def recording_scandir(path):
+            listed_dirs.append(path)
+            return scandir(path)
+
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'DIR_FD_CACHE', None), patch('os.scandir', recording_scandir):
+            scan_long_paths_and_long_filename(self.base_dir, counters)
+        return listed_dirs, self.read_scan_output('dir_scan'), self.read_scan_output('filename_scan')
+
+    def test_short_subtrees_are_pruned_after_first_scan(self):
+        first_listed, first_dirs, first_filenames = self.scan()
+        self.assertIn(os.path.join(self.base_dir, 'tiny'), first_listed)
+
+        second_listed, second_dirs, second_filenames = self.scan()
+        self.assertNotIn(os.path.join(self.base_dir, 'tiny'), second_listed)
+        self.assertIn(self.long_dir, second_listed)
+        self.assertEqual((second_dirs, second_filenames), (first_dirs, first_filenames))
+
+        # The pruned subtree keeps its index entries, so it stays pruned
+        third_listed, _, _ = self.scan()
+        self.assertEqual(third_listed, second_listed)
+
+    def test_expired_entries_are_listed_again(self):
+        self.config_values['prune_revalidate_days'] = -1
+        first_listed, _, _ = self.scan()
+        second_listed, _, _ = self.scan()
+        self.assertEqual(sorted(second_listed), sorted(first_listed))
+
+
+class TestShardedScan(ScanTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(6):
+            project_dir = os.path.join(self.base_dir, f"project_{i}", 'a_deeply_nested_folder_name')
+            os.makedirs(project_dir)
+            with open(os.path.join(project_dir, f"report_for_project_number_{i}.txt"), 'w') as f:
+                f.write("test content")
+        self.config_values['scan_entry_threshold'] = 2
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard('2/4'), (2, 4))
+        for value in ['0/4', '5/4', 'a/b', '1']:
+            with self.assertRaises(Exception):
+                parse_shard(value)
+
+    def test_merged_shards_match_full_scan(self):
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+            counters = {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1}
+            scan_long_paths_and_long_filename(self.base_dir, counters)
+            expected_dirs = sorted(self.read_scan_output('dir_scan'))
+            expected_filenames = sorted(self.read_scan_output('filename_scan'))
+            for scan_dir in ['dir_scan', 'filename_scan']:
+                shutil.rmtree(os.path.join(self.output_dir, scan_dir))
+                os.makedirs(os.path.join(self.output_dir, scan_dir))
+
+            for shard_index in range(1, 4):
+                shard = (shard_index, 3)
+                counters = {'dir_counter': 0, 'filename_counter': 0, 'dir_file_part': 1, 'filename_file_part': 1, 'shard_label': shortener.get_shard_label(shard)}
+                scan_long_paths_and_long_filename(self.base_dir, counters, shard)
+            merge_shard_scan_outputs()
+
+        merged_dirs = []
+        merged_filenames = []
+        for part_number in range(1, 10):
+            for scan_dir, scan_output, merged in [('dir_scan', 'long_dir_path_scan_output', merged_dirs), ('filename_scan', 'long_filename_scan_output', merged_filenames)]:
+                part_file = os.path.join(self.output_dir, scan_dir, f"{scan_output}_20220101_part{part_number}.txt")
+                if os.path.exists(part_file):
+                    with open(part_file, 'r', encoding='utf-8') as f:
+                        merged += [line.strip() for line in f]
+
+        self.assertEqual(merged_dirs, expected_dirs)
+        self.assertEqual(merged_filenames, expected_filenames)
+
+    def test_merge_sorts_shards_on_disk(self):
+        dirs = [os.path.join(self.base_dir, 'a'), os.path.join(self.base_dir, 'a', 'b'), os.path.join(self.base_dir, 'c')]
+        shard_lines = {
+            'long_dir_path_scan_output': [[os.path.join(dirs[0], 'z.txt'), os.path.join(dirs[1], 'y.txt')],
+                                          [os.path.join(dirs[0], 'a.txt'), os.path.join(dirs[2], 'x.txt'), os.path.join(dirs[1], 'y.txt')]],
+            'long_filename_scan_output': [[os.path.join(dirs[0], 'z.txt'), os.path.join(dirs[0], 'a.txt') + '\tf\t1\t2\t3'],
+                                          [os.path.join(dirs[0], 'a.txt'), os.path.join(dirs[1], 'y.txt')]],
+        }
+        for scan_dir, scan_output in [('dir_scan', 'long_dir_path_scan_output'), ('filename_scan', 'long_filename_scan_output')]:
+            for shard_index, lines in enumerate(shard_lines[scan_output], 1):
+                with open(os.path.join(self.output_dir, scan_dir, f"{scan_output}_20220101_shard{shard_index}of2_part1.txt"), 'w', encoding='utf-8') as f:
+                    f.writelines(f"{line}\n" for line in lines)
+
+        with patch.dict(shortener.CONFIG_VALUES, dict(self.config_values, diff_sort_chunk_size=2)):
+            merge_shard_scan_outputs()
+
+        def read_merged(scan_dir, scan_output):
+            lines = []
+            for part_number in [1, 2]:
+                with open(os.path.join(self.output_dir, scan_dir, f"{scan_output}_20220101_part{part_number}.txt"), 'r', encoding='utf-8') as f:
+                    lines += [line.rstrip('\n') for line in f]
+            return lines
+
+        # One path per long directory, the first one in sorted order, written in parts of `scan_entry_threshold` lines
+        self.assertEqual(read_merged('dir_scan', 'long_dir_path_scan_output'),
+                         [os.path.join(dirs[0], 'a.txt'), os.path.join(dirs[1], 'y.txt'), os.path.join(dirs[2], 'x.txt')])
+        merged_filenames = read_merged('filename_scan', 'long_filename_scan_output')
+        self.assertEqual([parse_scan_record(line)[0] for line in merged_filenames],
+                         [os.path.join(dirs[0], 'a.txt'), os.path.join(dirs[1], 'y.txt'), os.path.join(dirs[0], 'z.txt')])
+        self.assertEqual(sorted(os.listdir(self.output_dir)), ['dir_scan', 'filename_scan'])
+
+
+if __name__ == '__main__':
+    unittest.main()
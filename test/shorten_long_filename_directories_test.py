@@ -3,10 +3,13 @@ import os
 import shutil
 import sys
 import csv
+import tempfile
+from unittest.mock import patch
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from long_filepath_filename_shortener import read_config_values, shorten_long_dir, shorten_long_filename
+import long_filepath_filename_shortener as shortener
+from long_filepath_filename_shortener import read_config_values, shorten_long_dir, shorten_long_filename, check_for_naming_conflict, get_hash_suffix
 
 class TestShortenLongDir(unittest.TestCase):
     def setUp(self):
@@ -156,5 +159,96 @@ class TestShortenLongDir(unittest.TestCase):
     #             self.assertEqual(row, expected_row)
 
 
+class TestNamingModes(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.test_dir, "production_report_final.txt")
+        with open(self.file_path, "w") as f:
+            f.write("test content")
+        self.config_values = {
+            'output_dir': self.test_dir,
+            'date_str': '20220101',
+            'long_filename_modified_output': 'long_filename_modified_output',
+            'long_filename_modified_error': 'long_filename_modified_error',
+            'number_of_retry': 3,
+            'dir_path_regex': '(?<!^)[aeiou](?!([A-Z]|$))',
+            'hash_suffix_length': 6,
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_counter_suffix_keeps_the_whole_name(self):
+        with open(os.path.join(self.test_dir, "report_final.txt"), "w") as f:
+            f.write("existing file")
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+            new_file_path = check_for_naming_conflict(self.file_path, "report_final.txt")
+        self.assertEqual(new_file_path, os.path.join(self.test_dir, "report_final_1.txt"))
+
+    def test_hash_suffix_is_stable(self):
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+            suffix = get_hash_suffix(self.file_path)
+            self.assertEqual(suffix, get_hash_suffix(self.file_path))
+            self.assertNotEqual(suffix, get_hash_suffix(self.file_path + "2"))
+        self.assertEqual(len(suffix), 6)
+
+    def test_hash_naming_mode_renames_without_probing(self):
+        self.config_values['naming_mode'] = 'hash'
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'check_for_naming_conflict') as mock_check:
+            suffix = get_hash_suffix(self.file_path)
+            shorten_long_filename(self.file_path, True, 100, False)
+            mock_check.assert_not_called()
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, f"prdctn-rprt-fnl~{suffix}.txt")))
+
+    def test_hash_naming_mode_is_stable_across_runs(self):
+        self.config_values['naming_mode'] = 'hash'
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+            new_file_path = shorten_long_filename(self.file_path, True, 10, False)
+            self.assertIsNotNone(new_file_path)
+            # The name is still over the threshold, but shortening it again changes nothing
+            self.assertIsNone(shorten_long_filename(new_file_path, True, 10, False))
+        self.assertEqual(os.listdir(self.test_dir).count(os.path.basename(new_file_path)), 1)
+
+    def test_hash_naming_mode_keeps_name_parts_that_look_like_a_hash(self):
+        self.config_values['naming_mode'] = 'hash'
+        paths = [os.path.join(self.test_dir, name) for name in ["Annual_Financial_report.txt", "Annual-Financial_report.txt"]]
+        for path in paths:
+            with open(path, "w") as f:
+                f.write(path)
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+            new_file_paths = [shorten_long_filename(path, True, 10, False) for path in paths]
+
+        self.assertNotEqual(new_file_paths[0], new_file_paths[1])
+        for path, new_file_path in zip(paths, new_file_paths):
+            self.assertIn("rprt~", os.path.basename(new_file_path))
+            with open(new_file_path) as f:
+                self.assertEqual(f.read(), path)
+
+    def test_hash_naming_mode_never_replaces_a_file(self):
+        self.config_values['naming_mode'] = 'hash'
+        other_path = os.path.join(self.test_dir, "production-report-final.txt")
+        with open(other_path, "w") as f:
+            f.write("other content")
+        # Both names convert alike, and their hashes collide
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), patch.object(shortener, 'get_hash_suffix', lambda path: 'aaaaaa'):
+            self.assertIsNotNone(shorten_long_filename(self.file_path, True, 10, False))
+            self.assertIsNone(shorten_long_filename(other_path, True, 10, False))
+        with open(other_path) as f:
+            self.assertEqual(f.read(), "other content")
+
+    def test_hash_naming_mode_keeps_the_suffix_of_a_folder(self):
+        self.config_values.update({'naming_mode': 'hash', 'folder_conversion_stop_level': 0})
+        dir_path = os.path.join(self.test_dir, "production_documents")
+        os.makedirs(dir_path)
+        file_path = os.path.join(dir_path, "a.txt")
+        with open(file_path, "w") as f:
+            f.write("test content")
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values):
+            shorten_long_dir(file_path, True, len(self.test_dir) + 5, False)
+            renamed = [name for name in os.listdir(self.test_dir) if name.startswith("prdctn")]
+            shorten_long_dir(os.path.join(self.test_dir, renamed[0], "a.txt"), True, len(self.test_dir) + 5, False)
+        self.assertEqual([name for name in os.listdir(self.test_dir) if name.startswith("prdctn")], renamed)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,155 @@
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import long_filepath_filename_shortener as shortener
+from long_filepath_filename_shortener import process_dir_or_filename, parse_time_budget, prioritize_queue, load_rename_log
+
+
+class TestTimeBudgetHelpers(unittest.TestCase):
+    def test_parse_time_budget(self):
+        self.assertEqual(parse_time_budget('2h'), 7200)
+        self.assertEqual(parse_time_budget('90m'), 5400)
+        self.assertEqual(parse_time_budget('45s'), 45)
+        self.assertEqual(parse_time_budget('30'), 1800)
+        for value in ['', '0', '-5m', '2d']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                parse_time_budget(value)
+
+    def test_prioritize_queue(self):
+        self.assertEqual(list(prioritize_queue(['bb', 'a', 'dddd', 'ccc'], len)), ['dddd', 'ccc', 'bb', 'a'])
+
+
+class TestTimeBudgetedRun(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'output')
+        os.makedirs(os.path.join(self.output_dir, 'dir_scan'))
+
+        self.paths = [os.path.join(self.test_dir, 'd' * length, 'file.txt') for length in [5, 20, 10, 15]]
+        with open(os.path.join(self.output_dir, 'dir_scan', 'long_dir_path_scan_output_20220101_part1.txt'), 'w', encoding='utf-8') as f:
+            f.writelines(f"{path}\n" for path in self.paths)
+
+        self.config_values = {
+            'output_dir': self.output_dir,
+            'dir_scan_dir': 'dir_scan',
+            'filename_scan_dir': 'filename_scan',
+            'long_dir_path_scan_output': 'long_dir_path_scan_output',
+            'long_filename_scan_output': 'long_filename_scan_output',
+            'date_str': '20220101',
+            'dir_length_threshold': len(self.test_dir),
+            'conversion_cache_file': '',
+            'verify_renames': False,
+            'dry_run': False,
+        }
+        self.clock = 0.0
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def run_dir_process(self, time_budget):
+        processed = []
+
+        # Each path takes one second of the budget
+        def fake_process_queued_path(process_type, path, if_use_regular_expression, dry_run, metadata=None):
+            processed.append(path)
+            self.clock += 1
+
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), \
+                patch.object(shortener, 'process_queued_path', fake_process_queued_path), \
+                patch.object(shortener.time, 'monotonic', lambda: self.clock):
+            process_dir_or_filename('dir', time_budget)
+        return processed
+
+    def test_longest_paths_first_then_resume_from_checkpoint(self):
+        checkpoint_file_path = os.path.join(self.output_dir, 'dir_scan', 'long_dir_path_scan_output_20220101_checkpoint.txt')
+
+        self.assertEqual(self.run_dir_process(2), [self.paths[1], self.paths[3]])
+        with open(checkpoint_file_path, 'r', encoding='utf-8') as f:
+            self.assertEqual([line.strip() for line in f], [self.paths[2], self.paths[0]])
+
+        # The checkpoint keeps the priority order
+        self.assertEqual(self.run_dir_process(None), [self.paths[2], self.paths[0]])
+        self.assertFalse(os.path.exists(checkpoint_file_path))
+
+
+class TestResumeAfterFolderRenames(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.test_dir, 'output')
+        self.base_dir = os.path.join(self.test_dir, 'base')
+        os.makedirs(os.path.join(self.output_dir, 'dir_scan'))
+
+        # The first path is the longest, and its run renames the shared parent. The second needs its grandchild renamed.
+        parent_dir = os.path.join(self.base_dir, 'production_folder_documents_archive')
+        self.paths = [
+            os.path.join(parent_dir, 'x' * 60, 'file1.txt'),
+            os.path.join(parent_dir, 'version_directory', 'preprocess_results', 'file2.txt'),
+        ]
+        for path in self.paths:
+            os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write("test content")
+        with open(os.path.join(self.output_dir, 'dir_scan', 'long_dir_path_scan_output_20220101_part1.txt'), 'w', encoding='utf-8') as f:
+            f.writelines(f"{path}\n" for path in self.paths)
+
+        self.config_values = {
+            'output_dir': self.output_dir,
+            'dir_scan_dir': 'dir_scan',
+            'long_dir_path_scan_output': 'long_dir_path_scan_output',
+            'long_dir_path_modified_output': 'long_dir_path_modified_output',
+            'long_dir_path_modified_error': 'long_dir_path_modified_error',
+            'date_str': '20220101',
+            'dir_length_threshold': len(self.base_dir) + 30,
+            'folder_conversion_stop_level': len(self.base_dir.split(os.sep)) - 2,
+            'dir_path_regex': '(?<!^)[aeiou](?!([A-Z]|$))',
+            'regular_expression': True,
+            'naming_mode': 'counter',
+            'number_of_retry': 5,
+            'conversion_cache_file': '',
+            'verify_renames': False,
+            'dry_run': False,
+        }
+        self.clock = 0.0
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def run_dir_process(self, time_budget):
+        process_queued_path = shortener.process_queued_path
+
+        # Each path takes one second of the budget
+        def timed_process_queued_path(*args, **kwargs):
+            process_queued_path(*args, **kwargs)
+            self.clock += 1
+
+        with patch.dict(shortener.CONFIG_VALUES, self.config_values), \
+                patch.object(shortener, 'process_queued_path', timed_process_queued_path), \
+                patch.object(shortener.time, 'monotonic', lambda: self.clock):
+            process_dir_or_filename('dir', time_budget)
+
+    def test_resume_renames_under_a_renamed_parent(self):
+        rename_log = os.path.join(self.output_dir, 'long_dir_path_modified_output_20220101.csv')
+        self.run_dir_process(1)
+        self.assertFalse(os.path.exists(os.path.dirname(self.paths[1])))
+        first_run_renames = len(load_rename_log(rename_log))
+        self.assertEqual(shortener.RENAME_OVERLAY.operations, first_run_renames)
+
+        self.run_dir_process(None)
+        # Only the renames of the resumed run are counted, not the ones replayed from the log
+        self.assertEqual(shortener.RENAME_OVERLAY.operations, len(load_rename_log(rename_log)) - first_run_renames)
+        self.assertGreater(shortener.RENAME_OVERLAY.operations, 0)
+        renamed_dirs = [dir_path for dir_path, _, file_names in os.walk(self.base_dir) if 'file2.txt' in file_names]
+        self.assertEqual(len(renamed_dirs), 1)
+        self.assertNotIn('preprocess_results', renamed_dirs[0])
+        self.assertNotIn('version_directory', renamed_dirs[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
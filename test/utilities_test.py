@@ -0,0 +1,212 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utilities import DirFdCache, InodeSet, LRUCache, SUPPORTS_DIR_FD, get_file_hash, hash_files, measure_length, path_exists, rename_path, truncate_to_length
+
+
+@unittest.skipUnless(SUPPORTS_DIR_FD, "dir_fd-relative calls are not supported on this platform")
+class TestDirFdCache(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.sub_dirs = [os.path.join(self.test_dir, f"dir{i}") for i in range(5)]
+        for sub_dir in self.sub_dirs:
+            os.makedirs(sub_dir)
+        self.cache = DirFdCache(max_open=2)
+
+    def tearDown(self):
+        self.cache.close_all()
+        shutil.rmtree(self.test_dir)
+
+    def test_open_handles_are_capped(self):
+        for sub_dir in self.sub_dirs:
+            with self.cache.open(sub_dir):
+                pass
+        self.assertEqual(len(self.cache._fds), 2)
+
+        with self.cache.open(self.sub_dirs[-1]):
+            pass
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_handles_in_use_are_not_evicted(self):
+        with self.cache.open(self.sub_dirs[0]) as dir_fd:
+            for sub_dir in self.sub_dirs[1:]:
+                with self.cache.open(sub_dir):
+                    pass
+            self.assertEqual(os.listdir(dir_fd), [])
+
+    def test_rename_and_exists(self):
+        old_path = os.path.join(self.sub_dirs[0], 'nested')
+        new_path = os.path.join(self.sub_dirs[1], 'moved')
+        os.makedirs(old_path)
+
+        with self.cache.open(old_path):
+            pass
+        rename_path(old_path, new_path, self.cache)
+
+        self.assertFalse(path_exists(old_path, self.cache))
+        self.assertTrue(path_exists(new_path, self.cache))
+        self.assertNotIn(old_path, self.cache._fds)
+
+    def test_paths_deeper_than_path_max(self):
+        # Built relative to open descriptors, since no single path to the bottom fits in PATH_MAX
+        names = [f"{i:02d}" + 'd' * 198 for i in range(25)]
+        dir_fd = os.open(self.test_dir, os.O_RDONLY)
+        for name in names:
+            os.mkdir(name, dir_fd=dir_fd)
+            child_fd = os.open(name, os.O_RDONLY, dir_fd=dir_fd)
+            os.close(dir_fd)
+            dir_fd = child_fd
+        os.mkdir('bottom', dir_fd=dir_fd)
+        os.close(dir_fd)
+
+        deep_path = os.path.join(self.test_dir, *names)
+        self.assertGreater(len(os.fsencode(deep_path)), 4096)
+        with self.cache.open(deep_path) as deep_fd:
+            self.assertEqual(os.listdir(deep_fd), ['bottom'])
+        self.assertLessEqual(len(self.cache._fds), 2)
+
+        # Evicted ancestors are opened again from the nearest one still cached
+        self.assertTrue(path_exists(os.path.join(deep_path, 'bottom'), self.cache))
+        self.assertTrue(path_exists(os.path.join(self.test_dir, names[0], names[1]), self.cache))
+
+    def test_ancestors_used_stay_cached(self):
+        with self.cache.open(self.sub_dirs[0]):
+            pass
+        for name in ['a', 'b']:
+            os.makedirs(os.path.join(self.sub_dirs[0], name))
+            with self.cache.open(os.path.join(self.sub_dirs[0], name)):
+                pass
+        self.assertIn(self.sub_dirs[0], self.cache._fds)
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(maxsize=2)
+        cache.put(('a',), '1')
+        cache.put(('b',), '2')
+        cache.get(('a',))
+        cache.put(('c',), '3')
+
+        self.assertIsNone(cache.get(('b',)))
+        self.assertEqual(cache.get(('a',)), '1')
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.misses, 1)
+
+    def test_save_and_load(self):
+        test_dir = tempfile.mkdtemp()
+        try:
+            cache_file = os.path.join(test_dir, 'cache.json')
+            cache = LRUCache()
+            cache.put(('dir', 'regex', 'pattern', 'Production'), 'Prdctn')
+            cache.save(cache_file)
+
+            loaded_cache = LRUCache()
+            loaded_cache.load(cache_file)
+            self.assertEqual(loaded_cache.get(('dir', 'regex', 'pattern', 'Production')), 'Prdctn')
+
+            # A missing file leaves the cache empty
+            empty_cache = LRUCache()
+            empty_cache.load(os.path.join(test_dir, 'missing.json'))
+            self.assertEqual(len(empty_cache), 0)
+        finally:
+            shutil.rmtree(test_dir)
+
+
+class TestInodeSet(unittest.TestCase):
+    def test_add_and_contains_across_growth(self):
+        inode_set = InodeSet(capacity=4)
+        pairs = [(dev, ino) for dev in (1, 2**63) for ino in range(1000)]
+        self.assertTrue(all(inode_set.add(*pair) for pair in pairs))
+        self.assertFalse(any(inode_set.add(*pair) for pair in pairs))
+        self.assertEqual(len(inode_set), len(pairs))
+        self.assertIn((2**63, 999), inode_set)
+        self.assertNotIn((3, 0), inode_set)
+
+    def test_values_over_64_bits(self):
+        inode_set = InodeSet()
+        self.assertTrue(inode_set.add(5, 2**100))
+        self.assertFalse(inode_set.add(5, 2**100))
+        self.assertIn((5, 2**100), inode_set)
+
+
+class TestFileHash(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.file_paths = []
+        for i in range(3):
+            file_path = os.path.join(self.test_dir, f"file{i}.bin")
+            with open(file_path, 'wb') as f:
+                f.write(bytes([i]) * 100000)
+            self.file_paths.append(file_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_sampled_hash_only_reads_samples(self):
+        full_hash = get_file_hash(self.file_paths[0], 'blake2b')
+        sampled_hash = get_file_hash(self.file_paths[0], 'blake2b', sample_size=1000)
+        self.assertNotEqual(sampled_hash, full_hash)
+
+        # A change outside the samples is not detected, a change in the middle sample is
+        with open(self.file_paths[0], 'r+b') as f:
+            f.seek(10000)
+            f.write(b'x')
+        self.assertEqual(get_file_hash(self.file_paths[0], 'blake2b', sample_size=1000), sampled_hash)
+        with open(self.file_paths[0], 'r+b') as f:
+            f.seek(50000)
+            f.write(b'x')
+        self.assertNotEqual(get_file_hash(self.file_paths[0], 'blake2b', sample_size=1000), sampled_hash)
+
+    def test_hash_files_uses_cache_for_unchanged_files(self):
+        cache = LRUCache()
+        hashes = hash_files(self.file_paths + [os.path.join(self.test_dir, 'missing.bin')], cache, 'blake2b', worker_count=2)
+
+        self.assertEqual(hashes[self.file_paths[1]], get_file_hash(self.file_paths[1], 'blake2b'))
+        self.assertIsNone(hashes[os.path.join(self.test_dir, 'missing.bin')])
+        self.assertEqual(cache.misses, 3)
+
+        # A rename keeps the inode, size and mtime, so the file is not hashed again
+        renamed_path = os.path.join(self.test_dir, 'renamed.bin')
+        os.rename(self.file_paths[0], renamed_path)
+        renamed_hashes = hash_files([renamed_path], cache, 'blake2b')
+        self.assertEqual(renamed_hashes[renamed_path], hashes[self.file_paths[0]])
+        self.assertEqual(cache.hits, 1)
+
+    def test_hash_files_refresh_reads_the_file(self):
+        cache = LRUCache()
+        hashes = hash_files([self.file_paths[0]], cache, 'blake2b')
+
+        # A change that keeps the size and mtime is served from the cache, unless the hash is refreshed
+        file_stat = os.stat(self.file_paths[0])
+        with open(self.file_paths[0], 'r+b') as f:
+            f.write(b'x')
+        os.utime(self.file_paths[0], ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+        self.assertEqual(hash_files([self.file_paths[0]], cache, 'blake2b'), hashes)
+        refreshed_hashes = hash_files([self.file_paths[0]], cache, 'blake2b', refresh=True)
+        self.assertNotEqual(refreshed_hashes, hashes)
+        self.assertEqual(hash_files([self.file_paths[0]], cache, 'blake2b'), refreshed_hashes)
+
+
+class TestLengthUnits(unittest.TestCase):
+    def test_measure_length(self):
+        name = 'report_\u5831\u544a_\U0001F600.txt'
+        self.assertEqual(measure_length(name, 'chars'), 15)
+        self.assertEqual(measure_length(name, 'utf8'), 7 + 6 + 1 + 4 + 4)
+        self.assertEqual(measure_length(name, 'utf16'), 7 + 2 + 1 + 2 + 4)
+        self.assertEqual(measure_length('plain_ascii', 'utf8'), 11)
+
+    def test_truncate_never_splits_a_character(self):
+        name = 'ab\u5831\u544a\U0001F600'
+        self.assertEqual(truncate_to_length(name, 4, 'chars'), 'ab\u5831\u544a')
+        self.assertEqual(truncate_to_length(name, 6, 'utf8'), 'ab\u5831')
+        self.assertEqual(truncate_to_length(name, 5, 'utf16'), 'ab\u5831\u544a')
+        self.assertEqual(truncate_to_length(name, 6, 'utf16'), name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import long_filepath_filename_shortener as shortener
+from long_filepath_filename_shortener import process_watch
+from utilities import LRUCache
+from watcher import InotifyWatcher, PollingWatcher
+
+
+def inotify_available():
+    if not sys.platform.startswith('linux'):
+        return False
+    test_dir = tempfile.mkdtemp()
+    try:
+        InotifyWatcher(test_dir).close()
+        return True
+    except (OSError, AttributeError):
+        return False
+    finally:
+        shutil.rmtree(test_dir)
+
+
+class WatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.base_dir = os.path.join(self.test_dir, 'base')
+        os.makedirs(os.path.join(self.base_dir, 'existing'))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def create_new_paths(self):
+        with open(os.path.join(self.base_dir, 'existing', 'new_file.txt'), 'w') as f:
+            f.write("test content")
+        os.makedirs(os.path.join(self.base_dir, 'new_folder', 'nested'))
+        with open(os.path.join(self.base_dir, 'new_folder', 'nested', 'nested_file.txt'), 'w') as f:
+            f.write("test content")
+
+    def assert_new_paths_reported(self, watcher):
+        self.create_new_paths()
+        files = set()
+        for _ in range(3):
+            files.update(path for path, is_dir in watcher.read_events(0.5) if not is_dir)
+        watcher.close()
+        self.assertEqual(files, {
+            os.path.join(self.base_dir, 'existing', 'new_file.txt'),
+            os.path.join(self.base_dir, 'new_folder', 'nested', 'nested_file.txt'),
+        })
+
+
+class TestPollingWatcher(WatcherTestCase):
+    def test_new_paths_are_reported(self):
+        self.assert_new_paths_reported(PollingWatcher(self.base_dir, poll_seconds=0))
+
+
+@unittest.skipUnless(inotify_available(), "inotify is not available")
+class TestInotifyWatcher(WatcherTestCase):
+    def test_new_paths_are_reported(self):
+        self.assert_new_paths_reported(InotifyWatcher(self.base_dir))
+
+
+class TestProcessWatch(WatcherTestCase):
+    def test_new_long_filename_is_shortened(self):
+        output_dir = os.path.join(self.test_dir, 'output')
+        for scan_dir in ['dir_scan', 'filename_scan']:
+            os.makedirs(os.path.join(output_dir, scan_dir))
+        config_values = {
+            'base_dir': self.base_dir,
+            'output_dir': output_dir,
+            'dir_scan_dir': 'dir_scan',
+            'filename_scan_dir': 'filename_scan',
+            'long_dir_path_scan_output': 'long_dir_path_scan_output',
+            'long_filename_scan_output': 'long_filename_scan_output',
+            'long_filename_modified_output': 'long_filename_modified_output',
+            'long_filename_modified_error': 'long_filename_modified_error',
+            'date_str': '20220101',
+            'filename_length_threshold': 20,
+            'dir_length_threshold': len(self.base_dir) + 50,
+            'number_of_retry': 5,
+            'naming_mode': 'counter',
+            'shortening_strategies': '',
+            'conversion_cache_file': '',
+            'watch_debounce_seconds': 0.5,
+            'watch_batch_size': 100,
+            'dry_run': False,
+            'regular_expression': True,
+            'filename_regex': '(?<!^)[aeiou](?!([A-Z]|$))',
+        }
+
+        with patch.dict(shortener.CONFIG_VALUES, config_values), patch.object(shortener, 'CONVERSION_CACHE', LRUCache()):
+            watcher = PollingWatcher(self.base_dir, poll_seconds=0)
+            with open(os.path.join(self.base_dir, 'existing', 'quarterly_production_report.txt'), 'w') as f:
+                f.write("test content")
+            process_watch(watcher, max_batches=1)
+
+        self.assertEqual(os.listdir(os.path.join(self.base_dir, 'existing')), ['qrtrly-prdctn-rprt.txt'])
+        with open(os.path.join(output_dir, 'filename_scan', 'long_filename_scan_output_20220101_watch.txt')) as f:
+            self.assertEqual(f.read().strip(), os.path.join(self.base_dir, 'existing', 'quarterly_production_report.txt'))
+
+
+if __name__ == '__main__':
+    unittest.main()
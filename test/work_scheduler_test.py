@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from work_scheduler import WorkStealingScheduler
+
+
+class TestWorkStealingScheduler(unittest.TestCase):
+    def test_all_spawned_tasks_are_run(self):
+        # A skewed tree: one root with a deep, wide subtree and a few empty siblings
+        def handler(task):
+            depth, index = task
+            if depth == 0 and index == 0:
+                return [(1, i) for i in range(20)]
+            if depth == 1:
+                return [(2, index * 10 + i) for i in range(5)]
+            return []
+
+        stats = WorkStealingScheduler(4, handler).run([(0, i) for i in range(3)])
+
+        self.assertEqual(stats['tasks'], 3 + 20 + 20 * 5)
+        self.assertEqual(sum(stats['worker_tasks']), stats['tasks'])
+        self.assertEqual(stats['failed_tasks'], 0)
+
+    def test_idle_workers_steal_from_busy_ones(self):
+        def handler(task):
+            if task == 'root':
+                return [f"child{i}" for i in range(8)]
+            time.sleep(0.02)
+            return []
+
+        stats = WorkStealingScheduler(4, handler).run(['root'])
+
+        self.assertEqual(stats['tasks'], 9)
+        self.assertGreater(stats['steals'], 0)
+        self.assertLess(stats['wall_time'], stats['task_time'])
+
+    def test_failed_tasks_are_counted(self):
+        def handler(task):
+            raise OSError("listing failed")
+
+        stats = WorkStealingScheduler(2, handler).run(['a', 'b'])
+
+        self.assertEqual(stats['failed_tasks'], 2)
+        self.assertEqual(len(stats['slowest_tasks']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
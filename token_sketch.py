@@ -0,0 +1,61 @@
+import array
+import hashlib
+import heapq
+
+
+class CountMinSketch:
+    """
+    Approximate counts of an unbounded number of keys in `width` x `depth` counters.
+
+    Estimates never undercount. With conservative updates, only the counters at the current minimum are raised,
+    which keeps the overcount from hash collisions low. Memory is fixed at 4 bytes per counter.
+    """
+
+    def __init__(self, width=262144, depth=4):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self._rows = [array.array('I', bytes(4 * width)) for _ in range(depth)]
+
+    def _slots(self, key):
+        digest = int.from_bytes(hashlib.blake2b(key.encode('utf-8', 'surrogateescape'), digest_size=8).digest(), 'little')
+        first, second = digest & 0xFFFFFFFF, digest >> 32 | 1
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        """ Adds to a key's count and returns its new estimate. """
+        slots = self._slots(key)
+        estimate = min(row[slot] for row, slot in zip(self._rows, slots)) + count
+        for row, slot in zip(self._rows, slots):
+            if row[slot] < estimate:
+                row[slot] = min(estimate, 0xFFFFFFFF)
+        self.total += count
+        return estimate
+
+    def estimate(self, key):
+        return min(row[slot] for row, slot in zip(self._rows, self._slots(key)))
+
+
+class HeavyHitters:
+    """
+    Keeps the `capacity` keys with the highest scores seen so far, in memory bounded by twice the capacity.
+
+    Scores are updated as keys come in. Once twice the capacity is tracked, only the top `capacity` are kept.
+    Paired with a `CountMinSketch`, a key dropped early comes back with its full estimated count when it is seen again.
+    """
+
+    def __init__(self, capacity=5000):
+        self.capacity = capacity
+        self._scores = {}
+
+    def __len__(self):
+        return len(self._scores)
+
+    def update(self, key, score):
+        self._scores[key] = score
+        if len(self._scores) > 2 * self.capacity:
+            self._scores = dict(heapq.nlargest(self.capacity, self._scores.items(), key=lambda item: item[1]))
+
+    def top(self, count=None):
+        """ Returns (key, score) pairs, highest score first. """
+        return heapq.nlargest(count or self.capacity, self._scores.items(), key=lambda item: item[1])
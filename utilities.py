@@ -1,7 +1,14 @@
+import array
+import collections
+import contextlib
 import hashlib
 import logging
 import os
 import csv
+import json
+import threading
+
+from work_scheduler import WorkStealingScheduler
 
 def check_file_hash_and_attributes(file_path, new_file_path):
     """Check the hash value and file attributes of the original and copied files."""
@@ -35,6 +42,332 @@ def check_long_path_support(base_dir):
         print("System does not support long paths (> 256 characters).")
         return False
 
+# Flags used to open a directory handle for dir_fd-relative traversal
+DIR_OPEN_FLAGS = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) | getattr(os, 'O_CLOEXEC', 0)
+
+# os.scandir() accepts a directory file descriptor on POSIX from Python 3.7 onwards
+SUPPORTS_DIR_FD = os.name == 'posix' and os.scandir in os.supports_fd and os.open in os.supports_dir_fd
+
+def to_long_path(path, os_name=os.name):
+    r"""Normalize an absolute path to the long path form of the platform.
+
+    On Windows the path gets the extended-length prefix (\\?\ or \\?\UNC\ for shares) so the 260 characters limit does not apply.
+    POSIX has no such prefix. There the path is returned as bytes from os.fsencode(), which tells the caller to traverse the tree
+    relative to directory file descriptors (see DirFdCache) where the platform supports it; the scan keeps the str path.
+    """
+    if os_name == 'nt':
+        if path.startswith('\\\\?\\'):
+            return path
+        if path.startswith('\\\\'):
+            return '\\\\?\\UNC\\' + path[2:]
+        if path.startswith('\\'):
+            return path
+        return '\\\\?\\' + path
+    return os.fsencode(path)
+
+class DirFdCache:
+    """LRU cache of open directory file descriptors, keyed by directory path.
+
+    A directory is opened relative to its nearest cached ancestor, one path component per call, so no path passed to the
+    kernel is ever longer than a folder name and the depth of the tree is not limited by PATH_MAX. Only the root (or the
+    first component of a relative path) is opened by name, when no ancestor is cached. Each ancestor used is moved to the
+    most recently used end, so the folders near the top of a walk stay open longest.
+    At most `max_open` descriptors are kept open. Descriptors in use (inside `open()`) are never closed by eviction.
+    """
+
+    def __init__(self, max_open=64):
+        self.max_open = max(1, max_open)
+        self.hits = 0
+        self.misses = 0
+        self._fds = collections.OrderedDict()
+        self._in_use = collections.Counter()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def open(self, dir_path):
+        """Yield an open descriptor for `dir_path`, kept alive until the block exits."""
+        fd = self._acquire(dir_path)
+        try:
+            yield fd
+        finally:
+            with self._lock:
+                self._release_locked(dir_path)
+
+    def _acquire(self, dir_path):
+        with self._lock:
+            fd = self._fds.get(dir_path)
+            if fd is not None:
+                self.hits += 1
+                self._fds.move_to_end(dir_path)
+                self._in_use[dir_path] += 1
+                return fd
+            self.misses += 1
+
+            # The directories to open, deepest first, up to the nearest cached ancestor
+            missing_paths = [dir_path]
+            ancestor_path = None
+            while True:
+                parent_path = os.path.dirname(missing_paths[-1])
+                if not parent_path or parent_path == missing_paths[-1]:
+                    break
+                if parent_path in self._fds:
+                    ancestor_path = parent_path
+                    self._fds.move_to_end(ancestor_path)
+                    self._in_use[ancestor_path] += 1
+                    break
+                missing_paths.append(parent_path)
+            parent_fd = self._fds[ancestor_path] if ancestor_path is not None else None
+
+        parent_path = ancestor_path
+        try:
+            for path in reversed(missing_paths):
+                if parent_fd is None:
+                    fd = os.open(path, DIR_OPEN_FLAGS)
+                else:
+                    fd = os.open(os.path.basename(path), DIR_OPEN_FLAGS, dir_fd=parent_fd)
+                fd = self._store(path, fd)
+                if parent_path is not None:
+                    with self._lock:
+                        self._release_locked(parent_path)
+                parent_fd, parent_path = fd, path
+        except BaseException:
+            if parent_path is not None:
+                with self._lock:
+                    self._release_locked(parent_path)
+            raise
+        return fd
+
+    def _store(self, dir_path, fd):
+        """Cache a newly opened descriptor, marked in use. Returns the cached descriptor of `dir_path`."""
+        with self._lock:
+            existing_fd = self._fds.get(dir_path)
+            if existing_fd is not None:
+                # Another thread opened the same directory in the meantime
+                os.close(fd)
+                fd = existing_fd
+                self._fds.move_to_end(dir_path)
+            else:
+                self._fds[dir_path] = fd
+            self._in_use[dir_path] += 1
+            self._evict_locked()
+        return fd
+
+    def _release_locked(self, dir_path):
+        self._in_use[dir_path] -= 1
+        if self._in_use[dir_path] <= 0:
+            del self._in_use[dir_path]
+        self._evict_locked()
+
+    def _evict_locked(self):
+        if len(self._fds) <= self.max_open:
+            return
+        for dir_path in list(self._fds):
+            if len(self._fds) <= self.max_open:
+                break
+            if dir_path not in self._in_use:
+                os.close(self._fds.pop(dir_path))
+
+    def invalidate(self, dir_path):
+        """Close the cached descriptors of `dir_path` and everything below it, e.g. after it was renamed."""
+        prefix = os.path.join(dir_path, dir_path[:0])
+        with self._lock:
+            for cached_path in list(self._fds):
+                if (cached_path == dir_path or cached_path.startswith(prefix)) and cached_path not in self._in_use:
+                    os.close(self._fds.pop(cached_path))
+
+    def close_all(self):
+        """Close every cached descriptor that is not in use."""
+        with self._lock:
+            for cached_path in list(self._fds):
+                if cached_path not in self._in_use:
+                    os.close(self._fds.pop(cached_path))
+
+class LRUCache:
+    """Thread-safe bounded least-recently-used cache with hit-rate counters.
+
+    Keys are tuples of strings, so the cache can be saved to and loaded from a JSON file between runs.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = max(1, maxsize)
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for `key`, or None."""
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def load(self, file_path):
+        """Load the entries saved by `save`, least recently used first. A missing or unreadable file leaves the cache empty."""
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.info(f"No cache loaded from {file_path}: {e}")
+            return
+        for key, value in items:
+            self.put(tuple(key), value)
+
+    def save(self, file_path):
+        """Save the entries to a JSON file, replacing it atomically."""
+        with self._lock:
+            items = [[list(key), value] for key, value in self._items.items()]
+        temp_file_path = f"{file_path}.tmp"
+        with open(temp_file_path, 'w', encoding='utf-8') as f:
+            json.dump(items, f)
+        os.replace(temp_file_path, file_path)
+
+LENGTH_UNITS = ('chars', 'utf8', 'utf16')
+
+class InodeSet:
+    """Thread-safe set of (st_dev, st_ino) pairs, kept in flat integer arrays with open addressing.
+
+    Each slot takes 17 bytes and the table is kept at most two thirds full, so an entry costs some 25 bytes
+    instead of the 150 or so of a tuple in a Python set. Values over 64 bits (e.g. ReFS file ids) go to a plain set.
+    """
+
+    _MAX_VALUE = (1 << 64) - 1
+
+    def __init__(self, capacity=1024):
+        self._size = 1 << max(4, (capacity * 3 // 2).bit_length())
+        self._devs = array.array('Q', bytes(8 * self._size))
+        self._inos = array.array('Q', bytes(8 * self._size))
+        self._used = bytearray(self._size)
+        self._count = 0
+        self._large = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count + len(self._large)
+
+    def __contains__(self, key):
+        dev, ino = key
+        with self._lock:
+            if dev > self._MAX_VALUE or ino > self._MAX_VALUE:
+                return key in self._large
+            return self._find(dev, ino)[1]
+
+    def add(self, dev, ino):
+        """Add a pair. Returns False if it was already in the set."""
+        with self._lock:
+            if dev > self._MAX_VALUE or ino > self._MAX_VALUE:
+                if (dev, ino) in self._large:
+                    return False
+                self._large.add((dev, ino))
+                return True
+            slot, found = self._find(dev, ino)
+            if found:
+                return False
+            self._store(slot, dev, ino)
+            if self._count * 3 > self._size * 2:
+                self._grow()
+            return True
+
+    def _find(self, dev, ino):
+        mask = self._size - 1
+        slot = ((dev * 0x9E3779B97F4A7C15) ^ (ino * 0xBF58476D1CE4E5B9)) >> 7 & mask
+        while self._used[slot]:
+            if self._inos[slot] == ino and self._devs[slot] == dev:
+                return slot, True
+            slot = (slot + 1) & mask
+        return slot, False
+
+    def _store(self, slot, dev, ino):
+        self._devs[slot] = dev
+        self._inos[slot] = ino
+        self._used[slot] = 1
+        self._count += 1
+
+    def _grow(self):
+        pairs = [(self._devs[slot], self._inos[slot]) for slot in range(self._size) if self._used[slot]]
+        self._size *= 2
+        self._devs = array.array('Q', bytes(8 * self._size))
+        self._inos = array.array('Q', bytes(8 * self._size))
+        self._used = bytearray(self._size)
+        self._count = 0
+        for dev, ino in pairs:
+            self._store(self._find(dev, ino)[0], dev, ino)
+
+# Reparse tag of Windows junctions (mount points), which DirEntry.is_symlink() does not report before Python 3.12
+IO_REPARSE_TAG_MOUNT_POINT = 0xA0000003
+
+def is_link_entry(entry):
+    """Check if a DirEntry is a symlink or a Windows junction."""
+    if entry.is_symlink():
+        return True
+    if os.name == 'nt':
+        return getattr(entry.stat(follow_symlinks=False), 'st_reparse_tag', 0) == IO_REPARSE_TAG_MOUNT_POINT
+    return False
+
+def measure_length(text, unit='chars'):
+    """Return the length of a name or path in `unit`: code points ('chars'), UTF-8 bytes ('utf8') or UTF-16 code units ('utf16').
+
+    ASCII text has the same length in every unit, so it is never encoded.
+    """
+    if unit == 'chars' or text.isascii():
+        return len(text)
+    if unit == 'utf8':
+        return len(text.encode('utf-8', 'surrogateescape'))
+    return len(text.encode('utf-16-le', 'surrogatepass')) // 2
+
+def truncate_to_length(text, max_length, unit='chars'):
+    """Cut `text` to at most `max_length` in `unit`, without splitting a character."""
+    if unit == 'chars' or text.isascii():
+        return text[:max_length]
+    if unit == 'utf8':
+        return text.encode('utf-8', 'surrogateescape')[:max_length].decode('utf-8', 'ignore')
+    return text.encode('utf-16-le', 'surrogatepass')[:max_length * 2].decode('utf-16-le', 'ignore')
+
+def rename_path(old_path, new_path, fd_cache=None):
+    """Rename a file or directory, relative to the cached descriptors of the parent directories when a cache is given."""
+    if fd_cache is None:
+        os.rename(old_path, new_path)
+        return
+    with fd_cache.open(os.path.dirname(old_path)) as src_dir_fd, fd_cache.open(os.path.dirname(new_path)) as dst_dir_fd:
+        os.rename(os.path.basename(old_path), os.path.basename(new_path), src_dir_fd=src_dir_fd, dst_dir_fd=dst_dir_fd)
+    fd_cache.invalidate(old_path)
+
+def path_exists(path, fd_cache=None):
+    """Check if a path exists, with a single stat relative to the cached parent descriptor when a cache is given."""
+    if fd_cache is None:
+        return os.path.exists(path)
+    try:
+        with fd_cache.open(os.path.dirname(path)) as dir_fd:
+            os.stat(os.path.basename(path), dir_fd=dir_fd)
+        return True
+    except OSError:
+        return False
+
+def lstat_path(path, fd_cache=None):
+    """Return the lstat result of a path, taken relative to the cached parent descriptor when a cache is given."""
+    if fd_cache is None:
+        return os.lstat(path)
+    with fd_cache.open(os.path.dirname(path)) as dir_fd:
+        return os.stat(os.path.basename(path), dir_fd=dir_fd, follow_symlinks=False)
+
 def print_filepath_and_filename_length(file_path):
     """Print the file path and filename length."""
     file_path_length = len(file_path)
@@ -61,21 +394,71 @@ def read_filepaths_from_txt(txt_file):
             file_path = line.strip()
             print_filepath_and_filename_length(file_path)
 
-def get_file_hash(file_path):
-    """Compute the SHA256 hash of a file."""
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def get_file_hash(file_path, algorithm='sha256', sample_size=0):
+    """Compute the hash of a file with `algorithm` (any hashlib name, e.g. sha256 or blake2b).
+
+    With a `sample_size`, files larger than three samples are hashed from their first, middle and last
+    `sample_size` bytes plus their size instead of in full.
+    """
     
     logging.info(f"Computing hash for file: {file_path}")
 
-    with open(file_path, "rb") as f:
-        file_hash = hashlib.sha256()
-        chunk = f.read(8192)
-        while chunk:
-            file_hash.update(chunk)
-            chunk = f.read(8192)
+    file_hash = hashlib.new(algorithm)
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if sample_size and file_size > 3 * sample_size:
+            file_hash.update(str(file_size).encode())
+            ranges = [(0, sample_size), ((file_size - sample_size) // 2, sample_size), (file_size - sample_size, sample_size)]
+        else:
+            ranges = [(0, file_size)]
+
+        for offset, length in ranges:
+            f.seek(offset)
+            while length > 0:
+                read_size = f.readinto(view[:min(length, HASH_CHUNK_SIZE)])
+                if not read_size:
+                    break
+                file_hash.update(view[:read_size])
+                length -= read_size
     return file_hash.hexdigest()
 
+def get_cached_file_hash(file_path, cache, algorithm='sha256', sample_size=0, refresh=False):
+    """Return the hash of a file from `cache` (an LRUCache), computing it only if the file's inode, size or mtime changed.
+
+    With `refresh`, the file is always hashed and the cached hash replaced, e.g. to check a file after its rename,
+    which keeps its inode, size and mtime.
+    """
+    file_stat = os.stat(file_path)
+    key = (str(file_stat.st_dev), str(file_stat.st_ino), str(file_stat.st_size), str(file_stat.st_mtime_ns), algorithm, str(sample_size))
+    file_hash = None if refresh else cache.get(key)
+    if file_hash is None:
+        file_hash = get_file_hash(file_path, algorithm, sample_size)
+        cache.put(key, file_hash)
+    return file_hash
+
+def hash_files(file_paths, cache, algorithm='sha256', sample_size=0, worker_count=1, refresh=False):
+    """Hash files on `worker_count` threads. Returns {file path: hash}, with None for files that could not be read."""
+    hashes = {}
+
+    def hash_file(file_path):
+        try:
+            hashes[file_path] = get_cached_file_hash(file_path, cache, algorithm, sample_size, refresh)
+        except OSError as e:
+            logging.error(f"Error hashing file {file_path}: {e}")
+            hashes[file_path] = None
+
+    WorkStealingScheduler(worker_count, hash_file).run(file_paths)
+    return hashes
+
+# Serializes appends from concurrent workers to the same output file
+_write_lock = threading.Lock()
+
 def write_to_csv(file_path, row):
-    with open(file_path, 'a', encoding='utf-8' , newline='') as file:
+    with _write_lock, open(file_path, 'a', encoding='utf-8' , newline='') as file:
         writer = csv.writer(file)
         writer.writerow(row)
 
@@ -0,0 +1,183 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CREATE | IN_MOVED_TO | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def walk_tree(dir_path):
+    """ Yields (path, is_dir) for everything below a folder, and lists each folder once. """
+    pending = [dir_path]
+    while pending:
+        current_dir = pending.pop()
+        try:
+            with os.scandir(current_dir) as it:
+                entries = [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in it]
+        except OSError as e:
+            logging.error(f"Watch: Failed to list folder: {current_dir} | {e}")
+            continue
+        for name, is_dir in entries:
+            path = current_dir + os.sep + name
+            yield path, is_dir
+            if is_dir:
+                pending.append(path)
+
+
+class InotifyWatcher:
+    """
+    Reports the files and folders created in or moved into a tree, using Linux inotify through ctypes.
+
+    Every folder gets a watch. When a folder appears, it is watched and walked, so the files it brings along
+    (or that were created before its watch was in place) are reported as well. Adding a watch to a folder that
+    already has one returns the same watch, which keeps the paths of renamed folders up to date.
+    """
+
+    def __init__(self, base_dir):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self._paths = {}
+        self.base_dir = base_dir
+        self.watch(base_dir)
+        for path, is_dir in walk_tree(base_dir):
+            if is_dir:
+                self.watch(path)
+        logging.info(f"Watch: inotify watches on {len(self._paths)} folders")
+
+    def watch(self, dir_path):
+        wd = self._add_watch(self._fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            logging.error(f"Watch: Failed to watch folder: {dir_path} | {os.strerror(ctypes.get_errno())}")
+            return
+        self._paths[wd] = dir_path
+
+    def read_events(self, timeout):
+        """ Waits up to `timeout` seconds and returns the (path, is_dir) pairs created or moved in since the last call. """
+        events = []
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return events
+
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + name_length].rstrip(b'\0'))
+                offset += name_length
+
+                if mask & IN_Q_OVERFLOW:
+                    logging.error("Watch: inotify queue overflowed, some new paths were missed until the next scan")
+                elif mask & IN_IGNORED:
+                    self._paths.pop(wd, None)
+                elif wd in self._paths and name:
+                    path = self._paths[wd] + os.sep + name
+                    is_dir = bool(mask & IN_ISDIR)
+                    events.append((path, is_dir))
+                    if is_dir:
+                        self.watch(path)
+                        for sub_path, sub_is_dir in walk_tree(path):
+                            if sub_is_dir:
+                                self.watch(sub_path)
+                            events.append((sub_path, sub_is_dir))
+        return events
+
+    def close(self):
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    """
+    Reports new files and folders by polling, for platforms without inotify.
+
+    The watcher keeps a scan cache of every folder's mtime and entry names. Each poll costs one stat per folder,
+    and only the folders whose mtime changed are listed again and compared with the cache.
+    """
+
+    def __init__(self, base_dir, poll_seconds=30):
+        self.base_dir = base_dir
+        self.poll_seconds = poll_seconds
+        self._next_poll = time.monotonic() + poll_seconds
+        self._folders = {}
+        self._snapshot(base_dir)
+        for path, is_dir in walk_tree(base_dir):
+            if is_dir:
+                self._snapshot(path)
+        logging.info(f"Watch: polling {len(self._folders)} folders every {poll_seconds}s")
+
+    def _snapshot(self, dir_path):
+        """ Caches and returns a folder's mtime and (name, is_dir) entries, or None if it is gone. """
+        try:
+            mtime = os.stat(dir_path).st_mtime_ns
+            with os.scandir(dir_path) as it:
+                entries = {(entry.name, entry.is_dir(follow_symlinks=False)) for entry in it}
+        except OSError:
+            self._folders.pop(dir_path, None)
+            return None
+        self._folders[dir_path] = (mtime, entries)
+        return entries
+
+    def read_events(self, timeout):
+        """ Waits up to `timeout` seconds and returns the (path, is_dir) pairs that appeared since the last poll. """
+        wait = self._next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        self._next_poll = time.monotonic() + self.poll_seconds
+
+        events = []
+        for dir_path, (mtime, entries) in list(self._folders.items()):
+            try:
+                if os.stat(dir_path).st_mtime_ns == mtime:
+                    continue
+            except OSError:
+                self._folders.pop(dir_path, None)
+                continue
+
+            new_entries = self._snapshot(dir_path) or set()
+            for name, is_dir in new_entries - entries:
+                path = dir_path + os.sep + name
+                events.append((path, is_dir))
+                if is_dir:
+                    self._snapshot(path)
+                    for sub_path, sub_is_dir in walk_tree(path):
+                        if sub_is_dir:
+                            self._snapshot(sub_path)
+                        events.append((sub_path, sub_is_dir))
+        return events
+
+    def close(self):
+        self._folders.clear()
+
+
+def create_watcher(base_dir, poll_seconds=30, use_inotify=True):
+    """ Returns an inotify watcher on Linux, or a polling watcher elsewhere or if inotify is unavailable. """
+    if use_inotify and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(base_dir)
+        except (OSError, AttributeError) as e:
+            logging.error(f"Watch: inotify is unavailable, falling back to polling: {e}")
+    return PollingWatcher(base_dir, poll_seconds)
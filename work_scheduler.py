@@ -0,0 +1,126 @@
+import collections
+import contextvars
+import heapq
+import logging
+import threading
+import time
+
+
+class WorkStealingScheduler:
+    """
+    Runs tasks on a pool of threads with one task deque per worker.
+
+    A task handler may return new tasks (e.g. the sub-folders of a listed directory). They are pushed on the worker's
+    own deque and popped from the same end, so each worker goes depth first through its part of the tree.
+    A worker that runs out of tasks steals from the other end of another worker's deque, where the oldest and usually
+    largest pending subtrees are. One huge folder therefore keeps every worker busy instead of a single one.
+
+    Workers run in a copy of the caller's context, so context variables (e.g. per-root config overrides) carry over.
+    """
+
+    def __init__(self, worker_count, handler, slowest_task_count=5):
+        self.worker_count = max(1, worker_count)
+        self.handler = handler
+        self.slowest_task_count = slowest_task_count
+        self._deques = [collections.deque() for _ in range(self.worker_count)]
+        self._pending = 0
+        self._condition = threading.Condition()
+        self.stats = {
+            'tasks': 0,
+            'steals': 0,
+            'failed_tasks': 0,
+            'task_time': 0.0,
+            'wall_time': 0.0,
+            'worker_busy_time': [0.0] * self.worker_count,
+            'worker_tasks': [0] * self.worker_count,
+            'slowest_tasks': [],
+        }
+
+    def run(self, tasks):
+        """ Runs the tasks and every task they spawn, then returns the timing statistics. """
+        tasks = list(tasks)
+        for index, task in enumerate(tasks):
+            self._deques[index % self.worker_count].append(task)
+        self._pending = len(tasks)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(self._work, index), daemon=True) for index in range(self.worker_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.stats['wall_time'] = time.perf_counter() - start
+
+        self.stats['slowest_tasks'] = sorted(self.stats['slowest_tasks'], key=lambda item: item[0], reverse=True)
+        return self.stats
+
+    def _next_task(self, worker_index):
+        """ Pops a task from the worker's own deque, or steals the oldest task of another worker. """
+        try:
+            return self._deques[worker_index].pop(), False
+        except IndexError:
+            pass
+
+        for offset in range(1, self.worker_count):
+            try:
+                return self._deques[(worker_index + offset) % self.worker_count].popleft(), True
+            except IndexError:
+                continue
+        return None, False
+
+    def _work(self, worker_index):
+        own_deque = self._deques[worker_index]
+
+        while True:
+            task, stolen = self._next_task(worker_index)
+            if task is None:
+                with self._condition:
+                    if self._pending == 0:
+                        self._condition.notify_all()
+                        return
+                    # Another worker is still running a task that may spawn more
+                    self._condition.wait(0.05)
+                continue
+
+            start = time.perf_counter()
+            failed = False
+            try:
+                new_tasks = list(self.handler(task) or [])
+            except Exception as e:
+                logging.error(f"Task failed: {task} | {e}")
+                new_tasks = []
+                failed = True
+            elapsed = time.perf_counter() - start
+
+            own_deque.extend(new_tasks)
+
+            with self._condition:
+                self._pending += len(new_tasks) - 1
+                self.stats['tasks'] += 1
+                self.stats['steals'] += stolen
+                self.stats['failed_tasks'] += failed
+                self.stats['task_time'] += elapsed
+                self.stats['worker_busy_time'][worker_index] += elapsed
+                self.stats['worker_tasks'][worker_index] += 1
+                if len(self.stats['slowest_tasks']) < self.slowest_task_count:
+                    heapq.heappush(self.stats['slowest_tasks'], (elapsed, str(task)))
+                elif elapsed > self.stats['slowest_tasks'][0][0]:
+                    heapq.heapreplace(self.stats['slowest_tasks'], (elapsed, str(task)))
+
+                if self._pending == 0:
+                    self._condition.notify_all()
+                elif new_tasks:
+                    self._condition.notify(len(new_tasks))
+
+
+def log_scheduler_stats(label, stats):
+    """ Logs and prints the timing statistics returned by `WorkStealingScheduler.run`. """
+    busy_times = stats['worker_busy_time']
+    summary = (f"{label} | Tasks: {stats['tasks']} | Failed: {stats['failed_tasks']} | Steals: {stats['steals']} | "
+               f"Wall time: {stats['wall_time']:.2f}s | Task time: {stats['task_time']:.2f}s | "
+               f"Worker busy time: min {min(busy_times):.2f}s / max {max(busy_times):.2f}s")
+    logging.info(summary)
+    print(summary)
+
+    for elapsed, task in stats['slowest_tasks']:
+        logging.info(f"{label} | Slow task: {task} | Time: {elapsed:.3f}s")